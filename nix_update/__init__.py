@@ -4,16 +4,23 @@ import argparse
 import os
 import shlex
 import shutil
+import subprocess
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
 from typing import NoReturn
 
-from . import utils
+from . import attribute_index, evaluator, scheduler, utils
+from .errors import UpdateError
 from .eval import CargoLockInSource, Package, eval_attr
 from .options import Options
-from .update import update
+from .outdated import check_outdated, scan_outdated
+from .scheduler import Stage
+from .update import load_package, update
 from .utils import info, nix_command, run
+from .version.github import prefetch_github_versions
 from .version.version import VersionPreference
 
 
@@ -22,7 +29,14 @@ def die(msg: str) -> NoReturn:
     sys.exit(1)
 
 
-def parse_args(args: list[str]) -> Options:
+def read_attributes_file(path: str) -> list[str]:
+    """Read attribute names, one per line, ignoring blank lines and comments."""
+    text = sys.stdin.read() if path == "-" else Path(path).read_text()
+    lines = (line.strip() for line in text.splitlines())
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def parse_args(args: list[str]) -> Options:  # noqa: PLR0915
     parser = argparse.ArgumentParser()
     help_msg = "File to import rather than default.nix. Examples, ./release.nix"
     parser.add_argument("-f", "--file", default="./.", help=help_msg)
@@ -115,13 +129,43 @@ def parse_args(args: list[str]) -> Options:
         help="The system used to calculate the hash and run other nix commands",
         default=None,
     )
+    parser.add_argument(
+        "--src-system",
+        help="Also update the source hash of the package on this system, e.g. for binary packages with one source per system (can be given multiple times)",
+        action="append",
+        metavar="SYSTEM",
+        default=[],
+    )
 
     default_attribute = os.getenv("UPDATE_NIX_ATTR_PATH")
     parser.add_argument(
         "attribute",
-        default=default_attribute,
-        nargs="?" if default_attribute else None,  # type: ignore[arg-type]
-        help="""Attribute name within the file evaluated (defaults to environment variable "UPDATE_NIX_ATTR_PATH")""",
+        default=[default_attribute] if default_attribute else [],
+        nargs="*",
+        help="""Attribute name within the file evaluated (defaults to environment variable "UPDATE_NIX_ATTR_PATH"). Multiple attributes are updated in one batch run""",
+    )
+    parser.add_argument(
+        "--attributes-file",
+        metavar="FILE",
+        help="File with one attribute per line to update in one batch run ('-' reads from stdin)",
+    )
+    parser.add_argument(
+        "--fetch-jobs",
+        type=int,
+        default=8,
+        help="Maximum number of concurrent version lookups in a batch run (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--prefetch-jobs",
+        type=int,
+        default=2,
+        help="Maximum number of concurrent hash prefetch builds in a batch run (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--lockfile-jobs",
+        type=int,
+        default=1,
+        help="Maximum number of concurrent lockfile builds in a batch run (default: %(default)s)",
     )
     parser.add_argument(
         "--generate-lockfile",
@@ -145,6 +189,52 @@ def parse_args(args: list[str]) -> Options:
         help="Only update the source, not dependencies such as npmDeps, cargoDeps or nugetDeps",
         action="store_true",
     )
+    parser.add_argument(
+        "--skip-unchanged-lockfiles",
+        help="Keep dependency hashes such as cargoHash or npmDepsHash if the lockfile in the source did not change",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fast-src-prefetch",
+        help="Download plain fetchurl/fetchzip sources with `nix store prefetch-file` instead of building src to get its hash",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--eval-server",
+        help="Evaluate the package set only once by keeping a `nix repl` running for the whole run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--check-outdated",
+        help="Only look up the latest versions and print one JSON line per package, without changing any files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--scan",
+        help="Check all packages of the given package sets, or of the top-level set without attributes, like --check-outdated",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--scan-shard",
+        help="Check the packages in pkgs/by-name/SHARD, like --check-outdated (implies --scan)",
+        metavar="SHARD",
+    )
+    parser.add_argument(
+        "--scan-jobs",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent evaluations with --scan (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--attribute-index",
+        help="Remember the source of each package between runs and only evaluate packages whose file changed or that have a new version",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--flake-eval-cache",
+        help="With --flake, evaluate the package with `nix eval` so that results for an unchanged flake come from Nix's evaluation cache",
+        action="store_true",
+    )
     parser.add_argument(
         "--no-src",
         help="Do not update the source, only update dependencies such as npmDeps, cargoDeps or nugetDeps",
@@ -178,6 +268,23 @@ def parse_args(args: list[str]) -> Options:
     )
 
     a = parser.parse_args(args)
+    attributes = list(a.attribute)
+    if a.attributes_file is not None:
+        attributes.extend(read_attributes_file(a.attributes_file))
+    if len(attributes) > 1 and (a.shell or a.run or a.review):
+        # Concurrent updates would start several programs on the same terminal
+        parser.error("--shell, --run and --review only work with a single attribute")
+    scan = a.scan or a.scan_shard is not None
+    if not attributes and not scan:
+        parser.error("the following arguments are required: attribute")
+    if a.scan_shard is not None and attributes:
+        parser.error("--scan-shard only scans top-level packages")
+    if (a.check_outdated or scan) and VersionPreference.from_str(a.version) in (
+        VersionPreference.FIXED,
+        VersionPreference.SKIP,
+    ):
+        parser.error("--check-outdated needs to look up the latest version")
+
     extra_flags = ["--extra-experimental-features", "flakes nix-command"]
     if a.system:
         extra_flags.extend(["--eval-system", a.system])
@@ -186,7 +293,7 @@ def parse_args(args: list[str]) -> Options:
 
     return Options(
         import_path=os.path.realpath(a.file),
-        quiet=a.quiet or a.print_commit_message,
+        quiet=a.quiet or a.print_commit_message or a.check_outdated or scan,
         flake=a.flake,
         build=a.build,
         commit=a.commit,
@@ -200,13 +307,15 @@ def parse_args(args: list[str]) -> Options:
         shell=a.shell,
         version=a.version,
         version_preference=VersionPreference.from_str(a.version),
-        attribute=a.attribute,
+        attribute=attributes[0] if attributes else "",
+        attributes=attributes if len(attributes) > 1 else [],
         test=a.test,
         version_regex=a.version_regex,
         review=a.review,
         format=a.format,
         override_filename=a.override_filename,
         system=a.system,
+        src_systems=a.src_system,
         generate_lockfile=a.generate_lockfile,
         lockfile_metadata_path=a.lockfile_metadata_path,
         src_only=a.src_only,
@@ -214,7 +323,19 @@ def parse_args(args: list[str]) -> Options:
         github_releases_limit=a.github_releases_limit,
         extra_flags=extra_flags,
         update_src=not a.no_src,
+        skip_unchanged_lockfiles=a.skip_unchanged_lockfiles,
+        fast_src_prefetch=a.fast_src_prefetch,
+        eval_server=a.eval_server,
+        flake_eval_cache=a.flake_eval_cache,
+        attribute_index=a.attribute_index,
+        check_outdated=a.check_outdated,
+        scan=scan,
+        scan_shard=a.scan_shard,
         custom_deps=a.custom_dep,
+        fetch_jobs=a.fetch_jobs,
+        prefetch_jobs=a.prefetch_jobs,
+        lockfile_jobs=a.lockfile_jobs,
+        scan_jobs=a.scan_jobs,
     )
 
 
@@ -281,27 +402,12 @@ def git_commit(git_dir: str, package: Package) -> None:
     # Get all directories that may have changes
     files_changed = get_package_directories(package)
 
-    if new_version and (
-        package.old_version != new_version.number
-        or (new_version.rev and new_version.rev != package.rev)
-    ):
-        run(
-            [
-                "git",
-                "-C",
-                git_dir,
-                "commit",
-                "--verbose",
-                "--message",
-                msg,
-                *files_changed,
-            ],
-            stdout=None,
-        )
-    else:
-        with tempfile.NamedTemporaryFile(mode="w") as f:
-            f.write(msg)
-            f.flush()
+    # Commits of concurrent batch updates must not interleave
+    with scheduler.stage(Stage.COMMIT):
+        if new_version and (
+            package.old_version != new_version.number
+            or (new_version.rev and new_version.rev != package.rev)
+        ):
             run(
                 [
                     "git",
@@ -309,12 +415,29 @@ def git_commit(git_dir: str, package: Package) -> None:
                     git_dir,
                     "commit",
                     "--verbose",
-                    "--template",
-                    f.name,
+                    "--message",
+                    msg,
                     *files_changed,
                 ],
                 stdout=None,
             )
+        else:
+            with tempfile.NamedTemporaryFile(mode="w") as f:
+                f.write(msg)
+                f.flush()
+                run(
+                    [
+                        "git",
+                        "-C",
+                        git_dir,
+                        "commit",
+                        "--verbose",
+                        "--template",
+                        f.name,
+                        *files_changed,
+                    ],
+                    stdout=None,
+                )
 
 
 def print_commit_message(package: Package) -> None:
@@ -468,6 +591,99 @@ def handle_commit_operations(
         write_commit_message(options.write_commit_message, package)
 
 
+def process_package(
+    options: Options,
+    package: Package,
+    git_dir: str | None,
+) -> None:
+    print_maintainers(package)
+    run_nix_commands(options)
+
+    if not git_dir:
+        git_dir = find_git_root(options.import_path)
+
+    changes_detected = not git_dir or git_has_diff(git_dir, package)
+
+    if not changes_detected:
+        info("No changes detected, skipping remaining steps")
+        return
+
+    run_post_update_checks(options, package)
+    handle_commit_operations(options, package, git_dir)
+
+
+def update_batch(options: Options, git_dir: str | None) -> None:
+    """Update all attributes of a batch run from a single evaluation.
+
+    Packages are updated concurrently, with separate limits for version
+    lookups, prefetch builds and lockfile builds.  Packages sharing a
+    directory are updated one after another, so a file is never rewritten
+    by two packages at once and each commit only contains its own changes.
+    A package that fails to update is reported and skipped so that the
+    remaining packages are still updated.
+    """
+    scheduler.configure(
+        {
+            Stage.FETCH: options.fetch_jobs,
+            Stage.PREFETCH: options.prefetch_jobs,
+            Stage.LOCKFILE: options.lockfile_jobs,
+        },
+    )
+    attribute_options = [options.for_attribute(a) for a in options.attributes]
+    packages, indexed = attribute_index.eval_unindexed(options, attribute_options)
+    modified_files: set[str] = set()
+
+    if not options.use_github_releases and options.version_preference not in (
+        VersionPreference.FIXED,
+        VersionPreference.SKIP,
+    ):
+        # Look up all GitHub repositories with a few batched queries
+        prefetch_github_versions(
+            package.parsed_url
+            for package in [*packages, *indexed.values()]
+            if package is not None and package.parsed_url is not None
+        )
+
+    def update_one(attribute_opts: Options, package: Package | None) -> None:
+        if package is None:
+            package = load_package(attribute_opts)
+        with scheduler.lock_paths(get_package_directories(package)):
+            # Positions from the batch evaluation are stale once another
+            # package in the same file was updated
+            if package.filename in modified_files:
+                package = load_package(attribute_opts)
+            info(f"Updating {attribute_opts.attribute}")
+            package = update(attribute_opts, package)
+            modified_files.add(package.filename)
+            process_package(attribute_opts, package, git_dir)
+
+    failed = set()
+    workers = options.fetch_jobs + options.prefetch_jobs + options.lockfile_jobs
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {
+            executor.submit(update_one, attribute_opts, package): attribute_opts
+            for attribute_opts, package in zip(attribute_options, packages, strict=True)
+        }
+        for future in as_completed(futures):
+            attribute = futures[future].attribute
+            try:
+                future.result()
+            except (UpdateError, subprocess.CalledProcessError) as e:
+                print(f"{attribute}: {e}", file=sys.stderr)
+                failed.add(attribute)
+            except Exception as e:  # noqa: BLE001
+                # e.g. a network error of a version fetcher; the other
+                # packages are still being updated
+                print(f"{attribute}: {type(e).__name__}: {e}", file=sys.stderr)
+                failed.add(attribute)
+
+    if failed:
+        die(
+            "Failed to update: "
+            + ", ".join(a for a in options.attributes if a in failed),
+        )
+
+
 def main(args: list[str] = sys.argv[1:]) -> None:
     options = parse_args(args)
     if options.quiet:
@@ -480,22 +696,23 @@ def main(args: list[str] = sys.argv[1:]) -> None:
     if options.commit or options.review:
         git_dir = validate_git_dir(options.import_path)
 
-    package = update(options)
+    with evaluator.session(options) if options.eval_server else nullcontext():
+        if options.scan:
+            if not scan_outdated(options):
+                sys.exit(1)
+            return
 
-    print_maintainers(package)
-    run_nix_commands(options)
-
-    if not git_dir:
-        git_dir = find_git_root(options.import_path)
+        if options.check_outdated:
+            if not check_outdated(options):
+                sys.exit(1)
+            return
 
-    changes_detected = not git_dir or git_has_diff(git_dir, package)
+        if options.attributes:
+            update_batch(options, git_dir)
+            return
 
-    if not changes_detected:
-        info("No changes detected, skipping remaining steps")
-        return
-
-    run_post_update_checks(options, package)
-    handle_commit_operations(options, package, git_dir)
+        package = update(options)
+        process_package(options, package, git_dir)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""Persistent index of evaluated packages, to check for new versions without evaluating.
+
+For every attribute the index keeps the fields of eval.nix in
+``CORE_FIELDS`` (source URL, version, rev/tag and file) together with the
+content hash of the package's file.  An entry is only used as long as that
+file did not change.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import DiskCache
+from .eval import CORE_FIELDS, eval_attrs, package_from_eval
+
+if TYPE_CHECKING:
+    from .eval import Package
+    from .options import Options
+
+ATTRIBUTE_INDEX = DiskCache("attribute-index", ttl=30 * 24 * 60 * 60)
+
+
+def _key(opts: Options) -> str:
+    return json.dumps(
+        [
+            opts.import_path,
+            opts.flake,
+            opts.system,
+            opts.attribute,
+            opts.override_filename,
+            opts.url,
+        ],
+    )
+
+
+def _file_digest(filename: str) -> str | None:
+    try:
+        return hashlib.sha256(Path(filename).read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def store(opts: Options, package: Package) -> None:
+    """Record *package*, which must have just been evaluated."""
+    digest = _file_digest(package.filename)
+    if digest is None:
+        return
+    fields = {
+        name: getattr(package, name)
+        for name in CORE_FIELDS
+        if name != "raw_version_position"
+    }
+    fields["raw_version_position"] = (
+        None if package.version_position is None else asdict(package.version_position)
+    )
+    ATTRIBUTE_INDEX.set(_key(opts), {"digest": digest, "fields": fields})
+
+
+def lookup(opts: Options) -> Package | None:
+    """Return the package as recorded by ``store``, if its file did not change since.
+
+    Only the ``CORE_FIELDS`` of the returned package are set.
+    """
+    entry = ATTRIBUTE_INDEX.get(_key(opts))
+    if entry is None:
+        return None
+    try:
+        fields = entry["fields"]
+        if _file_digest(fields["filename"]) != entry["digest"]:
+            return None
+        return package_from_eval(opts, opts.attribute, fields)
+    except (KeyError, TypeError):
+        return None
+
+
+def eval_unindexed(
+    options: Options,
+    attribute_options: list[Options],
+) -> tuple[list[Package | None], dict[str, Package]]:
+    """Evaluate the attributes of a batch run that are not in the index.
+
+    Returns the evaluated packages, with None for attributes that were not
+    evaluated, and the packages found in the index by attribute.
+    """
+    indexed = {
+        attribute_opts.attribute: package
+        for attribute_opts in attribute_options
+        if options.attribute_index and (package := lookup(attribute_opts)) is not None
+    }
+    unindexed = [a.attribute for a in attribute_options if a.attribute not in indexed]
+    evaluated = (
+        dict(zip(unindexed, eval_attrs(options, unindexed), strict=True))
+        if unindexed
+        else {}
+    )
+    packages = [evaluated.get(a.attribute) for a in attribute_options]
+    if options.attribute_index:
+        for attribute_opts, package in zip(attribute_options, packages, strict=True):
+            if package is not None:
+                store(attribute_opts, package)
+    return packages, indexed
@@ -0,0 +1,100 @@
+"""Persistent caches under ``$XDG_CACHE_HOME/nix-update``."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+# Eviction walks the whole cache directory, so only do it every so often
+EVICT_INTERVAL = 64
+
+
+def cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "nix-update"
+
+
+@dataclass
+class DiskCache:
+    """JSON values stored as one file per key.
+
+    Entries older than ``ttl`` seconds are ignored.  Once the cache grows
+    beyond ``max_size`` bytes the least recently written entries are
+    removed.  All failures to read or write the cache are ignored, so a
+    broken cache directory only costs performance.
+    """
+
+    name: str
+    ttl: float
+    max_size: int = 64 * 1024 * 1024
+    _writes: int = field(default=0, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock,
+        init=False,
+        repr=False,
+    )
+
+    @property
+    def path(self) -> Path:
+        return cache_dir() / self.name
+
+    def _entry(self, key: str) -> Path:
+        return self.path / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def get(self, key: str) -> Any | None:  # noqa: ANN401
+        path = self._entry(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value: Any) -> None:  # noqa: ANN401
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(value, f)
+                Path(tmp).replace(self._entry(key))
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+        except OSError:
+            return
+
+        with self._lock:
+            self._writes += 1
+            if self._writes % EVICT_INTERVAL != 1:
+                return
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove expired entries and the oldest entries above ``max_size``."""
+        entries = []
+        now = time.time()
+        for path in self.path.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
@@ -2,40 +2,35 @@
 
 from __future__ import annotations
 
-import fileinput
+import io
 import re
 import shutil
 import tempfile
 import tomllib
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import IO, TYPE_CHECKING
 
+from . import source, worktree
+from .errors import UpdateError
 from .eval import CargoLock, CargoLockInSource, CargoLockInStore
 from .git import git_prefetch
 from .lockfile import generate_lockfile
-from .utils import run
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
     from .options import Options
 
 
-def _build_cargo_lock(opts: Options, tempdir: str) -> Path | None:
-    res = run(
-        [
-            "nix",
-            "build",
-            "--out-link",
-            f"{tempdir}/result",
-            "--impure",
-            "--print-out-paths",
-            "--expr",
-            f'\n{opts.get_package()}.overrideAttrs (old: {{\n  cargoDeps = null;\n  postUnpack = \'\'\n    cp -r "$sourceRoot/${{old.cargoRoot or "."}}/Cargo.lock" $out\n    exit\n  \'\';\n  outputs = [ "out" ];\n  separateDebugInfo = false;\n}})\n',
-            *opts.extra_flags,
-        ],
-    )
-    src = Path(res.stdout.strip())
-    return src if src.is_file() else None
+def _find_cargo_lock(opts: Options) -> Path:
+    src = source.unpacked(opts)
+    cargo_root = (src / "nix-support" / "cargo-root").read_text()
+    cargo_lock = src / cargo_root / "Cargo.lock"
+    if not cargo_lock.is_file():
+        msg = f"{cargo_root}/Cargo.lock not found in the source of {opts.attribute}"
+        raise UpdateError(msg)
+    return cargo_lock
 
 
 def _process_git_dependencies(lock: dict) -> dict[str, str]:
@@ -53,23 +48,25 @@ def _process_git_dependencies(lock: dict) -> dict[str, str]:
 def _update_short_format(
     hashes: dict[str, str],
     match: re.Match[str],
-    f: fileinput.FileInput[str],
+    f: Iterator[str],
+    out: IO[str],
 ) -> None:
     indent = match[1]
-    print(match[0], end="")
-    _print_hashes(hashes, indent)
+    print(match[0], end="", file=out)
+    _print_hashes(hashes, indent, out)
     for line in f:
-        print(line, end="")
+        print(line, end="", file=out)
 
 
 def _update_expanded_format(
     hashes: dict[str, str],
     match: re.Match[str],
-    f: fileinput.FileInput[str],
+    f: Iterator[str],
+    out: IO[str],
 ) -> None:
     indent = match[1]
-    print(match[0], end="")
-    _print_hashes(hashes, indent)
+    print(match[0], end="", file=out)
+    _print_hashes(hashes, indent, out)
     brace = 0
     for next_line in f:
         for c in next_line:
@@ -78,19 +75,19 @@ def _update_expanded_format(
             if c == "}":
                 brace += 1
             if brace == 1:
-                print(next_line, end="")
+                print(next_line, end="", file=out)
                 for final_line in f:
-                    print(final_line, end="")
+                    print(final_line, end="", file=out)
                 return
 
 
-def _print_hashes(hashes: dict[str, str], indent: str) -> None:
+def _print_hashes(hashes: dict[str, str], indent: str, out: IO[str]) -> None:
     if not hashes:
         return
-    print(f"{indent}outputHashes = {{")
+    print(f"{indent}outputHashes = {{", file=out)
     for k, v in hashes.items():
-        print(f'{indent}  "{k}" = "{v}";')
-    print(f"{indent}}};")
+        print(f'{indent}  "{k}" = "{v}";', file=out)
+    print(f"{indent}}};", file=out)
 
 
 def _update_cargo_lock(
@@ -98,16 +95,14 @@ def _update_cargo_lock(
     filename: str,
     dst: CargoLockInSource | CargoLockInStore,
 ) -> None:
+    src = _find_cargo_lock(opts)
     with tempfile.TemporaryDirectory() as tempdir:
-        src = _build_cargo_lock(opts, tempdir)
-        if not src:
-            return
-
         hashes = {}
         with Path(src).open("rb") as f:
             if isinstance(dst, CargoLockInSource):
                 with Path(dst.path).open("wb") as fdst:
                     shutil.copyfileobj(f, fdst)
+                worktree.record_change(dst.path)
 
                 with Path(dst.path).open("rb") as fdst:
                     f.seek(0)
@@ -121,18 +116,22 @@ def _update_cargo_lock(
             lock = tomllib.load(f)
             hashes = _process_git_dependencies(lock)
 
-    with fileinput.FileInput(filename, inplace=True) as f:
-        short = re.compile(r"(\s*)cargoLock\.lockFile\s*=\s*(.+)\s*;\s*")
-        expanded = re.compile(r"(\s*)lockFile\s*=\s*(.+)\s*;\s*")
+    path = Path(filename)
+    lines = iter(path.read_text().splitlines(keepends=True))
+    out = io.StringIO()
+    short = re.compile(r"(\s*)cargoLock\.lockFile\s*=\s*(.+)\s*;\s*")
+    expanded = re.compile(r"(\s*)lockFile\s*=\s*(.+)\s*;\s*")
 
-        for line in f:
-            if match := short.fullmatch(line):
-                _update_short_format(hashes, match, f)
-                return
-            if match := expanded.fullmatch(line):
-                _update_expanded_format(hashes, match, f)
-                return
-            print(line, end="")
+    for line in lines:
+        if match := short.fullmatch(line):
+            _update_short_format(hashes, match, lines, out)
+            break
+        if match := expanded.fullmatch(line):
+            _update_expanded_format(hashes, match, lines, out)
+            break
+        print(line, end="", file=out)
+    path.write_text(out.getvalue())
+    worktree.record_change(path)
 
 
 def update_cargo_lock(
@@ -148,6 +147,6 @@ def update_cargo_lock(
         return
 
     if opts.generate_lockfile:
-        generate_lockfile(opts, filename, "cargo", opts.get_package())
+        generate_lockfile(opts, filename, "cargo")
     else:
         _update_cargo_lock(opts, filename, cargo_lock)
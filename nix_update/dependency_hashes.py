@@ -1,34 +1,38 @@
 from __future__ import annotations
 
-import fileinput
+import hashlib
 import json
 import re
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from functools import partial
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from concurrent.futures import Future
 
     from .eval import Package
     from .options import Options
 
+from . import evaluator, scheduler, source, worktree
+from .cache import DiskCache
 from .cargo import update_cargo_lock
-from .errors import UpdateError
+from .errors import EvalError, UpdateError
 from .hashes import to_sri
-from .lockfile import generate_lockfile
-from .utils import run
+from .lockfile import LOCKFILE_NAMES, generate_lockfile, lockfile_digest
+from .scheduler import Stage
+from .utils import info, run
 
 
 def replace_hash(filename: str, current: str, target: str) -> None:
     normalized_hash = to_sri(target)
     if to_sri(current) != normalized_hash:
-        with fileinput.FileInput(filename, inplace=True) as f:
-            for original_line in f:
-                modified_line = original_line.replace(current, normalized_hash)
-                print(modified_line, end="")
+        path = Path(filename)
+        path.write_text(path.read_text().replace(current, normalized_hash))
+        worktree.record_change(path)
 
 
 def extract_hash_from_nix_error(stderr: str) -> str | None:
@@ -54,55 +58,160 @@ def extract_hash_from_nix_error(stderr: str) -> str | None:
     return None
 
 
-def nix_prefetch(opts: Options, attr: str | None) -> str:
-    expr = opts.get_package()
+# Hashes of fixed-output derivations, keyed by the path of the derivation
+# with its hash blanked. The path covers all inputs except the hash.
+PREFETCH_CACHE = DiskCache("prefetch", ttl=7 * 24 * 60 * 60)
 
-    if attr is not None:
-        expr += f".{attr}"
 
-    extra_env: dict[str, str] = {}
-    tempdir: tempfile.TemporaryDirectory[str] | None = None
-    stderr = ""
-    if extra_env.get("XDG_RUNTIME_DIR") is None:
-        tempdir = tempfile.TemporaryDirectory()
-        extra_env["XDG_RUNTIME_DIR"] = tempdir.name
-    try:
+def _build_for_hash(command: list[str]) -> str:
+    """Run a build that is expected to fail with a hash mismatch and return stderr."""
+    with tempfile.TemporaryDirectory() as runtime_dir, scheduler.stage(Stage.PREFETCH):
         res = run(
-            [
-                "nix-build",
-                "--expr",
-                f'let src = {expr}; in (src.overrideAttrs or (f: src // f src)) (_: {{ outputHash = ""; outputHashAlgo = "sha256"; }})',
-                *opts.extra_flags,
-            ],
-            extra_env=extra_env,
+            command,
+            extra_env={"XDG_RUNTIME_DIR": runtime_dir},
             stderr=subprocess.PIPE,
             check=False,
         )
-        stderr = res.stderr.strip()
-        got = extract_hash_from_nix_error(stderr)
-    finally:
-        if tempdir:
-            tempdir.cleanup()
+    return res.stderr.strip()
 
-    if got is None:
-        tail = "\n".join(stderr.splitlines()[-20:])
-        msg = (
-            f"failed to retrieve hash when trying to update {opts.attribute}.{attr}\n"
-            f"--- nix stderr (last 20 lines) ---\n{tail}"
+
+def _prefetch_error(opts: Options, attr: str | None, stderr: str) -> UpdateError:
+    tail = "\n".join(stderr.splitlines()[-20:])
+    msg = (
+        f"failed to retrieve hash when trying to update {opts.attribute}.{attr}\n"
+        f"--- nix stderr (last 20 lines) ---\n{tail}"
+    )
+    return UpdateError(msg)
+
+
+def _blank(expr: str) -> str:
+    """Return *expr* with its output hash left blank."""
+    return f'let src = {expr}; in (src.overrideAttrs or (f: src // f src)) (_: {{ outputHash = ""; outputHashAlgo = "sha256"; }})'
+
+
+def _attr_expr(package: str, attr: str | None) -> str:
+    return package if attr is None else f"{package}.{attr}"
+
+
+def _instantiate_blank(opts: Options, attr: str | None) -> str:
+    """Instantiate *attr* of the package with its output hash left blank."""
+    return evaluator.instantiate(
+        opts,
+        lambda package: _blank(_attr_expr(package, attr)),
+    )
+
+
+def _instantiate_blanks(opts: Options, attrs: list[str | None]) -> list[str | None]:
+    """Instantiate several attributes with blank hashes in a single evaluation.
+
+    Attributes that fail to evaluate are returned as None.
+    """
+
+    def drv_paths(package: str) -> str:
+        drvs = " ".join(
+            f"(drvPath ({_blank(_attr_expr('pkg', attr))}))" for attr in attrs
         )
-        raise UpdateError(msg)
+        return f"""
+let
+  pkg = {package};
+  drvPath = drv: let res = builtins.tryEval drv.drvPath; in if res.success then res.value else null;
+in
+[ {drvs} ]
+"""
+
+    try:
+        return evaluator.instantiate_json(opts, drv_paths)
+    except EvalError:
+        return [None] * len(attrs)
+
+
+def _prefetch_drv(opts: Options, attr: str | None, drv: str) -> str:
+    """Realise *drv*, a derivation with blank hash, and return the hash nix got."""
+    if (cached := PREFETCH_CACHE.get(drv)) is not None:
+        info(f"using cached hash for {drv}")
+        return cached
+
+    stderr = _build_for_hash(["nix-store", "--realise", drv, *opts.extra_flags])
+    got = extract_hash_from_nix_error(stderr)
+    if got is None:
+        raise _prefetch_error(opts, attr, stderr)
+    PREFETCH_CACHE.set(drv, got)
     return got
 
 
+def nix_prefetch(opts: Options, attr: str | None) -> str:
+    try:
+        drv = _instantiate_blank(opts, attr)
+    except EvalError as e:
+        raise _prefetch_error(opts, attr, str(e)) from e
+    return _prefetch_drv(opts, attr, drv)
+
+
+def nix_prefetch_with(opts: Options, attr: str, overrides: dict[str, Any]) -> str:
+    """Prefetch *attr* of the package with some of its derivation attributes replaced."""
+    overrides_json = json.dumps(json.dumps(overrides)).replace("${", "\\${")
+
+    def overridden(package: str) -> str:
+        return _blank(
+            f"{_attr_expr(package, attr)}.overrideAttrs "
+            f"(_: builtins.fromJSON {overrides_json})",
+        )
+
+    try:
+        drv = evaluator.instantiate(opts, overridden)
+    except EvalError as e:
+        raise _prefetch_error(opts, attr, str(e)) from e
+    return _prefetch_drv(opts, attr, drv)
+
+
+def nix_prefetch_many(opts: Options, attrs: list[str | None]) -> dict[str | None, str]:
+    """Prefetch the hashes of several attributes.
+
+    All derivations are instantiated in a single evaluation, then realised
+    in parallel, so the package is evaluated once instead of once per hash.
+    """
+    if len(attrs) == 1:
+        return {attrs[0]: nix_prefetch(opts, attrs[0])}
+
+    drvs = _instantiate_blanks(opts, attrs)
+    with ThreadPoolExecutor(max_workers=len(attrs)) as executor:
+        builds: dict[str, Future[str]] = {}
+        futures = {}
+        for attr, drv in zip(attrs, drvs, strict=True):
+            if drv is None:
+                # Evaluate on its own for a precise error
+                futures[attr] = executor.submit(nix_prefetch, opts, attr)
+                continue
+            if drv not in builds:
+                builds[drv] = executor.submit(_prefetch_drv, opts, attr, drv)
+            futures[attr] = builds[drv]
+        return {attr: future.result() for attr, future in futures.items()}
+
+
 def update_hash_with_prefetch(
     attr_name: str | None,
     opts: Options,
     filename: str,
     current_hash: str,
-) -> None:
+) -> str:
     """Generic function to update a hash by prefetching with a specific attribute."""
     target_hash = nix_prefetch(opts, attr_name)
     replace_hash(filename, current_hash, target_hash)
+    return target_hash
+
+
+def update_hashes_with_prefetch(
+    opts: Options,
+    filename: str,
+    current_hashes: dict[str | None, str],
+) -> dict[str | None, str]:
+    """Update the hashes of several attributes with a single prefetch build."""
+    if not current_hashes:
+        return {}
+    target_hashes = nix_prefetch_many(opts, list(current_hashes))
+    for attr_name, current_hash in current_hashes.items():
+        replace_hash(filename, current_hash, target_hashes[attr_name])
+    return target_hashes
 
 
 # Create partial function for updating src hash (used elsewhere in the code)
@@ -115,30 +224,8 @@ def build_package_attr(opts: Options, attr: str) -> str:
     Uses ``opts.get_package()`` instead of ``nix-build -A`` because flake
     repositories may not have a default.nix.
     """
-    return run(
-        [
-            "nix-build",
-            "--expr",
-            f"{opts.get_package()}.{attr}",
-            "--no-out-link",
-            *opts.extra_flags,
-        ],
-    ).stdout.strip()
-
-
-def eval_package_attr(opts: Options, attr: str) -> str:
-    """Evaluate a package attribute and return the result"""
-    res = run(
-        [
-            "nix-instantiate",
-            "--eval",
-            "--json",
-            "--expr",
-            f"toString ({opts.get_package()}.{attr})",
-            *opts.extra_flags,
-        ],
-    ).stdout.strip()
-    return json.loads(res)
+    drv = evaluator.instantiate(opts, lambda package: f"{package}.{attr}")
+    return evaluator.realise(opts, drv)[0]
 
 
 def update_nuget_deps(opts: Options) -> None:
@@ -173,22 +260,208 @@ def update_gradle_mitm_cache(opts: Options) -> None:
 
 def update_yarn_berry_missing_hashes(opts: Options, missing_hashes_path: Path) -> None:
     """Update Yarn Berry missing hashes."""
-    src_path = Path(eval_package_attr(opts, "src"))
-
-    # `src` might be a path like `./.`, in which case the above evaluation realizes the store path
-    if not src_path.exists():
-        src_path = Path(
-            build_package_attr(opts, "src")
-        )  # otherwise build the derivation (e.g. `fetchFromGitHub`)
-
+    src_path = source.src(opts)
     res = run(["yarn-berry-fetcher", "missing-hashes", str(src_path / "yarn.lock")])
     missing_hashes_path.write_text(res.stdout)
+    worktree.record_change(missing_hashes_path)
+
+
+# Fixed-output derivations that only depend on the fetched dependencies,
+# keyed by the Package field holding their current hash
+DEPENDENCY_HASH_ATTRS: dict[str, str | None] = {
+    "fod_subpackage": None,
+    "cargo_deps": "cargoDeps",
+    "cargo_vendor_deps": "cargoDeps.vendorStaging",
+    "composer_deps": "composerVendor",
+    "composer_deps_old": "composerRepository",
+    "npm_deps": "npmDeps",
+    "pnpm_deps": "pnpmDeps",
+    "yarn_deps": "yarnOfflineCache",
+    "yarn_deps_old": "offlineCache",
+    "maven_deps": "fetchedMavenDeps",
+    "mix_deps": "mixFodDeps",
+    "zig_deps": "zigDeps",
+}
+
+# In theory dependency hashes should only depend on the actual dependencies
+# being fetched, but some derivation frameworks like goModules pull in the
+# whole derivation in which case updating other dependencies end up
+# modifying the hash. These are updated after all other hashes.
+# https://github.com/NixOS/nixpkgs/issues/358844
+LATE_DEPENDENCY_HASH_ATTRS: dict[str, str | None] = {
+    "go_modules": "goModules",
+    "go_modules_old": "go-modules",
+}
+
+ALL_DEPENDENCY_HASH_ATTRS = {**DEPENDENCY_HASH_ATTRS, **LATE_DEPENDENCY_HASH_ATTRS}
+
+
+@dataclass
+class LockfileCheck:
+    """Lockfiles of the new source, keyed by the Package field of the dependency hash."""
+
+    digests: dict[str, str] = field(default_factory=dict)
+    # Fields whose lockfiles are the same in the old source
+    unchanged: set[str] = field(default_factory=set)
+
+
+def instantiate_old_src(opts: Options, package: Package) -> None:
+    """Write the derivation of the current source to the store.
+
+    eval.nix only computes ``src_drv_path``.  The lockfiles of the old source
+    are read after the file was updated, so its derivation has to be
+    instantiated before that to be realised later.
+    """
+    if package.src_drv_path is None:
+        return
+    try:
+        package.src_drv_path = evaluator.instantiate(opts, lambda expr: f"{expr}.src")
+    except EvalError as e:
+        info(f"could not instantiate the old source: {e}")
+        package.src_drv_path = None
+
+
+def check_lockfiles(opts: Options, package: Package) -> LockfileCheck:
+    """Compare the lockfiles of the old and the new source.
+
+    Must be called after the source hash was updated.
+    """
+    fields = [name for name in LOCKFILE_NAMES if getattr(package, name, None)]
+    if opts.generate_lockfile and "npm_deps" in fields:
+        # The lockfile is generated instead of taken from the source
+        fields.remove("npm_deps")
+    if not fields:
+        return LockfileCheck()
+
+    new_src = source.src(opts)
+    check = LockfileCheck(
+        {
+            name: digest
+            for name in fields
+            if (digest := lockfile_digest(new_src, LOCKFILE_NAMES[name])) is not None
+        },
+    )
+    if not check.digests or package.src_drv_path is None:
+        return check
+
+    res = run(
+        ["nix-store", "--realise", package.src_drv_path, *opts.extra_flags],
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    if res.returncode != 0:
+        info("could not realise the old source, updating all dependency hashes")
+        return check
+    old_src = Path(res.stdout.strip().splitlines()[0])
+
+    for name, digest in check.digests.items():
+        if lockfile_digest(old_src, LOCKFILE_NAMES[name]) == digest:
+            info(
+                f"{', '.join(LOCKFILE_NAMES[name])} did not change, "
+                f"keeping the hash of {ALL_DEPENDENCY_HASH_ATTRS[name]}",
+            )
+            check.unchanged.add(name)
+    return check
+
+
+# Environment variables of a vendor derivation that describe the package
+# rather than the fetcher
+PACKAGE_ENV_VARS = frozenset(
+    {
+        "name",
+        "pname",
+        "version",
+        "src",
+        "srcs",
+        "out",
+        "outputHash",
+        "outputHashAlgo",
+        "outputHashMode",
+    },
+)
+
+
+def fetcher_fingerprint(opts: Options, attr: str) -> str | None:
+    """Return a digest of the vendor derivation *attr* without its source.
+
+    The fingerprint changes whenever the fetcher or its tools change.
+    """
+    try:
+        drv = _instantiate_blank(opts, attr)
+    except EvalError:
+        return None
+    res = run(
+        ["nix", "derivation", "show", drv, *opts.extra_flags],
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    if res.returncode != 0:
+        return None
+    derivations = json.loads(res.stdout)
+    # Newer versions of nix wrap the derivations in a versioned object
+    derivation = next(iter(derivations.get("derivations", derivations).values()))
+    env = {
+        name: value
+        for name, value in derivation.get("env", {}).items()
+        if name not in PACKAGE_ENV_VARS
+    }
+    fingerprint = [
+        derivation.get("system"),
+        derivation.get("builder"),
+        derivation.get("args"),
+        env,
+    ]
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+
+# Dependency hashes by lockfile digest, shared between packages built from
+# the same lockfile, together with the fingerprint of their fetcher
+LOCKFILE_HASH_CACHE = DiskCache("lockfile-hashes", ttl=30 * 24 * 60 * 60)
+
+
+def store_lockfile_hash(opts: Options, key: tuple[str, str], new_hash: str) -> None:
+    """Remember *new_hash* for the attribute and lockfile digest in *key*."""
+    attr, _ = key
+    fingerprint = fetcher_fingerprint(opts, attr)
+    if fingerprint is not None:
+        LOCKFILE_HASH_CACHE.set(
+            json.dumps(key),
+            {"fingerprint": fingerprint, "hash": new_hash},
+        )
 
 
-def update_npm_deps(opts: Options, filename: str, old_hash: str) -> None:
-    if opts.generate_lockfile:
-        generate_lockfile(opts, filename, "npm", opts.get_package())
-    update_hash_with_prefetch("npmDeps", opts, filename, old_hash)
+def lookup_lockfile_hash(
+    opts: Options,
+    package: Package,
+    lockfiles: LockfileCheck,
+    name: str,
+) -> tuple[tuple[str, str] | None, str | None]:
+    """Return the cache key of the dependency hash *name* and the hash, if already known.
+
+    The key is None if the hash is not to be stored in the cache, e.g.
+    because it is already up to date.
+    """
+    attr = ALL_DEPENDENCY_HASH_ATTRS.get(name)
+    digest = lockfiles.digests.get(name)
+    if attr is None or digest is None:
+        return None, None
+
+    key = (attr, digest)
+    if name in lockfiles.unchanged:
+        current = getattr(package, name)
+        if LOCKFILE_HASH_CACHE.get(json.dumps(key)) is None:
+            store_lockfile_hash(opts, key, current)
+        return None, current
+
+    entry = LOCKFILE_HASH_CACHE.get(json.dumps(key))
+    # The fetcher is only inspected for lockfiles that were seen before
+    if isinstance(entry, dict) and entry.get("fingerprint") == fetcher_fingerprint(
+        opts,
+        attr,
+    ):
+        info(f"using cached hash of {attr} for {', '.join(LOCKFILE_NAMES[name])}")
+        return key, entry["hash"]
+    return key, None
 
 
 def update_dependency_hashes(
@@ -200,55 +473,104 @@ def update_dependency_hashes(
     if not (update_hash or not package.hash) or opts.src_only:
         return
 
+    # The source does not change anymore, realise it only once
+    with source.scope(opts):
+        _update_dependency_hashes(opts, package)
+
+
+def _update_dependency_hashes(opts: Options, package: Package) -> None:
     # Handle yarn berry missing hashes before yarn deps
     if package.yarn_berry_missing_hashes_path:
         update_yarn_berry_missing_hashes(
             opts, Path(package.filename).parent / package.yarn_berry_missing_hashes_path
         )
 
-    # In theory dependency hashes should only depend on the actual dependencies
-    # being fetched, but some derivation frameworks like goModules pull in the
-    # whole derivation in which case updating other dependencies end up
-    # modifying the hash. Ensure such modules come "later" in order below.
-    # https://github.com/NixOS/nixpkgs/issues/358844
-    # Dictionary iteration order is guaranteed since python 3.7
-    hash_updaters: dict[str, Callable[[Options, str, Any], None]] = {
-        "fod_subpackage": partial(update_hash_with_prefetch, None),
-        "cargo_deps": partial(update_hash_with_prefetch, "cargoDeps"),
-        "cargo_vendor_deps": partial(
-            update_hash_with_prefetch,
-            "cargoDeps.vendorStaging",
-        ),
-        "composer_deps": partial(update_hash_with_prefetch, "composerVendor"),
-        "composer_deps_old": partial(update_hash_with_prefetch, "composerRepository"),
-        "npm_deps": update_npm_deps,
-        "pnpm_deps": partial(update_hash_with_prefetch, "pnpmDeps"),
-        "yarn_deps": partial(update_hash_with_prefetch, "yarnOfflineCache"),
-        "yarn_deps_old": partial(update_hash_with_prefetch, "offlineCache"),
-        "maven_deps": partial(update_hash_with_prefetch, "fetchedMavenDeps"),
-        "mix_deps": partial(update_hash_with_prefetch, "mixFodDeps"),
-        "zig_deps": partial(update_hash_with_prefetch, "zigDeps"),
-        "cargo_lock": update_cargo_lock,
-        "go_modules": partial(update_hash_with_prefetch, "goModules"),
-        "go_modules_old": partial(update_hash_with_prefetch, "go-modules"),
-    }
+    lockfiles = (
+        check_lockfiles(opts, package)
+        if opts.skip_unchanged_lockfiles
+        else LockfileCheck()
+    )
+
+    if package.npm_deps and opts.generate_lockfile:
+        generate_lockfile(opts, package.filename, "npm")
+
+    # Independent hashes are instantiated in a single evaluation and built
+    # in parallel
+    custom_hashes: dict[str | None, str] = {}
+    for custom_dep in package.custom_deps or []:
+        custom_hashes.update(custom_dep)
+    current_hashes, keys = _outdated_hashes(
+        opts,
+        package,
+        lockfiles,
+        DEPENDENCY_HASH_ATTRS,
+    )
+    new_hashes = update_hashes_with_prefetch(
+        opts,
+        package.filename,
+        {**current_hashes, **custom_hashes},
+    )
+    for attr, key in keys.items():
+        store_lockfile_hash(opts, key, new_hashes[attr])
+
+    if package.cargo_lock:
+        update_cargo_lock(opts, package.filename, package.cargo_lock)
+
+    # Updated one by one, since they depend on the rest of the derivation
+    current_hashes, keys = _outdated_hashes(
+        opts,
+        package,
+        lockfiles,
+        LATE_DEPENDENCY_HASH_ATTRS,
+    )
+    for attr, current_hash in current_hashes.items():
+        new_hash = update_hash_with_prefetch(
+            attr,
+            opts,
+            package.filename,
+            current_hash,
+        )
+        if attr in keys:
+            store_lockfile_hash(opts, keys[attr], new_hash)
+
+    update_other_dependencies(opts, package)
 
-    # Update all dependency hashes using registry
-    for attr_name, updater in hash_updaters.items():
-        dep_value = getattr(package, attr_name, None)
-        if dep_value:
-            updater(opts, package.filename, dep_value)
 
+def _outdated_hashes(
+    opts: Options,
+    package: Package,
+    lockfiles: LockfileCheck,
+    attrs: dict[str, str | None],
+) -> tuple[dict[str | None, str], dict[str | None, tuple[str, str]]]:
+    """Return the current hashes of *attrs* that have to be prefetched.
+
+    Hashes known from unchanged lockfiles are replaced right away.  Also
+    returns the lockfile cache keys to store the new hashes under.
+    """
+    current_hashes: dict[str | None, str] = {}
+    keys: dict[str | None, tuple[str, str]] = {}
+    for name, attr in attrs.items():
+        dep_value = getattr(package, name, None)
+        if not dep_value:
+            continue
+        key, known_hash = lookup_lockfile_hash(opts, package, lockfiles, name)
+        if known_hash is not None:
+            replace_hash(package.filename, dep_value, known_hash)
+            continue
+        current_hashes[attr] = dep_value
+        if key is not None:
+            keys[attr] = key
+    return current_hashes, keys
+
+
+def update_other_dependencies(opts: Options, package: Package) -> None:
+    """Update dependencies that are not plain fixed-output hashes."""
     # Handle nuget deps separately since it's a boolean
     if package.has_nuget_deps:
         update_nuget_deps(opts)
+        worktree.record_change(Path(package.filename).parent)
 
     # Handle gradle mitm cache separately since it's a boolean
     if package.has_gradle_mitm_cache:
         update_gradle_mitm_cache(opts)
-
-    # Handle custom deps
-    if package.custom_deps:
-        for custom_dep in package.custom_deps:
-            for drv_name, old_hash in custom_dep.items():
-                update_hash_with_prefetch(drv_name, opts, package.filename, old_hash)
+        worktree.record_change(Path(package.filename).parent)
@@ -4,9 +4,11 @@ from __future__ import annotations
 
 import re
 from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
 from .errors import UpdateError
-from .eval import Package, eval_attr
+from .eval import Package, eval_revision
+from .utils import replace_version_number
 
 if TYPE_CHECKING:
     from .options import Options
@@ -60,6 +62,23 @@ def extract_github_rev_tag(url_path: str) -> str | None:
     return match.group(1) if match else None
 
 
+def derive_new_rev_tag(package: Package, new_version: Version) -> str | None:
+    """Derive the new tag or revision from the old one without evaluating the package.
+
+    Works when the old tag or revision contains the version, e.g. for
+    ``tag = "v${version}"``.  Returns None otherwise.
+    """
+    old_rev_tag = package.tag or package.rev
+    if old_rev_tag is None:
+        return None
+    new_rev_tag = replace_version_number(
+        old_rev_tag,
+        package.old_version,
+        new_version.number.removeprefix("v"),
+    )
+    return None if new_rev_tag == old_rev_tag else new_rev_tag
+
+
 def create_github_diff_url(
     opts: Options,
     package: Package,
@@ -73,13 +92,16 @@ def create_github_diff_url(
     if old_rev_tag is None:
         old_rev_tag = extract_github_rev_tag(package.parsed_url.path)
 
-    new_rev_tag = new_version.tag or new_version.rev
-    if new_rev_tag is None:
-        new_package = eval_attr(opts)
-        new_rev_tag = new_package.tag or new_package.rev
+    new_rev_tag = (
+        new_version.tag or new_version.rev or derive_new_rev_tag(package, new_version)
+    )
+    # The diff URL only ends up in the commit message
+    if new_rev_tag is None and opts.writes_commit_message:
+        revision = eval_revision(opts)
+        new_rev_tag = revision.tag or revision.rev
 
-        if new_rev_tag is None and new_package.parsed_url is not None:
-            new_rev_tag = extract_github_rev_tag(new_package.parsed_url.path)
+        if new_rev_tag is None and revision.url is not None:
+            new_rev_tag = extract_github_rev_tag(urlparse(revision.url).path)
 
     if old_rev_tag is not None and new_rev_tag is not None:
         return f"https://github.com/{owner}/{repo.removesuffix('.git')}/compare/{old_rev_tag}...{new_rev_tag}"
@@ -11,3 +11,7 @@ class VersionError(UpdateError):
 
 class AttributePathError(UpdateError):
     pass
+
+
+class EvalError(UpdateError):
+    pass
@@ -1,11 +1,24 @@
 {
   importPath,
   flakeImportPath ? null,
-  attribute,
+  attribute ? null,
+  # JSON list of attribute paths, evaluated in one pass (batch mode)
+  attributes ? null,
+  # JSON attribute path of a package set to list the attribute names of
+  listAttributes ? null,
+  # JSON list of attribute paths to scan for outdated packages (--scan)
+  scan ? null,
   system ? builtins.currentSystem,
   isFlake ? false,
+  # The flake itself, when evaluated from within another flake (pure mode)
+  # or by the eval server
+  flake ? null,
+  # The imported package set, when evaluated by the eval server
+  packageSet ? null,
   sanitizePositions ? true,
   customDeps ? null,
+  # JSON list of the fields to return; the others are never evaluated
+  fields ? null,
 }:
 
 let
@@ -17,12 +30,12 @@ let
     fromJSON
     ;
 
-  # Parse the attribute path from JSON string
-  attributePath = fromJSON attribute;
   # In case of flakes, we must pass a url with git attrs of the flake
   # otherwise the entire directory is copied to nix store
   flakeOrImportPath = if flakeImportPath != null then flakeImportPath else importPath;
 
+  loadedFlake = if flake != null then flake else getFlake flakeOrImportPath;
+
   # Try to navigate nested attributes, returning { success = bool; value = ...; }
   tryGetAttrPath =
     attrPath: root:
@@ -46,15 +59,15 @@ let
       }
       attrPath;
 
-  pkg =
+  # The package set is imported once and shared by all evaluated attributes
+  root =
     if isFlake then
-      let
-        flake = getFlake flakeOrImportPath;
-        packages = flake.packages.${system} or { };
-        # Try packages.${system} first, fall back to flake root if attribute not found
-        packagesResult = tryGetAttrPath attributePath packages;
-      in
-      if packagesResult.success then packagesResult.value else (tryGetAttrPath attributePath flake).value
+      {
+        packages = loadedFlake.packages.${system} or { };
+        flake = loadedFlake;
+      }
+    else if packageSet != null then
+      packageSet
     else
       let
         pkgs = import importPath;
@@ -63,13 +76,30 @@ let
           (if args ? system then { system = system; } else { })
           // (if args ? overlays then { overlays = [ ]; } else { });
       in
-      (tryGetAttrPath attributePath (pkgs inputs)).value;
+      pkgs inputs;
+
+  getPackage =
+    attributePath:
+    let
+      # Try packages.${system} first, fall back to flake root if attribute not found
+      result =
+        if isFlake then
+          let
+            packagesResult = tryGetAttrPath attributePath root.packages;
+          in
+          if packagesResult.success then packagesResult else tryGetAttrPath attributePath root.flake
+        else
+          tryGetAttrPath attributePath root;
+    in
+    if result.success then
+      result.value
+    else
+      throw "attribute '${builtins.concatStringsSep "." attributePath}' not found";
 
   sanitizePosition =
     if isFlake && sanitizePositions then
       let
-        flake = getFlake flakeOrImportPath;
-        outPath = flake.outPath;
+        outPath = loadedFlake.outPath;
         outPathLen = stringLength outPath;
       in
       { file, ... }@pos:
@@ -90,79 +120,151 @@ let
       line = builtins.fromJSON (builtins.elemAt parts 1);
     };
 
-  raw_version_position = sanitizePosition (builtins.unsafeGetAttrPos "version" pkg);
-
-  position =
-    if pkg ? isRubyGem then
-      raw_version_position
-    else if pkg ? isPhpExtension then
-      raw_version_position
-    else if (builtins.unsafeGetAttrPos "src" pkg) != null then
-      sanitizePosition (builtins.unsafeGetAttrPos "src" pkg)
+  # Selecting the fields lazily keeps --strict from forcing the others
+  project =
+    if fields != null then
+      builtins.intersectAttrs (
+        builtins.listToAttrs (
+          map (name: {
+            inherit name;
+            value = null;
+          }) (fromJSON fields)
+        )
+      )
     else
-      sanitizePosition (positionFromMeta pkg);
+      x: x;
+
+  packageInfo =
+    attributePath:
+    let
+      pkg = getPackage attributePath;
 
-  has_update_script = pkg.passthru.updateScript or null != null;
+      raw_version_position = sanitizePosition (builtins.unsafeGetAttrPos "version" pkg);
 
-  customHashes =
-    if customDeps != null then
-      builtins.map (x: { ${x} = pkg.${x}.outputHash; }) (fromJSON customDeps)
-    else
-      null;
+      position =
+        if pkg ? isRubyGem then
+          raw_version_position
+        else if pkg ? isPhpExtension then
+          raw_version_position
+        else if (builtins.unsafeGetAttrPos "src" pkg) != null then
+          sanitizePosition (builtins.unsafeGetAttrPos "src" pkg)
+        else
+          sanitizePosition (positionFromMeta pkg);
+
+      has_update_script = pkg.passthru.updateScript or null != null;
+
+      customHashes =
+        if customDeps != null then
+          builtins.map (x: { ${x} = pkg.${x}.outputHash; }) (fromJSON customDeps)
+        else
+          null;
+    in
+    project {
+      name = pkg.name;
+      pname = pkg.pname or (builtins.parseDrvName pkg.name).name;
+      old_version = pkg.version or (builtins.parseDrvName pkg.name).version;
+      inherit raw_version_position;
+      filename = position.file;
+      line = position.line;
+      urls = pkg.src.urls or null;
+      url = pkg.src.url or null;
+      rev = pkg.src.rev or null;
+      tag = pkg.src.tag or null;
+      hash = pkg.src.outputHash or null;
+      src_drv_path =
+        let
+          res = builtins.tryEval (pkg.src.drvPath or null);
+        in
+        if res.success then res.value else null;
+      src_name = pkg.src.name or null;
+      src_hash_mode = pkg.src.outputHashMode or null;
+      src_post_fetch = pkg.src.postFetch or null;
+      fod_subpackage = pkg.outputHash or null;
+      go_modules = pkg.goModules.outputHash or null;
+      go_modules_old = pkg.go-modules.outputHash or null;
+      cargo_deps = pkg.cargoDeps.outputHash or null;
+      cargo_vendor_deps = pkg.cargoDeps.vendorStaging.outputHash or null;
+      raw_cargo_lock =
+        if pkg ? cargoDeps.lockFile then
+          let
+            inherit (pkg.cargoDeps) lockFile;
+            res = builtins.tryEval (sanitizePosition {
+              file = toString lockFile;
+            });
+          in
+          if res.success then res.value.file else false
+        else
+          null;
+      composer_deps = pkg.composerVendor.outputHash or null;
+      composer_deps_old = pkg.composerRepository.outputHash or null;
+      custom_deps = customHashes;
+      npm_deps = pkg.npmDeps.outputHash or null;
+      pnpm_deps = pkg.pnpmDeps.outputHash or null;
+      yarn_deps = pkg.yarnOfflineCache.outputHash or null;
+      yarn_deps_old = pkg.offlineCache.outputHash or null;
+      yarn_berry_missing_hashes_path =
+        if pkg ? missingHashes then
+          let
+            res = builtins.tryEval (sanitizePosition {
+              file = toString pkg.missingHashes;
+            });
+          in
+          if res.success then res.value.file else null
+        else
+          null;
+      maven_deps = pkg.fetchedMavenDeps.outputHash or null;
+      has_nuget_deps = pkg ? nugetDeps;
+      has_gradle_mitm_cache = pkg ? mitmCache;
+      mix_deps = pkg.mixFodDeps.outputHash or null;
+      zig_deps = pkg.zigDeps.outputHash or null;
+      tests = builtins.attrNames (pkg.passthru.tests or { });
+      inherit has_update_script;
+      src_homepage = pkg.src.meta.homepage or null;
+      changelog = pkg.meta.changelog or null;
+      maintainers = pkg.meta.maintainers or null;
+    };
+
+  # A package that fails to evaluate must not abort the whole batch;
+  # it is reported as null and re-evaluated on its own for a proper error.
+  tryPackageInfo =
+    attributePath:
+    let
+      info = packageInfo attributePath;
+      res = builtins.tryEval (builtins.deepSeq info info);
+    in
+    if res.success then res.value else null;
+
+  # The few fields needed to look up the latest version, or null for
+  # attributes that are not a derivation with a source URL.  Kept small
+  # so that scanning a whole package set stays cheap.
+  scanInfo =
+    attributePath:
+    let
+      pkg = getPackage attributePath;
+      src = pkg.src or { };
+      urls = src.urls or [ ];
+      url = src.url or (if urls != [ ] then builtins.head urls else null);
+      info = {
+        pname = pkg.pname or (builtins.parseDrvName pkg.name).name;
+        old_version = pkg.version or (builtins.parseDrvName pkg.name).version;
+        inherit url;
+        rev = src.rev or null;
+        tag = src.tag or null;
+      };
+      res = builtins.tryEval (
+        if builtins.isAttrs pkg && pkg.type or null == "derivation" && pkg ? name && url != null then
+          builtins.deepSeq info info
+        else
+          null
+      );
+    in
+    if res.success then res.value else null;
 in
-{
-  name = pkg.name;
-  pname = pkg.pname or (builtins.parseDrvName pkg.name).name;
-  old_version = pkg.version or (builtins.parseDrvName pkg.name).version;
-  inherit raw_version_position;
-  filename = position.file;
-  line = position.line;
-  urls = pkg.src.urls or null;
-  url = pkg.src.url or null;
-  rev = pkg.src.rev or null;
-  tag = pkg.src.tag or null;
-  hash = pkg.src.outputHash or null;
-  fod_subpackage = pkg.outputHash or null;
-  go_modules = pkg.goModules.outputHash or null;
-  go_modules_old = pkg.go-modules.outputHash or null;
-  cargo_deps = pkg.cargoDeps.outputHash or null;
-  cargo_vendor_deps = pkg.cargoDeps.vendorStaging.outputHash or null;
-  raw_cargo_lock =
-    if pkg ? cargoDeps.lockFile then
-      let
-        inherit (pkg.cargoDeps) lockFile;
-        res = builtins.tryEval (sanitizePosition {
-          file = toString lockFile;
-        });
-      in
-      if res.success then res.value.file else false
-    else
-      null;
-  composer_deps = pkg.composerVendor.outputHash or null;
-  composer_deps_old = pkg.composerRepository.outputHash or null;
-  custom_deps = customHashes;
-  npm_deps = pkg.npmDeps.outputHash or null;
-  pnpm_deps = pkg.pnpmDeps.outputHash or null;
-  yarn_deps = pkg.yarnOfflineCache.outputHash or null;
-  yarn_deps_old = pkg.offlineCache.outputHash or null;
-  yarn_berry_missing_hashes_path =
-    if pkg ? missingHashes then
-      let
-        res = builtins.tryEval (sanitizePosition {
-          file = toString pkg.missingHashes;
-        });
-      in
-      if res.success then res.value.file else null
-    else
-      null;
-  maven_deps = pkg.fetchedMavenDeps.outputHash or null;
-  has_nuget_deps = pkg ? nugetDeps;
-  has_gradle_mitm_cache = pkg ? mitmCache;
-  mix_deps = pkg.mixFodDeps.outputHash or null;
-  zig_deps = pkg.zigDeps.outputHash or null;
-  tests = builtins.attrNames (pkg.passthru.tests or { });
-  inherit has_update_script;
-  src_homepage = pkg.src.meta.homepage or null;
-  changelog = pkg.meta.changelog or null;
-  maintainers = pkg.meta.maintainers or null;
-}
+if scan != null then
+  map scanInfo (fromJSON scan)
+else if listAttributes != null then
+  builtins.attrNames (getPackage (fromJSON listAttributes))
+else if attributes != null then
+  map tryPackageInfo (fromJSON attributes)
+else
+  packageInfo (fromJSON attribute)
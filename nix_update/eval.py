@@ -2,12 +2,15 @@ from __future__ import annotations
 
 import json
 import os
+import subprocess
 from dataclasses import InitVar, dataclass, field
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Literal
+from typing import TYPE_CHECKING, Any, Literal, cast
 from urllib.parse import ParseResult, urlparse
 
+from . import evaluator, flake_eval
 from .errors import UpdateError
+from .options import parse_attribute_path
 from .utils import run
 from .version.version import Version, VersionPreference
 
@@ -52,6 +55,10 @@ class Package:
     rev: str | None
     tag: str | None
     hash: str | None
+    src_drv_path: str | None
+    src_name: str | None
+    src_hash_mode: str | None
+    src_post_fetch: str | None
     fod_subpackage: str | None
     go_modules: str | None
     go_modules_old: str | None
@@ -108,58 +115,307 @@ class Package:
             self.cargo_lock = CargoLockInSource(raw_cargo_lock)
 
 
+class ScanRecord:
+    """The fields of a package needed to check whether it is outdated.
+
+    Scanning a whole package set deals with tens of thousands of packages,
+    so unlike ``Package`` this keeps only a handful of slots per package.
+    """
+
+    __slots__ = (
+        "attribute",
+        "new_version",
+        "old_version",
+        "parsed_url",
+        "pname",
+        "rev",
+        "tag",
+    )
+
+    def __init__(  # noqa: PLR0913
+        self,
+        attribute: str,
+        *,
+        pname: str,
+        old_version: str,
+        url: str,
+        rev: str | None,
+        tag: str | None,
+    ) -> None:
+        self.attribute = attribute
+        self.pname = pname
+        self.old_version = old_version
+        self.parsed_url = urlparse(url)
+        self.rev = rev
+        self.tag = tag
+        self.new_version: Version | None = None
+
+
+# Fields of eval.nix needed by every update
+CORE_FIELDS = (
+    "name",
+    "pname",
+    "old_version",
+    "raw_version_position",
+    "filename",
+    "line",
+    "urls",
+    "url",
+    "rev",
+    "tag",
+    "hash",
+)
+# Dependency hashes, whose attributes may instantiate big derivations
+DEPENDENCY_FIELDS = (
+    "fod_subpackage",
+    "go_modules",
+    "go_modules_old",
+    "cargo_deps",
+    "cargo_vendor_deps",
+    "raw_cargo_lock",
+    "composer_deps",
+    "composer_deps_old",
+    "npm_deps",
+    "pnpm_deps",
+    "yarn_deps",
+    "yarn_deps_old",
+    "yarn_berry_missing_hashes_path",
+    "maven_deps",
+    "has_nuget_deps",
+    "has_gradle_mitm_cache",
+    "mix_deps",
+    "zig_deps",
+)
+FAST_SRC_PREFETCH_FIELDS = ("src_name", "src_hash_mode", "src_post_fetch")
+COMMIT_MESSAGE_FIELDS = ("changelog", "src_homepage")
+OPTIONAL_FIELDS = (
+    *DEPENDENCY_FIELDS,
+    "src_drv_path",
+    *FAST_SRC_PREFETCH_FIELDS,
+    *COMMIT_MESSAGE_FIELDS,
+    "custom_deps",
+    "has_update_script",
+    "tests",
+    "maintainers",
+)
+
+# Values of fields that were not evaluated, None for all others
+UNEVALUATED_FIELDS: dict[str, Any] = {
+    "has_nuget_deps": False,
+    "has_gradle_mitm_cache": False,
+    "has_update_script": False,
+    "tests": [],
+}
+
+
+def eval_fields(opts: Options) -> list[str]:
+    """Return the fields of eval.nix needed for the enabled options."""
+    if opts.check_outdated:
+        return list(CORE_FIELDS)
+    fields = list(CORE_FIELDS)
+    if not opts.src_only:
+        fields.extend(DEPENDENCY_FIELDS)
+        if opts.skip_unchanged_lockfiles:
+            # The old source is compared with the new one
+            fields.append("src_drv_path")
+    if opts.fast_src_prefetch:
+        fields.extend(FAST_SRC_PREFETCH_FIELDS)
+    if opts.custom_deps:
+        fields.append("custom_deps")
+    if opts.use_update_script:
+        fields.append("has_update_script")
+    if opts.test:
+        fields.append("tests")
+    if opts.writes_commit_message:
+        fields.extend(COMMIT_MESSAGE_FIELDS)
+    if opts.commit or opts.review:
+        fields.append("maintainers")
+    return fields
+
+
 def get_eval_nix_path() -> Path:
     """Get the path to the eval.nix file."""
     return Path(__file__).parent / "eval.nix"
 
 
-def eval_attr(opts: Options) -> Package:
-    eval_nix = get_eval_nix_path()
-
-    # Pass the attribute path as JSON string
-    attribute_json = json.dumps(opts.attribute_path)
-
-    # Build nix-instantiate command with --arg and --argstr
-    cmd = [
-        "nix-instantiate",
-        "--eval",
-        "--json",
-        "--strict",
-        str(eval_nix),
-        "--argstr",
-        "importPath",
-        opts.import_path,
-        "--argstr",
-        "attribute",
-        attribute_json,
-        "--arg",
-        "isFlake",
-        "true" if opts.flake else "false",
-        "--arg",
-        "sanitizePositions",
-        "false" if opts.override_filename else "true",
-    ]
+def _eval_nix_args(opts: Options, fields: list[str]) -> dict[str, str | bool]:
+    """Return the arguments of eval.nix other than the attributes to evaluate."""
+    args: dict[str, str | bool] = {
+        "importPath": opts.import_path,
+        "isFlake": opts.flake,
+        "sanitizePositions": not opts.override_filename,
+        "fields": json.dumps(fields),
+    }
 
     flake_store_path = opts.get_flake_import_path()
     if flake_store_path is not None:
-        cmd.extend(["--argstr", "flakeImportPath", flake_store_path])
+        args["flakeImportPath"] = flake_store_path
 
     if opts.system:
-        cmd.extend(["--argstr", "system", opts.system])
+        args["system"] = opts.system
 
     if opts.custom_deps:
-        custom_deps_json = json.dumps(opts.custom_deps)
-        cmd.extend(["--argstr", "customDeps", custom_deps_json])
+        args["customDeps"] = json.dumps(opts.custom_deps)
+
+    return args
+
+
+def _nix_string(value: str) -> str:
+    return json.dumps(value, ensure_ascii=False).replace("${", "\\${")
+
+
+def _eval_nix(
+    opts: Options,
+    fields: list[str],
+    query: dict[str, str],
+    *,
+    capture_stderr: bool = False,
+) -> Any:  # noqa: ANN401
+    """Evaluate eval.nix for the attributes in *query*.
+
+    With ``--eval-server`` the package set already loaded by the server is
+    passed in instead of importing it again.
+    """
+    args = {**_eval_nix_args(opts, fields), **query}
+    eval_nix = get_eval_nix_path()
+
+    server = evaluator.current()
+    if server is not None:
+        root_arg = "flake" if opts.flake else "packageSet"
+        return server.eval_root_json(
+            opts,
+            lambda root: (
+                f"import {_nix_string(str(eval_nix))} "
+                f"((builtins.fromJSON {_nix_string(json.dumps(args))}) "
+                f"// {{ {root_arg} = {root}; }})"
+            ),
+        )
+
+    # Build nix-instantiate command with --arg and --argstr
+    cmd = ["nix-instantiate", "--eval", "--json", "--strict", str(eval_nix)]
+    for name, value in args.items():
+        if isinstance(value, bool):
+            cmd.extend(["--arg", name, "true" if value else "false"])
+        else:
+            cmd.extend(["--argstr", name, value])
+
+    res = run(cmd, stderr=subprocess.PIPE if capture_stderr else None)
+    return json.loads(res.stdout)
 
-    res = run(cmd)
-    out = json.loads(res.stdout)
+
+def package_from_eval(opts: Options, attribute: str, out: dict[str, Any]) -> Package:
+    """Create the package from the output of eval.nix, which may lack optional fields."""
+    for name in OPTIONAL_FIELDS:
+        out.setdefault(name, UNEVALUATED_FIELDS.get(name))
     if opts.override_filename is not None:
         out["filename"] = opts.override_filename
     if opts.url is not None:
         out["url"] = opts.url
-    package = Package(attribute=opts.attribute, import_path=opts.import_path, **out)
+    package = Package(attribute=attribute, import_path=opts.import_path, **out)
     if opts.version_preference != VersionPreference.SKIP and package.old_version == "":
         msg = f"Nix's builtins.parseDrvName could not parse the version from {package.name}"
         raise UpdateError(msg)
 
     return package
+
+
+def _eval_attr_json(opts: Options, fields: list[str]) -> dict[str, Any]:
+    if opts.flake and opts.flake_eval_cache:
+        return flake_eval.eval_attr_json(opts, get_eval_nix_path(), fields)
+
+    # Pass the attribute path as JSON string
+    return cast(
+        "dict[str, Any]",
+        _eval_nix(opts, fields, {"attribute": json.dumps(opts.attribute_path)}),
+    )
+
+
+def eval_attr(opts: Options, fields: list[str] | None = None) -> Package:
+    """Evaluate the package, or only *fields* of it in addition to ``CORE_FIELDS``."""
+    fields = eval_fields(opts) if fields is None else [*CORE_FIELDS, *fields]
+    return package_from_eval(opts, opts.attribute, _eval_attr_json(opts, fields))
+
+
+@dataclass
+class Revision:
+    """The fields of a package that change along with its version."""
+
+    version: str
+    rev: str | None
+    tag: str | None
+    url: str | None
+
+
+def eval_revision(opts: Options) -> Revision:
+    """Evaluate only the version, revision and URL of the package.
+
+    Cheaper than ``eval_attr`` for re-reading a package after its file was
+    updated.
+    """
+    out = _eval_attr_json(opts, ["old_version", "rev", "tag", "url", "urls"])
+    return Revision(
+        version=out["old_version"],
+        rev=out["rev"],
+        tag=out["tag"],
+        url=out["url"] or (out["urls"][0] if out["urls"] else None),
+    )
+
+
+def eval_attrs(opts: Options, attributes: list[str]) -> list[Package | None]:
+    """Evaluate several attributes with a single import of the package set.
+
+    The result has one entry per attribute, in order.  Attributes that failed
+    to evaluate are returned as *None*; evaluating them on their own with
+    ``eval_attr`` reports the actual error.
+    """
+    attribute_paths = [parse_attribute_path(attribute) for attribute in attributes]
+    out = _eval_nix(
+        opts,
+        eval_fields(opts),
+        {"attributes": json.dumps(attribute_paths)},
+    )
+    return [
+        _try_package_from_eval(opts, attribute, package)
+        for attribute, package in zip(attributes, out, strict=True)
+    ]
+
+
+def _try_package_from_eval(
+    opts: Options,
+    attribute: str,
+    out: dict[str, Any] | None,
+) -> Package | None:
+    if out is None:
+        return None
+    try:
+        return package_from_eval(opts, attribute, out)
+    except UpdateError:
+        # Reported when the attribute is evaluated on its own
+        return None
+
+
+def eval_attribute_names(opts: Options, attribute_path: list[str]) -> list[str]:
+    """List the attribute names of the package set at *attribute_path*."""
+    return cast(
+        "list[str]",
+        _eval_nix(opts, [], {"listAttributes": json.dumps(attribute_path)}),
+    )
+
+
+def eval_scan(opts: Options, attributes: list[str]) -> list[ScanRecord | None]:
+    """Evaluate the ``ScanRecord`` of several attributes in one pass.
+
+    Attributes that are no derivation with a source URL, or that fail to
+    evaluate with a catchable error, are returned as *None*.
+    """
+    attribute_paths = [parse_attribute_path(attribute) for attribute in attributes]
+    out = _eval_nix(
+        opts,
+        [],
+        {"scan": json.dumps(attribute_paths)},
+        capture_stderr=True,
+    )
+    return [
+        None if record is None else ScanRecord(attribute, **record)
+        for attribute, record in zip(attributes, out, strict=True)
+    ]
@@ -0,0 +1,246 @@
+"""Nix evaluation, optionally through one long-lived ``nix repl`` process.
+
+Every ``nix-instantiate`` call imports the package set again, which for
+nixpkgs takes seconds and lots of memory.  With ``--eval-server`` all
+evaluations of a run go to a single ``nix repl`` that keeps the package set
+loaded.  Builds then only realise the returned derivation paths.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, cast
+
+from . import worktree
+from .errors import EvalError
+from .utils import info, run
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+    from .options import Options
+
+PROMPT = re.compile(r"^(nix-repl> )+")
+
+
+def _unquote(literal: str) -> str:
+    """Undo the escaping of a string printed by ``nix repl``."""
+    escapes = {"n": "\n", "r": "\r", "t": "\t"}
+    return re.sub(
+        r"\\(.)",
+        lambda m: escapes.get(m[1], m[1]),
+        literal[1:-1],
+    )
+
+
+def parse_repl_output(lines: list[str]) -> Any:  # noqa: ANN401
+    """Parse the output of ``builtins.toJSON [ value ]`` printed by ``nix repl``.
+
+    Depending on the nix version the string is printed quoted or as is.
+    The list wrapper tells the two apart.
+    """
+    for line in lines:
+        if line.startswith('"['):
+            return json.loads(_unquote(line))[0]
+        if line.startswith("["):
+            return json.loads(line)[0]
+    raise EvalError("\n".join(lines))
+
+
+class Evaluator:
+    """A ``nix repl`` process answering queries about packages.
+
+    The package sets are imported once and kept as repl variables.  The
+    repl reloads all files when a file of the working tree changed since
+    the last query.
+    """
+
+    def __init__(self, extra_flags: list[str], import_path: str) -> None:
+        self._tempdir = tempfile.TemporaryDirectory(prefix="nix-update-eval-")
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._roots: dict[str, str] = {}
+        self._import_path = import_path
+        self._stamp = worktree.stamp(import_path)
+        info("$ " + " ".join(["nix", "repl", *extra_flags]))
+        self._proc = subprocess.Popen(
+            ["nix", "repl", *extra_flags],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            env={**os.environ, "NO_COLOR": "1", "TERM": "dumb"},
+        )
+        # Skip the welcome message
+        self._communicate(None)
+
+    @property
+    def _stdin(self) -> IO[str]:
+        return cast("IO[str]", self._proc.stdin)
+
+    @property
+    def _stdout(self) -> IO[str]:
+        return cast("IO[str]", self._proc.stdout)
+
+    def _communicate(self, line: str | None) -> list[str]:
+        """Send *line* to the repl and return its output."""
+        n = next(self._counter)
+        if line is not None:
+            self._stdin.write(f"{line}\n")
+        # Differs from its result, in case the repl echoes its input
+        self._stdin.write(f'"nix-update-done-" + "{n}"\n')
+        self._stdin.flush()
+        markers = {f'"nix-update-done-{n}"', f"nix-update-done-{n}"}
+        output: list[str] = []
+        for raw_line in self._stdout:
+            out = PROMPT.sub("", raw_line.rstrip("\n")).strip()
+            if out in markers:
+                return output
+            if out:
+                output.append(out)
+        msg = "nix repl exited unexpectedly:\n" + "\n".join(output)
+        raise EvalError(msg)
+
+    def _reload_if_changed(self) -> None:
+        stamp = worktree.stamp(self._import_path)
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._communicate(":reload")
+        self._roots.clear()
+
+    def _root(self, expr: str) -> str:
+        if (name := self._roots.get(expr)) is None:
+            name = f"nixUpdateRoot{len(self._roots)}"
+            self._communicate(f"{name} = {expr}")
+            self._roots[expr] = name
+        return name
+
+    def eval_json(self, opts: Options, make_expr: Callable[[str], str]) -> Any:  # noqa: ANN401
+        """Evaluate ``make_expr(package)`` strictly and return it as JSON value."""
+        return self.eval_root_json(
+            opts,
+            lambda root: make_expr(opts.get_package_from_root(root)),
+        )
+
+    def eval_root_json(self, opts: Options, make_expr: Callable[[str], str]) -> Any:  # noqa: ANN401
+        """Evaluate ``make_expr(root)``, where root is the package set or flake of the package."""
+        with self._lock:
+            self._reload_if_changed()
+            root = self._root(opts.get_package_root())
+            # Going through a file keeps multi-line expressions intact
+            query = Path(self._tempdir.name) / f"query-{next(self._counter)}.nix"
+            query.write_text(f"{root}: {make_expr(root)}\n")
+            try:
+                output = self._communicate(
+                    f"builtins.toJSON [ ((import {query}) {root}) ]",
+                )
+            finally:
+                query.unlink()
+        return parse_repl_output(output)
+
+    def close(self) -> None:
+        self._stdin.close()
+        self._proc.wait()
+        self._tempdir.cleanup()
+
+
+_current: Evaluator | None = None
+
+
+def current() -> Evaluator | None:
+    """Return the evaluator of the running ``session``, if any."""
+    return _current
+
+
+@contextmanager
+def session(opts: Options) -> Iterator[None]:
+    """Route the evaluations within the block through a single ``nix repl``."""
+    global _current  # noqa: PLW0603
+    evaluator = Evaluator(opts.extra_flags, opts.import_path)
+    _current = evaluator
+    try:
+        yield
+    finally:
+        _current = None
+        evaluator.close()
+
+
+def eval_json(opts: Options, make_expr: Callable[[str], str]) -> Any:  # noqa: ANN401
+    """Evaluate ``make_expr(package)``, where package is the Nix expression of the package."""
+    if _current is not None:
+        return _current.eval_json(opts, make_expr)
+    return _eval_json(opts, make_expr, [])
+
+
+def instantiate_json(opts: Options, make_expr: Callable[[str], str]) -> Any:  # noqa: ANN401
+    """Like ``eval_json``, but write the derivations whose ``drvPath`` is taken to the store.
+
+    ``nix-instantiate --eval`` only computes derivation paths, so they could
+    not be realised afterwards.  ``nix repl`` always writes them.
+    """
+    if _current is not None:
+        return _current.eval_json(opts, make_expr)
+    return _eval_json(opts, make_expr, ["--read-write-mode"])
+
+
+def _eval_json(
+    opts: Options,
+    make_expr: Callable[[str], str],
+    mode: list[str],
+) -> Any:  # noqa: ANN401
+    res = run(
+        [
+            "nix-instantiate",
+            "--eval",
+            *mode,
+            "--json",
+            "--strict",
+            "--expr",
+            make_expr(opts.get_package()),
+            *opts.extra_flags,
+        ],
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    if res.returncode != 0:
+        raise EvalError(res.stderr.strip())
+    return json.loads(res.stdout)
+
+
+def instantiate(opts: Options, make_expr: Callable[[str], str]) -> str:
+    """Instantiate the derivation ``make_expr(package)`` and return its path."""
+    if _current is not None:
+        return _current.eval_json(
+            opts, lambda package: f"({make_expr(package)}).drvPath"
+        )
+    res = run(
+        [
+            "nix-instantiate",
+            "--expr",
+            make_expr(opts.get_package()),
+            *opts.extra_flags,
+        ],
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    if res.returncode != 0:
+        raise EvalError(res.stderr.strip())
+    return res.stdout.strip().split("!", 1)[0]
+
+
+def realise(opts: Options, drv: str, gc_root: Path | None = None) -> list[str]:
+    """Build *drv* and return its output paths."""
+    cmd = ["nix-store", "--realise", drv]
+    if gc_root is not None:
+        cmd.extend(["--add-root", str(gc_root), "--indirect"])
+    res = run([*cmd, *opts.extra_flags])
+    return res.stdout.split()
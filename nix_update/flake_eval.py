@@ -0,0 +1,166 @@
+"""Evaluate flake packages through Nix's flake evaluation cache.
+
+``eval.nix`` loads the flake with ``builtins.getFlake``, which never uses
+the evaluation cache.  Instead, a small wrapper flake takes the flake as
+input and exports the output of ``eval.nix`` for every package as string
+attribute.  ``nix eval`` of that attribute is answered from the evaluation
+cache as long as the locked flake did not change.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import textwrap
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .cache import cache_dir
+from .utils import run
+
+if TYPE_CHECKING:
+    from .options import Options
+
+
+@functools.cache
+def _current_system(extra_flags: tuple[str, ...]) -> str:
+    res = run(
+        [
+            "nix",
+            "eval",
+            "--impure",
+            "--raw",
+            "--expr",
+            "builtins.currentSystem",
+            *extra_flags,
+        ],
+    )
+    return res.stdout.strip()
+
+
+# Name of the eval.nix result next to the attributes of a mirrored value
+RESULT_ATTR = "__nixUpdate"
+# Number of wrapper flakes kept in the cache directory
+MAX_WRAPPERS = 32
+
+
+def _flake_url(opts: Options) -> str:
+    flake_store_path = opts.get_flake_import_path()
+    if flake_store_path is not None:
+        return f"path:{flake_store_path}"
+    return opts.import_path
+
+
+def wrapper_flake_nix(opts: Options, system: str, fields: list[str]) -> str:
+    """Return the ``flake.nix`` exporting ``eval.nix`` results as ``nixUpdate.<attribute>``."""
+    custom_deps = (
+        "null" if opts.custom_deps is None else json.dumps(json.dumps(opts.custom_deps))
+    )
+    sanitize_positions = "false" if opts.override_filename else "true"
+    return textwrap.dedent(
+        f"""\
+        {{
+          inputs.target.url = {json.dumps(_flake_url(opts))};
+          outputs =
+            {{ target, ... }}:
+            let
+              evalAttribute =
+                path:
+                builtins.toJSON (
+                  import ./eval.nix {{
+                    importPath = {json.dumps(opts.import_path)};
+                    isFlake = true;
+                    flake = target;
+                    attribute = builtins.toJSON path;
+                    system = {json.dumps(system)};
+                    sanitizePositions = {sanitize_positions};
+                    customDeps = {custom_deps};
+                    fields = {json.dumps(json.dumps(fields))};
+                  }}
+                );
+              # Lazily mirrors the flake, with the eval.nix result of every
+              # attribute under a reserved name.  Derivations are descended
+              # into as well, for attributes such as python3.pkgs.foo.
+              mirror =
+                path: value:
+                (if builtins.isAttrs value then builtins.mapAttrs (name: mirror (path ++ [ name ])) value else {{ }})
+                // {{
+                  {RESULT_ATTR} = evalAttribute path;
+                }};
+            in
+            {{
+              nixUpdate = mirror [ ] (target // target.packages.{json.dumps(system)} or {{ }});
+            }};
+        }}
+        """,
+    )
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    with tempfile.NamedTemporaryFile(
+        "w",
+        dir=path.parent,
+        prefix=f".{path.name}.",
+        delete=False,
+    ) as f:
+        f.write(content)
+    Path(f.name).replace(path)
+
+
+def wrapper_flake(opts: Options, eval_nix: Path, fields: list[str]) -> Path:
+    """Write the wrapper flake for *opts* to the cache directory and return it.
+
+    The directory is named after its content, so an unchanged flake reuses
+    the same wrapper and thereby the same evaluation cache entries.
+    """
+    system = opts.system or _current_system(tuple(opts.extra_flags))
+    files = {
+        "flake.nix": wrapper_flake_nix(opts, system, fields),
+        "eval.nix": eval_nix.read_text(),
+    }
+    digest = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+    path = cache_dir() / "flake-eval" / digest
+    if (path / "flake.nix").exists():
+        # Marks the wrapper as recently used
+        os.utime(path)
+        return path
+    path.mkdir(parents=True, exist_ok=True)
+    # flake.nix last, it marks the wrapper as complete
+    for name in sorted(files, key=lambda name: name == "flake.nix"):
+        _write_atomic(path / name, files[name])
+    _prune_wrappers(path.parent)
+    return path
+
+
+def _prune_wrappers(directory: Path) -> None:
+    """Remove all but the ``MAX_WRAPPERS`` most recently used wrapper flakes."""
+
+    def mtime(path: Path) -> float:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return 0
+
+    wrappers = sorted(directory.iterdir(), key=mtime, reverse=True)
+    for path in wrappers[MAX_WRAPPERS:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def eval_attr_json(opts: Options, eval_nix: Path, fields: list[str]) -> Any:  # noqa: ANN401
+    """Return *fields* of the output of *eval_nix* for ``opts.attribute``."""
+    path = wrapper_flake(opts, eval_nix, fields)
+    res = run(
+        [
+            "nix",
+            "eval",
+            "--raw",
+            "--no-write-lock-file",
+            f"path:{path}#nixUpdate.{opts.escaped_attribute}.{RESULT_ATTR}",
+            *opts.extra_flags,
+        ],
+    )
+    return json.loads(res.stdout)
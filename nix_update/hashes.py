@@ -2,31 +2,74 @@
 
 from __future__ import annotations
 
-from subprocess import run as subprocess_run
+import base64
+import binascii
 
-# Hash length constants for SRI format conversion
-MD5_HASH_LENGTH = 32
-SHA1_HASH_LENGTH = 40
+# Alphabet of Nix's base-32 encoding (no e, o, t, u)
+NIX32_CHARS = "0123456789abcdfghijklmnpqrsvwxyz"
+
+# Digest size in bytes of the hash types Nix supports
+HASH_SIZES = {"md5": 16, "sha1": 20, "sha256": 32, "sha512": 64}
+
+
+def nix32_length(size: int) -> int:
+    return (size * 8 - 1) // 5 + 1
+
+
+def nix32_decode(encoded: str, size: int) -> bytes:
+    """Decode Nix's base-32 encoding into a digest of *size* bytes.
+
+    Nix writes the digest as a little-endian number, most significant
+    digit first.
+    """
+    value = 0
+    for char in encoded:
+        digit = NIX32_CHARS.find(char)
+        if digit < 0:
+            msg = f"invalid character {char!r} in base-32 hash {encoded}"
+            raise ValueError(msg)
+        value = value * 32 + digit
+    try:
+        return value.to_bytes(size, "little")
+    except OverflowError:
+        msg = f"base-32 hash {encoded} does not fit {size} bytes"
+        raise ValueError(msg) from None
+
+
+def _encodings() -> dict[int, tuple[str, str]]:
+    encodings = {}
+    # Smaller hashes win on ambiguous lengths: a 32 character hash is md5
+    # in base-16, not sha1 in base-32.
+    for algo, size in sorted(HASH_SIZES.items(), key=lambda item: -item[1]):
+        encodings[len(base64.b64encode(bytes(size)))] = (algo, "base64")
+        encodings[nix32_length(size)] = (algo, "nix32")
+        encodings[size * 2] = (algo, "base16")
+    return encodings
+
+
+# Hash type and encoding for each length of a hash without type prefix
+ENCODINGS = _encodings()
 
 
 def to_sri(hashstr: str) -> str:
     """Convert a hash string to SRI format if needed."""
     if "-" in hashstr or ":" in hashstr:
         return hashstr
-    length = len(hashstr)
-    if length == MD5_HASH_LENGTH:
-        prefix = "md5:"
-    elif length == SHA1_HASH_LENGTH:
-        prefix = "sha1:"
-    else:
-        prefix = "sha256:"
-
-    cmd = ["nix", "--extra-experimental-features", "nix-command", "hash", "to-sri"]
-
-    res = subprocess_run(
-        [*cmd, f"{prefix}{hashstr}"],
-        capture_output=True,
-        text=True,
-        check=True,
-    )
-    return res.stdout.rstrip()
+    try:
+        algo, encoding = ENCODINGS[len(hashstr)]
+    except KeyError:
+        msg = f"cannot determine the hash type of {hashstr!r}"
+        raise ValueError(msg) from None
+
+    size = HASH_SIZES[algo]
+    try:
+        if encoding == "base16":
+            digest = bytes.fromhex(hashstr)
+        elif encoding == "nix32":
+            digest = nix32_decode(hashstr, size)
+        else:
+            digest = base64.b64decode(hashstr, validate=True)
+    except (ValueError, binascii.Error) as e:
+        msg = f"invalid {algo} hash {hashstr!r}: {e}"
+        raise ValueError(msg) from e
+    return f"{algo}-{base64.b64encode(digest).decode()}"
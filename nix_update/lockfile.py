@@ -2,19 +2,22 @@
 
 from __future__ import annotations
 
+import hashlib
 import shutil
 import tempfile
-import textwrap
+import threading
 from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
 from typing import TYPE_CHECKING
 
+from . import scheduler, source, worktree
 from .errors import UpdateError
+from .scheduler import Stage
 from .utils import run
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Collection, Iterator
 
     from .options import Options
 
@@ -26,7 +29,6 @@ class LockfileConfig:
     cmd: list[str]
     bin_name: str
     lockfile_name: str
-    extra_nix_override: str
 
 
 def get_lockfile_config(lockfile_type: str, metadata_path: str) -> LockfileConfig:
@@ -40,10 +42,6 @@ def get_lockfile_config(lockfile_type: str, metadata_path: str) -> LockfileConfi
             ],
             bin_name="cargo",
             lockfile_name="Cargo.lock",
-            extra_nix_override="""
-          cargoDeps = null;
-          cargoVendorDir = ".";
-        """,
         ),
         "npm": LockfileConfig(
             cmd=[
@@ -54,10 +52,6 @@ def get_lockfile_config(lockfile_type: str, metadata_path: str) -> LockfileConfi
             ],
             bin_name="npm",
             lockfile_name="package-lock.json",
-            extra_nix_override="""
-          npmDeps = null;
-          npmDepsHash = null;
-        """,
         ),
     }
 
@@ -68,56 +62,20 @@ def get_lockfile_config(lockfile_type: str, metadata_path: str) -> LockfileConfi
     return configs[lockfile_type]
 
 
+# shutil.copystat is patched globally, so concurrent copies must not interleave
+_COPYSTAT_LOCK = threading.Lock()
+
+
 @contextmanager
 def disable_copystat() -> Iterator[None]:
     """Temporarily disable shutil.copystat to avoid permission issues."""
-    _orig = shutil.copystat
-    shutil.copystat = lambda *_args, **_kwargs: None
-    try:
-        yield
-    finally:
-        shutil.copystat = _orig
-
-
-def build_source_with_tool(
-    opts: Options,
-    package_expr: str,
-    config: LockfileConfig,
-) -> Path:
-    """Build the source and extract the tool binary path."""
-    get_src_and_bin = textwrap.dedent(
-        f"""
-      {package_expr}.overrideAttrs (old: {{
-        {config.extra_nix_override}
-        postUnpack = ''
-          cp -pr --reflink=auto -- $sourceRoot $out
-          mkdir -p "$out/nix-support"
-          command -v {config.bin_name} > $out/nix-support/{config.bin_name}-bin || {{
-            echo "no {config.bin_name} executable found in native build inputs" >&2
-            exit 1
-          }}
-          exit
-        '';
-        outputs = [ "out" ];
-        separateDebugInfo = false;
-      }})
-    """,
-    )
-
-    res = run(
-        [
-            "nix",
-            "build",
-            "-L",
-            "--no-link",
-            "--impure",
-            "--print-out-paths",
-            "--expr",
-            get_src_and_bin,
-            *opts.extra_flags,
-        ],
-    )
-    return Path(res.stdout.strip())
+    with _COPYSTAT_LOCK:
+        _orig = shutil.copystat
+        shutil.copystat = lambda *_args, **_kwargs: None
+        try:
+            yield
+        finally:
+            shutil.copystat = _orig
 
 
 def resolve_lockfile_path(tempdir: str, metadata_path: str, lockfile_name: str) -> Path:
@@ -132,7 +90,6 @@ def generate_lockfile(
     opts: Options,
     filename: str,
     lockfile_type: str,
-    package_expr: str,
 ) -> None:
     """Generate a lockfile for the specified package.
 
@@ -140,12 +97,13 @@ def generate_lockfile(
         opts: Options for the update operation
         filename: Path to the package file being updated
         lockfile_type: Type of lockfile to generate ("cargo" or "npm")
-        package_expr: Nix expression to get the package
     """
     config = get_lockfile_config(lockfile_type, opts.lockfile_metadata_path)
-    src = build_source_with_tool(opts, package_expr, config)
 
-    with tempfile.TemporaryDirectory() as tempdir:
+    src = source.unpacked(opts)
+    bin_path = source.tool(opts, config.bin_name)
+
+    with scheduler.stage(Stage.LOCKFILE), tempfile.TemporaryDirectory() as tempdir:
         # Copy source to temp directory
         with disable_copystat():
             shutil.copytree(src, tempdir, dirs_exist_ok=True, copy_function=shutil.copy)
@@ -159,10 +117,6 @@ def generate_lockfile(
         if lockfile.exists():
             lockfile.chmod(lockfile.stat().st_mode | 0o200)
 
-        # Get tool binary path and run lockfile generation
-        bin_path = (
-            (src / "nix-support" / f"{config.bin_name}-bin").read_text().rstrip("\n")
-        )
         run([bin_path, *config.cmd], cwd=tempdir)
 
         # Find where the lockfile was generated
@@ -174,3 +128,38 @@ def generate_lockfile(
 
         # Copy lockfile to the package directory
         shutil.copy(lockfile, Path(filename).parent / config.lockfile_name)
+        worktree.record_change(Path(filename).parent / config.lockfile_name)
+
+
+# Lockfiles that fully determine a dependency hash, keyed by the Package
+# field holding that hash.  Go and Composer are missing on purpose: the
+# vendored Go modules also depend on the packages the source imports and on
+# the Go version, and the Composer autoloader scans the source tree.
+LOCKFILE_NAMES: dict[str, tuple[str, ...]] = {
+    "cargo_deps": ("Cargo.lock",),
+    "cargo_vendor_deps": ("Cargo.lock",),
+    "npm_deps": ("package-lock.json",),
+    "pnpm_deps": ("pnpm-lock.yaml",),
+    "yarn_deps": ("yarn.lock",),
+    "yarn_deps_old": ("yarn.lock",),
+}
+
+
+def lockfile_digest(src: Path, names: Collection[str]) -> str | None:
+    """Return a digest of all files called one of *names* in the source tree *src*.
+
+    Returns None if *src* is not a directory or contains none of the files.
+    """
+    if not src.is_dir():
+        return None
+    paths = sorted(path for path in src.rglob("*") if path.name in names)
+    digest = hashlib.sha256()
+    found = False
+    for path in paths:
+        if not path.is_file():
+            continue
+        found = True
+        content = path.read_bytes()
+        digest.update(f"{path.relative_to(src)}\0{len(content)}\0".encode())
+        digest.update(content)
+    return digest.hexdigest() if found else None
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import functools
 import json
 import subprocess
-from dataclasses import dataclass, field
+import threading
+from dataclasses import dataclass, field, replace
 from enum import Enum, auto
 from pathlib import Path
 from typing import Any
 
+from . import worktree
 from .errors import AttributePathError
 from .version.version import VersionPreference
 
@@ -128,6 +131,74 @@ def get_flake_store_path(import_path: str) -> str | None:
     return path
 
 
+@functools.cache
+def _git_dirs(import_path: str) -> tuple[Path, Path] | None:
+    """Return the git directory and the common git directory of *import_path*."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--absolute-git-dir", "--git-common-dir"],
+            cwd=import_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    git_dir, common_dir = result.stdout.splitlines()
+    return Path(git_dir), Path(import_path, common_dir)
+
+
+def _git_state(import_path: str) -> tuple[object, ...] | None:
+    """Return something that changes whenever HEAD or the git index change."""
+    dirs = _git_dirs(import_path)
+    if dirs is None:
+        return None
+    git_dir, common_dir = dirs
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+        index = (git_dir / "index").stat()
+    except OSError:
+        return None
+    ref: str | int | None = None
+    if head.startswith("ref: "):
+        ref_name = head.removeprefix("ref: ")
+        for ref_path in (git_dir / ref_name, common_dir / ref_name):
+            if ref_path.is_file():
+                ref = ref_path.read_text().strip()
+                break
+        else:
+            packed_refs = common_dir / "packed-refs"
+            ref = packed_refs.stat().st_mtime_ns if packed_refs.exists() else None
+    return (head, ref, index.st_mtime_ns, index.st_size)
+
+
+# Store copies of local flakes, keyed by import path, with the state of the
+# working tree they were made from
+_flake_store_paths: dict[str, tuple[object, str | None]] = {}
+_flake_store_paths_lock = threading.Lock()
+
+
+def cached_flake_store_path(import_path: str) -> str | None:
+    """Like ``get_flake_store_path``, but only copy the flake again after it changed.
+
+    A change is a new HEAD, a change to the git index or to an uncommitted
+    file.  Flakes outside of git repositories are always copied.
+    """
+    git_state = _git_state(import_path)
+    if git_state is None:
+        return get_flake_store_path(import_path)
+    # Taken before copying, so changes made during the copy are not missed
+    state = (git_state, worktree.stamp(import_path))
+    with _flake_store_paths_lock:
+        cached = _flake_store_paths.get(import_path)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    path = get_flake_store_path(import_path)
+    with _flake_store_paths_lock:
+        _flake_store_paths[import_path] = (state, path)
+    return path
+
+
 @dataclass
 class Options:
     attribute: str
@@ -152,40 +223,107 @@ class Options:
     review: bool = False
     format: bool = False
     system: str | None = None
+    # Further systems whose source hashes are updated as well
+    src_systems: list[str] = field(default_factory=list)
     generate_lockfile: bool = False
     lockfile_metadata_path: str = "."
     src_only: bool = False
     update_src: bool = True
+    skip_unchanged_lockfiles: bool = False
+    fast_src_prefetch: bool = False
+    eval_server: bool = False
+    flake_eval_cache: bool = False
+    attribute_index: bool = False
+    check_outdated: bool = False
+    # Check all packages of the sets in attributes, or of the top-level set
+    scan: bool = False
+    # Only scan the top-level packages in pkgs/by-name/<scan_shard>
+    scan_shard: str | None = None
     use_github_releases: bool = False
     github_releases_limit: int = 1000
     extra_flags: list[str] = field(default_factory=list)
     custom_deps: list[str] | None = None
+    # All attributes of a batch run; empty when a single attribute is updated
+    attributes: list[str] = field(default_factory=list)
+    # Concurrency limits of a batch run
+    fetch_jobs: int = 8
+    prefetch_jobs: int = 2
+    lockfile_jobs: int = 1
+    # Concurrent evaluations with --scan
+    scan_jobs: int = 4
 
     def __post_init__(self) -> None:
-        self.attribute_path = parse_attribute_path(self.attribute)
+        # Scanning without an attribute walks the top-level package set
+        self.attribute_path = (
+            []
+            if self.scan and not self.attribute
+            else parse_attribute_path(self.attribute)
+        )
         self.escaped_attribute = ".".join(map(json.dumps, self.attribute_path))
         self.escaped_import_path = json.dumps(self.import_path)
 
+    @property
+    def writes_commit_message(self) -> bool:
+        """Whether a commit message is committed, printed or written to a file."""
+        return (
+            self.commit
+            or self.print_commit_message
+            or self.write_commit_message is not None
+        )
+
+    def for_attribute(self, attribute: str) -> Options:
+        """Return a copy of these options for updating a single attribute."""
+        return replace(self, attribute=attribute, attributes=[])
+
+    def for_system(self, system: str) -> Options:
+        """Return a copy of these options for evaluating the package on *system*."""
+        extra_flags = []
+        flags = iter(self.extra_flags)
+        for flag in flags:
+            if flag == "--eval-system":
+                next(flags, None)
+                continue
+            extra_flags.append(flag)
+        return replace(
+            self,
+            system=system,
+            extra_flags=[*extra_flags, "--eval-system", system],
+        )
+
     def get_flake_import_path(self) -> str | None:
         """Get a fresh Nix store path for a local flake directory.
 
-        Always re-copies the flake so the store path reflects the current
-        on-disk content.  Returns *None* for non-flake packages or when
-        the import path is not a local directory.
+        The flake is copied again whenever the on-disk content changed, so
+        the store path always reflects it.  Returns *None* for non-flake
+        packages or when the import path is not a local directory.
         """
         if not self.flake or not Path(self.import_path).is_dir():
             return None
-        return get_flake_store_path(self.import_path)
-
-    def get_package(self) -> str:
-        """Get the Nix expression for the package."""
-        import_path_to_use = self.escaped_import_path
-        flake_store_path = self.get_flake_import_path()
-        if flake_store_path is not None:
-            import_path_to_use = json.dumps(flake_store_path)
+        return cached_flake_store_path(self.import_path)
 
+    def get_package_root(self) -> str:
+        """Get the Nix expression for the flake or package set holding the package."""
         if self.flake:
-            return f"(let flake = builtins.getFlake {import_path_to_use}; in flake.packages.${{builtins.currentSystem}}.{self.escaped_attribute} or flake.{self.escaped_attribute})"
+            import_path_to_use = self.escaped_import_path
+            flake_store_path = self.get_flake_import_path()
+            if flake_store_path is not None:
+                import_path_to_use = json.dumps(flake_store_path)
+            return f"(builtins.getFlake {import_path_to_use})"
         # Need to disable check meta for non-flake packages
-        disable_check_meta = f'(if (builtins.hasAttr "config" (builtins.functionArgs (import {self.escaped_import_path}))) then {{ config.checkMeta = false; overlays = []; }} else {{ }})'
-        return f"(import {self.escaped_import_path} {disable_check_meta}).{self.escaped_attribute}"
+        import_args = f'(if (builtins.hasAttr "config" (builtins.functionArgs (import {self.escaped_import_path}))) then {{ config.checkMeta = false; overlays = []; }} else {{ }})'
+        if self.system:
+            import_args = f'({import_args} // (if (builtins.hasAttr "system" (builtins.functionArgs (import {self.escaped_import_path}))) then {{ system = {json.dumps(self.system)}; }} else {{ }}))'
+        return f"(import {self.escaped_import_path} {import_args})"
+
+    def get_package_from_root(self, root: str) -> str:
+        """Get the Nix expression for the package in *root* (see ``get_package_root``)."""
+        if self.flake:
+            system = (
+                json.dumps(self.system) if self.system else "builtins.currentSystem"
+            )
+            return f"(let flake = {root}; in flake.packages.${{{system}}}.{self.escaped_attribute} or flake.{self.escaped_attribute})"
+        return f"{root}.{self.escaped_attribute}"
+
+    def get_package(self) -> str:
+        """Get the Nix expression for the package."""
+        return self.get_package_from_root(self.get_package_root())
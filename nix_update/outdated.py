@@ -0,0 +1,268 @@
+"""Report which packages are outdated, without changing any files."""
+
+from __future__ import annotations
+
+import itertools
+import json
+import re
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import attribute_index, scheduler
+from .errors import EvalError, UpdateError
+from .eval import ScanRecord, eval_attr, eval_attribute_names, eval_scan
+from .scheduler import Stage
+from .update import version_changed, version_fetch_config
+from .version import find_latest_version
+from .version.http import record_requests
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from concurrent.futures import Future
+
+    from .eval import Package
+    from .options import Options
+
+# Attributes evaluated by one nix-instantiate process with --scan
+SCAN_CHUNK_SIZE = 500
+PLAIN_ATTRIBUTE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_'-]*")
+
+
+@dataclass
+class OutdatedReport:
+    """One line of the ``--check-outdated`` output."""
+
+    attribute: str
+    old_version: str | None = None
+    new_version: str | None = None
+    outdated: bool | None = None
+    # Name of the fetcher that found the new version, e.g. "github"
+    fetcher: str | None = None
+    # "hit" if the package was taken from the attribute index, "miss" if it
+    # was evaluated instead, None without --attribute-index
+    index: str | None = None
+    # HTTP responses served from the cache after revalidation, and fetched
+    http_cached: int = 0
+    http_fetched: int = 0
+    # The evaluation may be shared by all packages of a batch run
+    eval_seconds: float = 0.0
+    fetch_seconds: float = 0.0
+    error: str | None = None
+
+
+def _check_package(
+    opts: Options,
+    package: Package | ScanRecord | None,
+    report: OutdatedReport,
+) -> None:
+    if package is None:
+        # Evaluating on its own reports the actual error
+        start = time.monotonic()
+        package = eval_attr(opts)
+        report.eval_seconds += time.monotonic() - start
+    report.old_version = package.old_version
+    if not package.old_version:
+        msg = "Could not find the version of the package"
+        raise UpdateError(msg)
+    if package.parsed_url is None:
+        msg = "Could not find a url in the derivations src attribute"
+        raise UpdateError(msg)
+
+    config = version_fetch_config(
+        opts,
+        package,
+        opts.version,
+        opts.version_preference,
+        opts.version_regex,
+    )
+    start = time.monotonic()
+    with scheduler.stage(Stage.FETCH), record_requests() as requests:
+        try:
+            package.new_version, report.fetcher = find_latest_version(
+                package.parsed_url,
+                config,
+            )
+        finally:
+            report.fetch_seconds = time.monotonic() - start
+            report.http_cached = requests.cached
+            report.http_fetched = requests.fetched
+    report.new_version = package.new_version.number
+    report.outdated = version_changed(package)
+
+
+def check_package(
+    opts: Options,
+    package: Package | ScanRecord | None,
+    report: OutdatedReport,
+) -> OutdatedReport:
+    """Look up the latest version of *package* and fill in *report*.
+
+    *package* is None if it was not evaluated yet.
+    """
+    try:
+        _check_package(opts, package, report)
+    except (UpdateError, ValueError, OSError, subprocess.CalledProcessError) as e:
+        report.error = str(e)
+    except Exception as e:  # noqa: BLE001
+        # e.g. unexpected JSON from a version fetcher; the other packages
+        # are still being checked
+        report.error = f"{type(e).__name__}: {e}"
+    return report
+
+
+def check_outdated(options: Options) -> bool:
+    """Print a JSON report line per attribute as soon as its latest version is known.
+
+    Only evaluates the packages and looks up their versions; no file is
+    changed and nothing is prefetched.  Returns whether all checks succeeded.
+    """
+    attribute_options = [
+        options.for_attribute(a) for a in options.attributes or [options.attribute]
+    ]
+    start = time.monotonic()
+    packages, indexed = attribute_index.eval_unindexed(options, attribute_options)
+    eval_seconds = time.monotonic() - start
+
+    reports = {}
+    for attribute_opts, package in zip(attribute_options, packages, strict=True):
+        attribute = attribute_opts.attribute
+        report = OutdatedReport(attribute)
+        if options.attribute_index:
+            report.index = "hit" if attribute in indexed else "miss"
+        if attribute not in indexed:
+            report.eval_seconds = eval_seconds
+        reports[attribute] = (attribute_opts, indexed.get(attribute, package), report)
+
+    ok = True
+    with ThreadPoolExecutor(max_workers=max(options.fetch_jobs, 1)) as executor:
+        futures = [executor.submit(check_package, *args) for args in reports.values()]
+        for future in as_completed(futures):
+            ok = print_report(future.result()) and ok
+    return ok
+
+
+def print_report(report: OutdatedReport) -> bool:
+    """Print *report* as a JSON line and return whether the check succeeded."""
+    print(json.dumps(asdict(report)), flush=True)
+    return report.error is None
+
+
+def _attribute_name(package_set: str, name: str) -> str:
+    if not PLAIN_ATTRIBUTE.fullmatch(name):
+        name = json.dumps(name)
+    return f"{package_set}.{name}" if package_set else name
+
+
+def scan_attributes(options: Options) -> list[str]:
+    """Return the attributes of the package sets or the by-name shard to scan."""
+    if options.scan_shard is not None:
+        shard = Path(options.import_path, "pkgs", "by-name", options.scan_shard)
+        if not shard.is_dir():
+            msg = f"{shard} does not exist"
+            raise UpdateError(msg)
+        return sorted(p.name for p in shard.iterdir() if p.is_dir())
+
+    attributes: list[str] = []
+    for package_set in options.attributes or [options.attribute]:
+        set_opts = options.for_attribute(package_set)
+        names = eval_attribute_names(set_opts, set_opts.attribute_path)
+        attributes.extend(_attribute_name(package_set, name) for name in names)
+    return attributes
+
+
+def _eval_chunk(
+    options: Options,
+    attributes: list[str],
+) -> list[ScanRecord | OutdatedReport]:
+    """Evaluate the records of *attributes*.
+
+    An error that ``builtins.tryEval`` cannot catch aborts the whole
+    evaluation, so the chunk is split in halves until the failing
+    attribute is found and reported.
+    """
+    try:
+        records = eval_scan(options, attributes)
+    except (subprocess.CalledProcessError, EvalError) as e:
+        if len(attributes) == 1:
+            stderr = (
+                e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)
+            )
+            lines = (stderr or "").strip().splitlines()
+            error = lines[-1].strip() if lines else str(e)
+            return [OutdatedReport(attributes[0], error=error)]
+        middle = len(attributes) // 2
+        return [
+            *_eval_chunk(options, attributes[:middle]),
+            *_eval_chunk(options, attributes[middle:]),
+        ]
+    return [record for record in records if record is not None]
+
+
+def _timed_eval_chunk(
+    options: Options,
+    attributes: list[str],
+) -> tuple[list[ScanRecord | OutdatedReport], float]:
+    start = time.monotonic()
+    results = _eval_chunk(options, attributes)
+    return results, time.monotonic() - start
+
+
+def _evaluate_chunks(
+    options: Options,
+    attributes: list[str],
+) -> Iterator[tuple[list[ScanRecord | OutdatedReport], float]]:
+    """Yield the records of each chunk of *attributes* as soon as it is evaluated.
+
+    No more than ``scan_jobs`` chunks are evaluated at a time, and the
+    evaluation of a further chunk only starts once another one finished.
+    """
+    chunks = (
+        attributes[i : i + SCAN_CHUNK_SIZE]
+        for i in range(0, len(attributes), SCAN_CHUNK_SIZE)
+    )
+    jobs = max(options.scan_jobs, 1)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {
+            executor.submit(_timed_eval_chunk, options, chunk)
+            for chunk in itertools.islice(chunks, jobs)
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for chunk in itertools.islice(chunks, 1):
+                    pending.add(executor.submit(_timed_eval_chunk, options, chunk))
+                yield future.result()
+
+
+def scan_outdated(options: Options) -> bool:
+    """Print a JSON report line for every package of a whole package set.
+
+    The attributes are evaluated in chunks by separate processes, and the
+    latest versions of a chunk are looked up while the next ones are still
+    evaluated.  Only a bounded number of chunks and lookups is in flight at
+    any time, so memory use does not grow with the size of the package set.
+    Returns whether all checks succeeded.
+    """
+    attributes = scan_attributes(options)
+    workers = max(options.fetch_jobs, 1)
+    ok = True
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: set[Future[OutdatedReport]] = set()
+        for results, eval_seconds in _evaluate_chunks(options, attributes):
+            for result in results:
+                if isinstance(result, OutdatedReport):
+                    ok = print_report(result) and ok
+                    continue
+                if len(pending) >= 4 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        ok = print_report(future.result()) and ok
+                report = OutdatedReport(result.attribute, eval_seconds=eval_seconds)
+                pending.add(executor.submit(check_package, options, result, report))
+        for future in as_completed(pending):
+            ok = print_report(future.result()) and ok
+    return ok
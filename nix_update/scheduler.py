@@ -0,0 +1,78 @@
+"""Concurrency limits for updating several packages at the same time."""
+
+from __future__ import annotations
+
+import threading
+from contextlib import ExitStack, contextmanager
+from enum import StrEnum, auto
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from contextlib import AbstractContextManager
+
+
+class Stage(StrEnum):
+    # HTTP requests to find the latest version
+    FETCH = auto()
+    # builds that compute fixed-output hashes
+    PREFETCH = auto()
+    # source builds that generate or read lockfiles
+    LOCKFILE = auto()
+    # git commands that modify the repository; always serialized
+    COMMIT = auto()
+
+
+class Scheduler:
+    def __init__(self, limits: dict[Stage, int] | None = None) -> None:
+        self._semaphores = {
+            stage: threading.BoundedSemaphore(max(limit, 1))
+            for stage, limit in (limits or {}).items()
+        }
+        self._semaphores[Stage.COMMIT] = threading.BoundedSemaphore(1)
+        self._path_locks: dict[str, threading.Lock] = {}
+        self._path_locks_lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage: Stage) -> Iterator[None]:
+        """Run the enclosed block within the concurrency limit of *stage*."""
+        semaphore = self._semaphores.get(stage)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+    @contextmanager
+    def lock_paths(self, paths: Iterable[str]) -> Iterator[None]:
+        """Hold an exclusive lock on each of *paths* for the enclosed block.
+
+        Locks are always taken in sorted order, so two callers with
+        overlapping paths cannot deadlock.
+        """
+        with self._path_locks_lock:
+            locks = [
+                self._path_locks.setdefault(path, threading.Lock())
+                for path in sorted(set(paths))
+            ]
+        with ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock)
+            yield
+
+
+# Unbounded until a batch run configures limits
+SCHEDULER = Scheduler()
+
+
+def configure(limits: dict[Stage, int]) -> None:
+    global SCHEDULER  # noqa: PLW0603
+    SCHEDULER = Scheduler(limits)
+
+
+def stage(name: Stage) -> AbstractContextManager[None]:
+    return SCHEDULER.stage(name)
+
+
+def lock_paths(paths: Iterable[str]) -> AbstractContextManager[None]:
+    return SCHEDULER.lock_paths(paths)
@@ -0,0 +1,142 @@
+"""Sources realised once per update and shared by all steps that read them."""
+
+from __future__ import annotations
+
+import tempfile
+import textwrap
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import evaluator, scheduler
+from .errors import UpdateError
+from .scheduler import Stage
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+    from .options import Options
+
+# Tools whose path is recorded in the unpacked source, for lockfile generation
+SOURCE_TOOLS = ("cargo", "npm")
+
+
+@dataclass
+class _Scope:
+    # Holds the GC roots of the realised paths
+    gc_roots: Path
+    paths: dict[str, Path] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_scopes: dict[tuple[object, ...], _Scope] = {}
+_scopes_lock = threading.Lock()
+
+
+def _scope_key(opts: Options) -> tuple[object, ...]:
+    # Not the package expression: for flakes it holds the store copy of the
+    # flake, which changes with every file written within the scope
+    return (opts.import_path, opts.flake, opts.attribute, opts.system)
+
+
+@contextmanager
+def scope(opts: Options) -> Iterator[None]:
+    """Share realised sources of the package between the steps in the block.
+
+    The package's nix file must not change the source within the block.
+    Outside of a scope every call realises the source again.
+    """
+    key = _scope_key(opts)
+    with tempfile.TemporaryDirectory() as gc_roots:
+        new_scope = _Scope(Path(gc_roots))
+        with _scopes_lock:
+            # Nested scopes share the outermost one
+            outermost = _scopes.setdefault(key, new_scope) is new_scope
+        try:
+            yield
+        finally:
+            if outermost:
+                with _scopes_lock:
+                    del _scopes[key]
+
+
+def _cached(opts: Options, kind: str, realise: Callable[[Path], Path]) -> Path:
+    with _scopes_lock:
+        current = _scopes.get(_scope_key(opts))
+    if current is None:
+        with tempfile.TemporaryDirectory() as gc_roots:
+            return realise(Path(gc_roots))
+    with current.lock:
+        if kind not in current.paths:
+            current.paths[kind] = realise(current.gc_roots)
+        return current.paths[kind]
+
+
+def _realise_src(opts: Options, gc_roots: Path) -> Path:
+    src = Path(evaluator.eval_json(opts, lambda package: f"toString ({package}.src)"))
+    # `src` might be a path like `./.`, which the evaluation already copied
+    # to the store; otherwise build the derivation (e.g. `fetchFromGitHub`)
+    if src.exists():
+        return src
+    drv = evaluator.instantiate(opts, lambda package: f"{package}.src")
+    return Path(evaluator.realise(opts, drv, gc_roots / "src")[0])
+
+
+def src(opts: Options) -> Path:
+    """Return the store path of the package's ``src``."""
+    return _cached(opts, "src", lambda gc_roots: _realise_src(opts, gc_roots))
+
+
+def _unpack_expr(package: str) -> str:
+    # Dependency vendoring is disabled, its hashes may not be up-to-date yet
+    return textwrap.dedent(
+        f"""
+      {package}.overrideAttrs (old: {{
+        cargoDeps = null;
+        cargoVendorDir = ".";
+        npmDeps = null;
+        npmDepsHash = null;
+        postUnpack = ''
+          cp -pr --reflink=auto -- $sourceRoot $out
+          mkdir -p "$out/nix-support"
+          echo -n "${{old.cargoRoot or "."}}" > $out/nix-support/cargo-root
+          for bin in {" ".join(SOURCE_TOOLS)}; do
+            command -v $bin > $out/nix-support/$bin-bin || true
+          done
+          exit
+        '';
+        outputs = [ "out" ];
+        separateDebugInfo = false;
+      }})
+    """,
+    )
+
+
+def _realise_unpacked(opts: Options, gc_roots: Path) -> Path:
+    drv = evaluator.instantiate(opts, _unpack_expr)
+    with scheduler.stage(Stage.LOCKFILE):
+        return Path(evaluator.realise(opts, drv, gc_roots / "unpacked")[0])
+
+
+def unpacked(opts: Options) -> Path:
+    """Return the unpacked (but not patched) source root of the package.
+
+    ``nix-support`` in the result holds the ``cargoRoot`` of the package and
+    the paths of the tools in ``SOURCE_TOOLS`` found in its build inputs.
+    """
+    return _cached(
+        opts,
+        "unpacked",
+        lambda gc_roots: _realise_unpacked(opts, gc_roots),
+    )
+
+
+def tool(opts: Options, name: str) -> str:
+    """Return the path of *name* (one of ``SOURCE_TOOLS``) in the package's build inputs."""
+    path = (unpacked(opts) / "nix-support" / f"{name}-bin").read_text().rstrip("\n")
+    if not path:
+        msg = f"no {name} executable found in native build inputs"
+        raise UpdateError(msg)
+    return path
@@ -0,0 +1,208 @@
+"""Prefetch plain file and tarball sources without building the package's src."""
+
+from __future__ import annotations
+
+import json
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+from . import scheduler
+from .dependency_hashes import nix_prefetch, nix_prefetch_with, replace_hash
+from .errors import UpdateError
+from .eval import FAST_SRC_PREFETCH_FIELDS, eval_attr
+from .scheduler import Stage
+from .utils import info, replace_version_number, run
+
+if TYPE_CHECKING:
+    from .eval import Package
+    from .options import Options
+
+# The end of the postFetch hook of fetchzip (and thereby fetchFromGitHub,
+# fetchFromGitLab, ...) with stripRoot and without any extra postFetch
+# steps.  That is exactly what `nix store prefetch-file --unpack` does.
+FETCHZIP_POST_FETCH_END = re.compile(
+    r'mv "\$unpackDir/\$fn" "\$out"\s+chmod 755 "\$out"\s*\Z',
+)
+
+
+def src_unpack(package: Package) -> bool | None:
+    """Whether the source is a plain fetchzip (True) or fetchurl (False) download.
+
+    Returns None for any other source, e.g. one with extra postFetch steps.
+    """
+    post_fetch = package.src_post_fetch or ""
+    if package.src_hash_mode == "flat" and not post_fetch.strip():
+        return False
+    if package.src_hash_mode == "recursive" and FETCHZIP_POST_FETCH_END.search(
+        post_fetch,
+    ):
+        return True
+    return None
+
+
+def new_src_url(package: Package) -> str | None:
+    """Compute the source URL of the new version the same way the version is replaced.
+
+    Returns None if the URL does not contain the old version or revision.
+    """
+    url = package.url or (package.urls[0] if package.urls else None)
+    if url is None or url.startswith("mirror://") or package.new_version is None:
+        return None
+
+    old_rev_tag = package.rev or package.tag
+    new_version = package.new_version.number.removeprefix("v")
+    new_url = url
+    if old_rev_tag is not None and package.new_version.rev:
+        new_url = new_url.replace(old_rev_tag, package.new_version.rev)
+    new_url = replace_version_number(new_url, package.old_version, new_version)
+
+    if new_url == url and new_version != package.old_version:
+        return None
+    return new_url
+
+
+def prefetch_file(opts: Options, url: str, name: str, *, unpack: bool) -> str | None:
+    """Add *url* to the store like fetchurl/fetchzip would and return its hash."""
+    with scheduler.stage(Stage.PREFETCH):
+        res = run(
+            [
+                "nix",
+                "store",
+                "prefetch-file",
+                "--json",
+                "--hash-type",
+                "sha256",
+                "--name",
+                name,
+                *(["--unpack"] if unpack else []),
+                url,
+                *opts.extra_flags,
+            ],
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+    if res.returncode != 0:
+        info(f"failed to prefetch {url}: {res.stderr.strip()}")
+        return None
+    return json.loads(res.stdout)["hash"]
+
+
+def fast_update_src_hash(opts: Options, package: Package) -> bool:
+    """Update the source hash by downloading the new source directly.
+
+    Returns False if the source is not a plain fetchurl or fetchzip download,
+    in which case the hash has to be prefetched by building ``src``.
+    """
+    unpack = src_unpack(package)
+    url = new_src_url(package)
+    if (
+        unpack is None
+        or url is None
+        or package.hash is None
+        or package.new_version is None
+    ):
+        return False
+    # fetchurl names the source after the file, which contains the version
+    name = replace_version_number(
+        package.src_name or "source",
+        package.old_version,
+        package.new_version.number.removeprefix("v"),
+    )
+    target_hash = prefetch_file(opts, url, name, unpack=unpack)
+    if target_hash is None:
+        return False
+    replace_hash(package.filename, package.hash, target_hash)
+    return True
+
+
+def _host_fetch_overrides(package: Package, *, unpack: bool) -> dict[str, Any]:
+    """Return the fetchurl attributes that fetch the source of *package* on this machine.
+
+    fetchurl resolves ``mirror://`` URLs itself, and fetchzip unpacks in
+    ``postFetch``, so the output is the same as on the system of *package*.
+    """
+    return {
+        "urls": package.urls or [package.url],
+        "postFetch": package.src_post_fetch or "",
+        "outputHashMode": package.src_hash_mode,
+        "downloadToTemp": unpack,
+    }
+
+
+def _system_src_hash(
+    opts: Options,
+    package: Package,
+    system: str,
+) -> tuple[str, str] | None:
+    """Return the old and the new source hash of the package on *system*.
+
+    Returns None if the package uses the same source on *system*.
+    """
+    system_opts = opts.for_system(system)
+    system_package = eval_attr(system_opts, list(FAST_SRC_PREFETCH_FIELDS))
+    if system_package.hash is None or system_package.hash == package.hash:
+        return None
+
+    url = system_package.url or (
+        system_package.urls[0] if system_package.urls else None
+    )
+    unpack = src_unpack(system_package)
+    target_hash = None
+    if unpack is not None and url is not None and not url.startswith("mirror://"):
+        target_hash = prefetch_file(
+            system_opts,
+            url,
+            system_package.src_name or "source",
+            unpack=unpack,
+        )
+    if target_hash is None and unpack is not None and url is not None:
+        # The source of another system is built by that system, so fetch it
+        # with the fetcher of this machine instead
+        target_hash = nix_prefetch_with(
+            opts,
+            "src",
+            _host_fetch_overrides(system_package, unpack=unpack),
+        )
+    if target_hash is None:
+        # Needs a builder for the system
+        target_hash = nix_prefetch(system_opts, "src")
+    return system_package.hash, target_hash
+
+
+def _try_system_src_hash(
+    opts: Options,
+    package: Package,
+    system: str,
+) -> tuple[str, str] | None:
+    try:
+        return _system_src_hash(opts, package, system)
+    except (UpdateError, subprocess.CalledProcessError) as e:
+        print(
+            f"warning: could not update the source hash for {system}: {e}",
+            file=sys.stderr,
+        )
+        return None
+
+
+def update_system_src_hashes(opts: Options, package: Package) -> None:
+    """Update the source hashes of the package on each of ``opts.src_systems``.
+
+    Must be called after the version was replaced.  Plain fetchurl and
+    fetchzip sources of all systems are fetched concurrently on this
+    machine.  A system whose source cannot be prefetched is reported and
+    skipped, so the hashes of the other systems are still updated.
+    """
+    with ThreadPoolExecutor(max_workers=len(opts.src_systems)) as executor:
+        hashes = list(
+            executor.map(
+                partial(_try_system_src_hash, opts, package),
+                opts.src_systems,
+            ),
+        )
+    for system_hashes in hashes:
+        if system_hashes is not None:
+            replace_hash(package.filename, *system_hashes)
@@ -1,23 +1,41 @@
 from __future__ import annotations
 
-import fileinput
 from copy import deepcopy
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-from .dependency_hashes import update_dependency_hashes, update_src_hash
+from . import attribute_index, scheduler, worktree
+from .dependency_hashes import (
+    instantiate_old_src,
+    update_dependency_hashes,
+    update_src_hash,
+)
 from .diff_urls import generate_diff_url
 from .errors import UpdateError
-from .eval import Package, eval_attr
+from .eval import Package, eval_attr, eval_revision
 from .git import old_version_from_git
+from .scheduler import Stage
+from .src_prefetch import fast_update_src_hash, update_system_src_hashes
 from .utils import info, run
 from .version import VersionFetchConfig, fetch_latest_version
 from .version.version import Version, VersionPreference
 
 if TYPE_CHECKING:
+    from .eval import ScanRecord
     from .options import Options
 
 
+def version_changed(package: Package | ScanRecord) -> bool:
+    """Whether ``package.new_version`` differs from the current version or revision."""
+    if package.new_version is None:
+        msg = "Package new_version is None, cannot compare versions"
+        raise ValueError(msg)
+    old_rev_tag = package.rev or package.tag
+    return package.old_version != package.new_version.number.removeprefix("v") or (
+        package.new_version.rev is not None and package.new_version.rev != old_rev_tag
+    )
+
+
 def replace_version(package: Package) -> bool:
     if package.new_version is None:
         msg = "Package new_version is None, cannot replace version"
@@ -27,9 +45,7 @@ def replace_version(package: Package) -> bool:
     new_version = package.new_version.number
     new_version = new_version.removeprefix("v")
 
-    changed = old_version != new_version or (
-        package.new_version.rev is not None and package.new_version.rev != old_rev_tag
-    )
+    changed = version_changed(package)
 
     if changed:
         info(f"Update {old_version} -> {new_version} in {package.filename}")
@@ -40,43 +56,40 @@ def replace_version(package: Package) -> bool:
                     if package.version_position.line == i:
                         version_string_in_version_declaration = old_version in line
                         break
-        with fileinput.FileInput(package.filename, inplace=True) as f:
-            for i, original_line in enumerate(f, 1):
-                modified_line = original_line
-                if old_rev_tag is not None and package.new_version.rev:
-                    modified_line = modified_line.replace(
-                        old_rev_tag,
-                        package.new_version.rev,
-                    )
-                if not version_string_in_version_declaration or (
-                    package.version_position is not None
-                    and package.version_position.line == i
-                ):
-                    modified_line = modified_line.replace(
-                        f'"{old_version}"',
-                        f'"{new_version}"',
-                    )
-                print(modified_line, end="")
+        path = Path(package.filename)
+        lines = path.read_text().splitlines(keepends=True)
+        for i, original_line in enumerate(lines, 1):
+            modified_line = original_line
+            if old_rev_tag is not None and package.new_version.rev:
+                modified_line = modified_line.replace(
+                    old_rev_tag,
+                    package.new_version.rev,
+                )
+            if not version_string_in_version_declaration or (
+                package.version_position is not None
+                and package.version_position.line == i
+            ):
+                modified_line = modified_line.replace(
+                    f'"{old_version}"',
+                    f'"{new_version}"',
+                )
+            lines[i - 1] = modified_line
+        path.write_text("".join(lines))
+        worktree.record_change(path)
     else:
         info(f"Not updating version, already {old_version}")
 
     return changed
 
 
-def fetch_new_version(
+def version_fetch_config(
     opts: Options,
-    package: Package,
+    package: Package | ScanRecord,
     version: str,
     preference: VersionPreference,
     version_regex: str,
-) -> Version:
-    if preference == VersionPreference.FIXED:
-        return Version(version)
-
-    if not package.parsed_url:
-        msg = "Could not find a url in the derivations src attribute"
-        raise UpdateError(msg)
-
+) -> VersionFetchConfig:
+    """Return how to look up the latest version of *package*."""
     version_prefix = ""
     branch = None
     old_rev_tag = package.rev or package.tag
@@ -94,7 +107,7 @@ def fetch_new_version(
             raise ValueError(msg)
         branch = version[7:]
 
-    config = VersionFetchConfig(
+    return VersionFetchConfig(
         preference=preference,
         version_regex=version_regex,
         branch=branch,
@@ -105,7 +118,25 @@ def fetch_new_version(
             "github_releases_limit": opts.github_releases_limit,
         },
     )
-    return fetch_latest_version(package.parsed_url, config)
+
+
+def fetch_new_version(
+    opts: Options,
+    package: Package,
+    version: str,
+    preference: VersionPreference,
+    version_regex: str,
+) -> Version:
+    if preference == VersionPreference.FIXED:
+        return Version(version)
+
+    if not package.parsed_url:
+        msg = "Could not find a url in the derivations src attribute"
+        raise UpdateError(msg)
+
+    config = version_fetch_config(opts, package, version, preference, version_regex)
+    with scheduler.stage(Stage.FETCH):
+        return fetch_latest_version(package.parsed_url, config)
 
 
 def update_version(
@@ -115,7 +146,14 @@ def update_version(
     preference: VersionPreference,
     version_regex: str,
 ) -> bool:
-    new_version = fetch_new_version(opts, package, version, preference, version_regex)
+    # Already fetched when the package was looked up in the attribute index
+    new_version = package.new_version or fetch_new_version(
+        opts,
+        package,
+        version,
+        preference,
+        version_regex,
+    )
     package.new_version = new_version
 
     position = package.version_position
@@ -194,20 +232,82 @@ def run_update_script(package: Package, opts: Options) -> None:
     )
 
 
-def update(opts: Options) -> Package:
+def _check_indexed_version(opts: Options) -> Package | None:
+    """Look up the package in the attribute index and fetch its latest version.
+
+    Returns None if the index cannot be used for *opts* or has no entry.
+    """
+    if (
+        not opts.attribute_index
+        or opts.version_preference in (VersionPreference.FIXED, VersionPreference.SKIP)
+        or opts.use_update_script
+        or opts.subpackages
+        # These act on the package even if it is up to date
+        or opts.build
+        or opts.test
+        or opts.review
+    ):
+        return None
+    package = attribute_index.lookup(opts)
+    # Without a source hash dependencies are updated even for the same version
+    if package is None or package.hash is None:
+        return None
+    package.new_version = fetch_new_version(
+        opts,
+        package,
+        opts.version,
+        opts.version_preference,
+        opts.version_regex,
+    )
+    return package
+
+
+def load_package(opts: Options) -> Package:
+    """Evaluate the package selected by *opts*, unless it is up to date.
+
+    With ``--attribute-index``, the latest version is looked up before
+    evaluating.  An up-to-date package is returned from the index, with only
+    the ``CORE_FIELDS`` and ``new_version`` set.
+    """
+    indexed = _check_indexed_version(opts)
+    if indexed is not None and not version_changed(indexed):
+        return indexed
     package = eval_attr(opts)
+    if opts.attribute_index:
+        attribute_index.store(opts, package)
+    if indexed is not None:
+        package.new_version = indexed.new_version
+    return package
+
+
+def update(opts: Options, package: Package | None = None) -> Package:
+    """Update the package selected by *opts*.
+
+    *package* may be passed in when the attribute was already evaluated,
+    e.g. as part of a batch evaluation.
+    """
+    if package is None:
+        package = load_package(opts)
+
+    if package.new_version is not None and not version_changed(package):
+        info(f"Not updating version, already {package.old_version}")
+        return package
 
     if package.has_update_script and opts.use_update_script:
         run_update_script(package, opts)
-        new_package = eval_attr(opts)
+        worktree.record_change(Path(package.filename).parent)
+        revision = eval_revision(opts)
         package.new_version = Version(
-            new_package.old_version,
-            rev=new_package.rev,
-            tag=new_package.tag,
+            revision.version,
+            rev=revision.rev,
+            tag=revision.tag,
         )
 
         return package
 
+    if opts.skip_unchanged_lockfiles and not opts.src_only:
+        instantiate_old_src(opts, package)
+
     update_hash = True
 
     if opts.version_preference != VersionPreference.SKIP:
@@ -219,7 +319,15 @@ def update(opts: Options) -> Package:
             opts.version_regex,
         )
 
-    if package.hash and update_hash and opts.update_src:
+    if package.hash and update_hash and opts.update_src and opts.src_systems:
+        update_system_src_hashes(opts, package)
+
+    if (
+        package.hash
+        and update_hash
+        and opts.update_src
+        and not (opts.fast_src_prefetch and fast_update_src_hash(opts, package))
+    ):
         update_src_hash(opts, package.filename, package.hash)
 
     if opts.subpackages:
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import re
 import shlex
 import subprocess
 import sys
@@ -75,3 +76,11 @@ def remove_control_chars(string: str) -> str:
     for a list of removed control characters
     """
     return "".join(char for char in string if unicodedata.category(char)[0] != "C")
+
+
+def replace_version_number(text: str, old: str, new: str) -> str:
+    """Replace the version *old* in *text* with *new*.
+
+    Does not replace 1.2 in 1.23 or 11.2.
+    """
+    return re.sub(rf"(?<![\d.]){re.escape(old)}(?!\.?\d)", new, text)
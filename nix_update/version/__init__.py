@@ -1,23 +1,24 @@
 from __future__ import annotations
 
+import contextvars
 import re
-from collections.abc import Callable
+from collections.abc import Callable, Generator
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from functools import cmp_to_key, partial
 from inspect import signature
 from typing import Any, Protocol, cast
 from urllib.parse import ParseResult
-from urllib.request import build_opener, install_opener
 
 from nix_update.errors import VersionError
 from nix_update.version_compare import version_compare
-from nix_update.version_info import VERSION
 
 from .bitbucket import fetch_bitbucket_snapshots, fetch_bitbucket_versions
 from .crate import fetch_crate_versions
-from .gitea import fetch_gitea_snapshots, fetch_gitea_versions
-from .github import fetch_github_snapshots, fetch_github_versions
-from .gitlab import fetch_gitlab_snapshots, fetch_gitlab_versions
+from .forge import ForgeType, get_forge_type
+from .gitea import KNOWN_GITEA_HOSTS, fetch_gitea_snapshots, fetch_gitea_versions
+from .github import GITHUB_PRIVATE, fetch_github_snapshots, fetch_github_versions
+from .gitlab import GITLAB_API, fetch_gitlab_snapshots, fetch_gitlab_versions
 from .npm import fetch_npm_snapshots, fetch_npm_versions
 from .pypi import fetch_pypi_versions
 from .rubygems import fetch_rubygem_versions
@@ -44,10 +45,6 @@ class VersionFetchConfig:
 #                return repo["version"]
 #    return None
 
-opener = build_opener()
-opener.addheaders = [("User-Agent", f"nix-update/{VERSION}")]
-install_opener(opener)
-
 
 class SnapshotFetcher(Protocol):
     def __call__(self, url: ParseResult, branch: str) -> list[Version]: ...
@@ -88,6 +85,103 @@ branch_snapshots_fetchers: list[SnapshotFetcher] = [
 ]
 
 
+# Fetchers that only claim URLs of these hosts. Fetchers not listed here
+# recognize their URLs by path on any host (GitHub Enterprise, self-hosted
+# GitLab) or, if listed in PROBE_FETCHERS, by sending requests to the host.
+FETCHER_HOSTS: dict[Callable[..., list[Version]], frozenset[str]] = {
+    fetch_crate_versions: frozenset({"crates.io", "static.crates.io"}),
+    fetch_npm_versions: frozenset({"registry.npmjs.org"}),
+    fetch_npm_snapshots: frozenset({"registry.npmjs.org"}),
+    fetch_pypi_versions: frozenset({"pypi"}),
+    fetch_rubygem_versions: frozenset({"rubygems.org"}),
+    fetch_savannah_versions: frozenset({"savannah"}),
+    fetch_sourcehut_versions: frozenset({"git.sr.ht"}),
+    fetch_sourcehut_snapshots: frozenset({"git.sr.ht"}),
+    fetch_bitbucket_versions: frozenset({"bitbucket.org", "bitbucket.io"}),
+    fetch_bitbucket_snapshots: frozenset({"bitbucket.org", "bitbucket.io"}),
+    fetch_gitea_versions: frozenset(KNOWN_GITEA_HOSTS),
+    fetch_gitea_snapshots: frozenset(KNOWN_GITEA_HOSTS),
+}
+PROBE_FETCHERS: dict[Callable[..., list[Version]], ForgeType] = {
+    fetch_gitea_versions: ForgeType.GITEA,
+    fetch_gitea_snapshots: ForgeType.GITEA,
+}
+# Hosts of the fetchers that recognize their URLs by path. The fetchers
+# still run for any host, but these hosts are never probed.
+PATH_FETCHER_HOSTS: dict[Callable[..., list[Version]], frozenset[str]] = {
+    fetch_github_versions: frozenset({"github.com", "api.github.com"}),
+    fetch_github_snapshots: frozenset({"github.com", "api.github.com"}),
+    fetch_gitlab_versions: frozenset({"gitlab.com"}),
+    fetch_gitlab_snapshots: frozenset({"gitlab.com"}),
+}
+# Hosts that are known to belong to one of the fetchers above
+KNOWN_HOSTS = frozenset().union(
+    *FETCHER_HOSTS.values(),
+    *PATH_FETCHER_HOSTS.values(),
+)
+
+
+def _path_fetcher_matches(url: ParseResult) -> bool:
+    """Whether *url* has a path only GitHub Enterprise or GitLab serves.
+
+    Archive URLs like ``/owner/repo/archive/v1.0.tar.gz`` are served by
+    Gitea as well, so those hosts still have to be probed.
+    """
+    return bool(GITHUB_PRIVATE.match(url.path) or GITLAB_API.match(url.geturl()))
+
+
+def route_fetchers(url: ParseResult, candidates: list) -> tuple[list, bool]:
+    """Select the fetchers that may claim *url*, keeping their order.
+
+    Also returns whether the host is unknown and has to be probed, in
+    which case the fetchers are best run concurrently.
+    """
+    known = url.netloc in KNOWN_HOSTS or _path_fetcher_matches(url)
+    # Self-hosted forges classified by an earlier probe
+    forge = None if known else get_forge_type(url.netloc)
+    routed = []
+    probing = False
+    for fetcher in candidates:
+        # Fetchers may be wrapped in (flattened) partials by prepare_fetchers
+        func = fetcher.func if isinstance(fetcher, partial) else fetcher
+        hosts = FETCHER_HOSTS.get(func)
+        if hosts is None or url.netloc in hosts:
+            routed.append(fetcher)
+        elif not known and func in PROBE_FETCHERS:
+            if forge is None:
+                routed.append(fetcher)
+                probing = True
+            elif forge == PROBE_FETCHERS[func]:
+                routed.append(fetcher)
+    return routed, probing
+
+
+def run_fetchers(
+    url: ParseResult,
+    used_fetchers: list,
+    *,
+    concurrent: bool,
+) -> Generator[list[Version]]:
+    """Yield the versions found by each fetcher, in the order of *used_fetchers*."""
+    if not concurrent or len(used_fetchers) < 2:  # noqa: PLR2004
+        for fetcher in used_fetchers:
+            yield fetcher(url)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=len(used_fetchers))
+    try:
+        # Requests of the probes count towards the caller's record_requests
+        futures = [
+            executor.submit(contextvars.copy_context().run, fetcher, url)
+            for fetcher in used_fetchers
+        ]
+        for future in futures:
+            yield future.result()
+    finally:
+        # Do not wait for probes whose answer is no longer needed
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def extract_version(version: Version, version_regex: str) -> Version | None:
     pattern = re.compile(version_regex)
     match = re.match(pattern, version.number)
@@ -157,16 +251,38 @@ def find_prefixed_version(
     return None
 
 
+def fetcher_name(fetcher: Callable[..., list[Version]]) -> str:
+    """Return a short name of *fetcher*, e.g. ``github`` for ``fetch_github_versions``."""
+    while isinstance(fetcher, partial):
+        fetcher = fetcher.func
+    name = getattr(fetcher, "__name__", repr(fetcher))
+    return (
+        name.removeprefix("fetch_")
+        .removesuffix("_versions")
+        .removesuffix(
+            "_snapshots",
+        )
+    )
+
+
 def fetch_latest_version(
     url: ParseResult,
     config: VersionFetchConfig,
 ) -> Version:
-    used_fetchers = prepare_fetchers(config)
+    return find_latest_version(url, config)[0]
+
+
+def find_latest_version(
+    url: ParseResult,
+    config: VersionFetchConfig,
+) -> tuple[Version, str]:
+    """Like ``fetch_latest_version``, but also return the name of the fetcher that found it."""
+    used_fetchers, probing = route_fetchers(url, prepare_fetchers(config))
     all_unstable: list[str] = []
     all_filtered: list[str] = []
 
-    for fetcher in used_fetchers:
-        versions = fetcher(url)
+    results = run_fetchers(url, used_fetchers, concurrent=probing)
+    for fetcher, versions in zip(used_fetchers, results, strict=False):
         if not versions:
             continue
 
@@ -197,10 +313,11 @@ def fetch_latest_version(
                     lambda a, b: version_compare(b.number, a.number),
                 ),
             )
+            results.close()
             prefixed_version = find_prefixed_version(final, config)
             if prefixed_version is not None:
-                return prefixed_version
-            return final[0]
+                return prefixed_version, fetcher_name(fetcher)
+            return final[0], fetcher_name(fetcher)
 
     if all_filtered:
         raise VersionError(
@@ -0,0 +1,60 @@
+"""Which forge software a self-hosted host runs, remembered across runs."""
+
+from __future__ import annotations
+
+import threading
+import time
+from enum import StrEnum, auto
+
+from nix_update.cache import DiskCache
+
+POSITIVE_TTL = 30 * 24 * 60 * 60
+# A host that is not a known forge may still be migrated to one
+NEGATIVE_TTL = 24 * 60 * 60
+
+FORGE_CACHE = DiskCache("forges", ttl=POSITIVE_TTL)
+
+
+class ForgeType(StrEnum):
+    # Also covers Forgejo, which implements the same API
+    GITEA = auto()
+    GITLAB = auto()
+    # Probed, but none of the above
+    UNKNOWN = auto()
+
+
+_forges: dict[str, ForgeType] = {}
+_host_locks: dict[str, threading.Lock] = {}
+_host_locks_lock = threading.Lock()
+
+
+def get_forge_type(host: str) -> ForgeType | None:
+    """Return the cached classification of *host*, if there is a current one."""
+    if (forge := _forges.get(host)) is not None:
+        return forge
+    entry = FORGE_CACHE.get(host)
+    if entry is None:
+        return None
+    try:
+        forge = ForgeType(entry["forge"])
+        if forge == ForgeType.UNKNOWN and time.time() - entry["time"] > NEGATIVE_TTL:
+            return None
+    except (KeyError, TypeError, ValueError):
+        return None
+    _forges[host] = forge
+    return forge
+
+
+def set_forge_type(host: str, forge: ForgeType, *, persist: bool = True) -> None:
+    """Classify *host*, for later runs as well unless *persist* is false."""
+    if _forges.get(host) == forge:
+        return
+    _forges[host] = forge
+    if persist:
+        FORGE_CACHE.set(host, {"forge": forge, "time": time.time()})
+
+
+def probe_lock(host: str) -> threading.Lock:
+    """Lock to hold while probing *host*, so concurrent updates probe it only once."""
+    with _host_locks_lock:
+        return _host_locks.setdefault(host, threading.Lock())
@@ -3,38 +3,53 @@ from __future__ import annotations
 import re
 from http import HTTPStatus
 from typing import TYPE_CHECKING
-from urllib import request
-from urllib.error import URLError
+from urllib.error import HTTPError
 
-from .http import DEFAULT_TIMEOUT, fetch_json
+from .forge import ForgeType, get_forge_type, probe_lock, set_forge_type
+from .http import fetch_json, urlopen
 from .version import Version
 
 if TYPE_CHECKING:
     from urllib.parse import ParseResult
-    from urllib.request import Request
 
 KNOWN_GITEA_HOSTS = ["codeberg.org", "gitea.com", "akkoma.dev"]
 
-
-# do not follow UI login redirects
-class NoRedirect(request.HTTPRedirectHandler):
-    def redirect_request(self, *_args: object) -> Request | None:
-        return None
-
-
-OPENER = request.build_opener(NoRedirect)
+# Unreachable hosts should not hold up the update for long
+PROBE_TIMEOUT = 10
 
 
 def is_gitea_host(host: str) -> bool:
     if host in KNOWN_GITEA_HOSTS:
         return True
+    if (forge := get_forge_type(host)) is not None:
+        return forge == ForgeType.GITEA
+    with probe_lock(host):
+        # Another thread may have probed the host in the meantime
+        if (forge := get_forge_type(host)) is not None:
+            return forge == ForgeType.GITEA
+        is_gitea = _probe_gitea(host)
+        forge = ForgeType.GITEA if is_gitea else ForgeType.UNKNOWN
+        # A host that did not answer is only skipped for this run
+        set_forge_type(host, forge, persist=is_gitea is not None)
+        return forge == ForgeType.GITEA
+
+
+def _probe_gitea(host: str) -> bool | None:
+    """Return whether *host* runs Gitea, or None if it did not tell."""
     endpoint = f"https://{host}/api/v1/settings/api"
     try:
-        resp = OPENER.open(endpoint, timeout=DEFAULT_TIMEOUT)
-    except URLError:
-        return False
-    else:
-        return resp.status == HTTPStatus.OK
+        # do not follow UI login redirects
+        with urlopen(endpoint, PROBE_TIMEOUT, follow_redirects=False) as resp:
+            resp.read()
+            return resp.status == HTTPStatus.OK
+    except HTTPError as e:
+        # Server errors and rate limits may be temporary
+        if e.code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            return None
+        return None if e.code == HTTPStatus.TOO_MANY_REQUESTS else False
+    except OSError:
+        # Timeouts and unreachable hosts
+        return None
 
 
 def fetch_gitea_versions(url: ParseResult) -> list[Version]:
@@ -1,23 +1,26 @@
 from __future__ import annotations
 
-import base64
+import contextvars
 import json
-import netrc
 import os
 import re
 import urllib.request
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from urllib.parse import ParseResult, unquote, urlparse
 from xml.etree.ElementTree import Element, ParseError
 
 from nix_update.errors import VersionError
 from nix_update.utils import info, remove_control_chars
 
-from .http import DEFAULT_TIMEOUT
+from .http import Response, auth_headers, fetch
 from .version import Version
 
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
 # https://github.com/NixOS/nixpkgs/blob/13ae608185b2430ebffc8b181fa9a854cd241007/pkgs/build-support/fetchgithub/default.nix#L133-L143
 GITHUB_PUBLIC = re.compile(
     r"^/(?P<owner>[^~]+?)/(?P<repo>.+?)(\.git)?/archive/(?P<revWithTag>.+).tar.gz$",
@@ -42,30 +45,10 @@ def version_from_entry(entry: Element) -> Version:
     return Version(unquote(url.path.split("/")[-1]))
 
 
-def _dorequest(
-    url: ParseResult,
-    feed_url: str,
-    extra_headers: dict[str, str] | None = None,
-) -> bytes | None:
-    request = urllib.request.Request(feed_url, headers=extra_headers or {})
-
-    try:
-        netrccreds = netrc.netrc().authenticators(url.netloc)
-        if netrccreds is not None:
-            info("using netrc file")
-            encoded = f"{netrccreds[0]}:{netrccreds[2]}".encode()
-            encodedcreds = base64.b64encode(encoded).decode()
-            request.add_header("Authorization", f"Basic {encodedcreds}")
-    except FileNotFoundError:
-        pass
-    except netrc.NetrcParseError:
-        info(
-            "unable to parse netrc file, please verify content / owner-only permissions (chmod 600)",
-        )
-
+def _dorequest(feed_url: str, netrc_host: str) -> Response | None:
+    headers = auth_headers(feed_url, netrc_host=netrc_host)
     try:
-        with urllib.request.urlopen(request, timeout=DEFAULT_TIMEOUT) as response:
-            return response.read()
+        return fetch(urllib.request.Request(feed_url, headers=headers))
     except urllib.error.HTTPError as e:
         if e.code == HTTPStatus.NOT_FOUND:
             info(f"HTTP 404: {feed_url} not found")
@@ -73,27 +56,160 @@ def _dorequest(
         raise
 
 
-def fetch_github_versions(
-    url: ParseResult,
-    extra_args: dict[str, Any] | None = None,
-) -> list[Version]:
+def _owner_repo(url: ParseResult) -> tuple[str, str] | None:
     urlmatch = (
         GITHUB_PUBLIC.match(url.path)
         or GITHUB_PRIVATE.match(url.path)
         or (url.netloc == "github.com" and GITHUB_PUBLIC_GENERAL.match(url.path))
     )
     if not urlmatch:
+        return None
+    return urlmatch.group("owner"), urlmatch.group("repo")
+
+
+def fetch_github_versions(
+    url: ParseResult,
+    extra_args: dict[str, Any] | None = None,
+) -> list[Version]:
+    owner_repo = _owner_repo(url)
+    if owner_repo is None:
         return []
-    owner, repo = urlmatch.group("owner"), urlmatch.group("repo")
+    return _fetch_versions(url, *owner_repo, extra_args)
+
+
+def _fetch_versions(
+    url: ParseResult,
+    owner: str,
+    repo: str,
+    extra_args: dict[str, Any] | None,
+) -> list[Version]:
     if extra_args is not None and extra_args.get("use_github_releases"):
         limit = extra_args.get("github_releases_limit", DEFAULT_RELEASES_LIMIT)
         return fetch_github_versions_from_releases(url, owner, repo, limit)
+    if _use_graphql(url):
+        versions = fetch_github_versions_from_graphql(owner, repo)
+        if versions is not None:
+            return versions
     return fetch_github_versions_from_feed(url, owner, repo)
 
 
+GRAPHQL_URL = "https://api.github.com/graphql"
+# Repositories per GraphQL query when prefetching for a batch run
+GRAPHQL_BATCH_SIZE = 20
+GRAPHQL_FRAGMENT = """
+fragment versions on Repository {
+  releases(first: 100, orderBy: {field: CREATED_AT, direction: DESC}) {
+    nodes { tagName isPrerelease isDraft }
+  }
+  refs(refPrefix: "refs/tags/", first: 100, orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) {
+    nodes { name }
+  }
+}
+"""
+
+# Versions per (owner, repo) from GraphQL queries made during this run
+_graphql_versions: dict[tuple[str, str], list[Version]] = {}
+
+
+def _use_graphql(url: ParseResult) -> bool:
+    # The GraphQL API requires authentication
+    return url.netloc in {"github.com", "api.github.com"} and bool(
+        os.environ.get("GITHUB_TOKEN"),
+    )
+
+
+def _graphql_key(owner: str, repo: str) -> tuple[str, str]:
+    return owner.lower(), repo.lower()
+
+
+def _versions_from_graphql(repository: dict[str, Any]) -> list[Version]:
+    versions = [
+        Version(release["tagName"], prerelease=release["isPrerelease"])
+        for release in repository["releases"]["nodes"]
+        if not release["isDraft"]
+    ]
+    # Tags without a release carry no prerelease flag
+    released = {version.number for version in versions}
+    versions.extend(
+        Version(tag["name"])
+        for tag in repository["refs"]["nodes"]
+        if tag["name"] not in released
+    )
+    return versions
+
+
+def _query_graphql(repos: list[tuple[str, str]]) -> None:
+    """Query the releases and tags of several repositories with one request."""
+    selections = "\n".join(
+        f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(repo)}) {{ ...versions }}"
+        for i, (owner, repo) in enumerate(repos)
+    )
+    query = f"query {{\n{selections}\n}}\n{GRAPHQL_FRAGMENT}"
+    request = urllib.request.Request(
+        GRAPHQL_URL,
+        data=json.dumps({"query": query}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    info(f"fetch {GRAPHQL_URL} ({', '.join(f'{o}/{r}' for o, r in repos)})")
+    try:
+        data = json.loads(fetch(request).body)["data"]
+        for i, (owner, repo) in enumerate(repos):
+            # Missing repositories are left to the feed, which reports them
+            if (repository := data.get(f"r{i}")) is not None:
+                key = _graphql_key(owner, repo)
+                _graphql_versions[key] = _versions_from_graphql(repository)
+    except (urllib.error.URLError, ValueError, KeyError, TypeError) as e:
+        info(f"GitHub GraphQL request failed ({e}), falling back to the release feed")
+
+
+def fetch_github_versions_from_graphql(owner: str, repo: str) -> list[Version] | None:
+    """Return releases and tags of a repository, or None if the query failed."""
+    key = _graphql_key(owner, repo)
+    if key not in _graphql_versions:
+        _query_graphql([(owner, repo)])
+    return _graphql_versions.get(key)
+
+
+def prefetch_github_versions(urls: Iterable[ParseResult]) -> None:
+    """Query the versions of many repositories up front with batched GraphQL queries."""
+    repos: dict[tuple[str, str], tuple[str, str]] = {}
+    for url in urls:
+        if not _use_graphql(url) or (owner_repo := _owner_repo(url)) is None:
+            continue
+        key = _graphql_key(*owner_repo)
+        if key not in _graphql_versions:
+            repos.setdefault(key, owner_repo)
+
+    pending = list(repos.values())
+    for start in range(0, len(pending), GRAPHQL_BATCH_SIZE):
+        _query_graphql(pending[start : start + GRAPHQL_BATCH_SIZE])
+
+
 # Bounds API usage on repos with thousands of releases.
 DEFAULT_RELEASES_LIMIT = 1000
 RELEASES_PER_PAGE = 100
+# Release pages fetched at the same time once the number of pages is known
+RELEASES_FETCH_JOBS = 4
+
+LAST_PAGE = re.compile(r'<[^>]*[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+
+def _fetch_releases_page(
+    url: ParseResult,
+    api_base: str,
+    page: int,
+) -> tuple[list[Version], Response] | None:
+    github_url = f"{api_base}/releases?per_page={RELEASES_PER_PAGE}&page={page}"
+    info(f"fetch {github_url}")
+    resp = _dorequest(github_url, url.netloc)
+    if resp is None:
+        return None
+    try:
+        releases = json.loads(resp.body)
+    except json.JSONDecodeError:
+        info("unable to parse github response, ignoring")
+        return None
+    return [Version(r["tag_name"], r["prerelease"]) for r in releases], resp
 
 
 def fetch_github_versions_from_releases(
@@ -106,26 +222,49 @@ def fetch_github_versions_from_releases(
     if url.netloc not in {"github.com", "api.github.com"}:
         api_base = f"https://{url.netloc}/api/v3/repos/{owner}/{repo}"
 
-    token = os.environ.get("GITHUB_TOKEN")
-    extra_headers = {} if token is None else {"Authorization": f"Bearer {token}"}
-
     # Releases are ordered by creation date, not version, so the wanted
     # release can sit on any page.
-    versions: list[Version] = []
-    page = 1
+    first = _fetch_releases_page(url, api_base, 1)
+    if first is None:
+        return []
+    versions, resp = first
+    if len(versions) < RELEASES_PER_PAGE:
+        return versions
+
+    max_pages = -(-limit // RELEASES_PER_PAGE)
+    last_page = LAST_PAGE.search(resp.headers.get("Link", ""))
+    if last_page is not None:
+        # The first page tells us how many pages there are, fetch the rest
+        # at once. Results are kept in page order and stop at the first
+        # page that could not be fetched, like the sequential walk below.
+        # The workers run in copies of this context so their requests are
+        # counted by record_requests.
+        pages = range(2, min(int(last_page[1]), max_pages) + 1)
+        with ThreadPoolExecutor(max_workers=RELEASES_FETCH_JOBS) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    _fetch_releases_page,
+                    url,
+                    api_base,
+                    page,
+                )
+                for page in pages
+            ]
+            for future in futures:
+                result = future.result()
+                if result is None:
+                    break
+                versions.extend(result[0])
+        return versions
+
+    page = 2
     while len(versions) < limit:
-        github_url = f"{api_base}/releases?per_page={RELEASES_PER_PAGE}&page={page}"
-        info(f"fetch {github_url}")
-        resp = _dorequest(url, github_url, extra_headers)
-        if resp is None:
-            break
-        try:
-            releases = json.loads(resp)
-        except json.JSONDecodeError:
-            info("unable to parse github response, ignoring")
+        result = _fetch_releases_page(url, api_base, page)
+        if result is None:
             break
-        versions.extend(Version(r["tag_name"], r["prerelease"]) for r in releases)
-        if len(releases) < RELEASES_PER_PAGE:
+        versions.extend(result[0])
+        if len(result[0]) < RELEASES_PER_PAGE:
             break
         page += 1
     return versions
@@ -143,10 +282,10 @@ def fetch_github_versions_from_feed(
     # TODO fallback to tags?
     feed_url = f"https://{server}/{owner}/{repo}/releases.atom"
     info(f"fetch {feed_url}")
-    resp = _dorequest(url, feed_url)
+    resp = _dorequest(feed_url, url.netloc)
     if resp is None:
         return []
-    text = remove_control_chars(resp.decode())
+    text = remove_control_chars(resp.body.decode())
     try:
         tree = ET.fromstring(text)
     except ParseError:
@@ -161,24 +300,20 @@ def fetch_github_snapshots(
     branch: str,
     extra_args: dict[str, Any] | None = None,
 ) -> list[Version]:
-    urlmatch = (
-        GITHUB_PUBLIC.match(url.path)
-        or GITHUB_PRIVATE.match(url.path)
-        or (url.netloc == "github.com" and GITHUB_PUBLIC_GENERAL.match(url.path))
-    )
-    if not urlmatch:
+    owner_repo = _owner_repo(url)
+    if owner_repo is None:
         return []
     server = url.netloc
     # unfortunately github requires this if condition
     if url.netloc == "api.github.com":
         server = "github.com"
-    owner, repo = urlmatch.group("owner"), urlmatch.group("repo")
+    owner, repo = owner_repo
     feed_url = f"https://{server}/{owner}/{repo}/commits/{branch}.atom"
     info(f"fetch {feed_url}")
-    resp = _dorequest(url, feed_url)
+    resp = _dorequest(feed_url, url.netloc)
     if resp is None:
         return []
-    text = remove_control_chars(resp.decode())
+    text = remove_control_chars(resp.body.decode())
     try:
         tree = ET.fromstring(text)
     except ParseError:
@@ -186,12 +321,7 @@ def fetch_github_snapshots(
         return []
     commits = tree.findall(".//{http://www.w3.org/2005/Atom}entry")
 
-    version_fetcher = (
-        fetch_github_versions_from_releases
-        if extra_args is not None and extra_args.get("use_github_releases")
-        else fetch_github_versions_from_feed
-    )
-    versions = version_fetcher(url, owner, repo)
+    versions = _fetch_versions(url, owner, repo, extra_args)
     version_numbers = [version.number for version in versions] + ["0"]
 
     for entry in commits:
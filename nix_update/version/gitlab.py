@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import os
 import re
 from datetime import datetime
 from urllib.parse import ParseResult, quote_plus
@@ -8,6 +7,7 @@ from urllib.parse import ParseResult, quote_plus
 from nix_update.errors import VersionError
 from nix_update.utils import info
 
+from .forge import ForgeType, set_forge_type
 from .http import fetch_json
 from .version import Version
 
@@ -16,11 +16,6 @@ GITLAB_API = re.compile(
 )
 
 
-def gitlab_headers() -> dict[str, str]:
-    token = os.environ.get("GITLAB_TOKEN")
-    return {} if token is None else {"Authorization": f"Bearer {token}"}
-
-
 def fetch_gitlab_versions(url: ParseResult) -> list[Version]:
     match = GITLAB_API.match(url.geturl())
     if not match:
@@ -29,7 +24,8 @@ def fetch_gitlab_versions(url: ParseResult) -> list[Version]:
     project_id = match.group("project_id")
     gitlab_url = f"https://{domain}/api/v4/projects/{project_id}/repository/tags"
     info(f"fetch {gitlab_url}")
-    json_tags = fetch_json(gitlab_url, headers=gitlab_headers())
+    json_tags = fetch_json(gitlab_url)
+    set_forge_type(domain, ForgeType.GITLAB)
     if len(json_tags) == 0:
         msg = "No git tags found"
         raise VersionError(msg)
@@ -59,7 +55,7 @@ def fetch_gitlab_snapshots(url: ParseResult, branch: str) -> list[Version]:
     project_id = match.group("project_id")
     gitlab_url = f"https://{domain}/api/v4/projects/{project_id}/repository/commits?ref_name={quote_plus(branch)}"
     info(f"fetch {gitlab_url}")
-    commits = fetch_json(gitlab_url, headers=gitlab_headers())
+    commits = fetch_json(gitlab_url)
 
     try:
         versions = fetch_gitlab_versions(url)
@@ -2,16 +2,328 @@
 
 from __future__ import annotations
 
+import base64
+import contextvars
+import functools
+import http.client
 import json
-from typing import TYPE_CHECKING
-from urllib.request import Request, urlopen
+import netrc
+import os
+import threading
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import TYPE_CHECKING, cast
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request
+
+from nix_update.cache import DiskCache
+from nix_update.utils import info
+from nix_update.version_info import VERSION
 
 if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
     from typing import Any
 
 # Default timeout for HTTP requests in seconds
 DEFAULT_TIMEOUT = 60
 
+# Idle keep-alive connections kept per host
+MAX_IDLE_CONNECTIONS = 8
+
+# Responses are always revalidated, the TTL only bounds how long an
+# unused response is kept on disk.
+HTTP_CACHE = DiskCache("http", ttl=30 * 24 * 60 * 60)
+
+# Response headers kept for revalidation and pagination
+CACHED_HEADERS = ("ETag", "Last-Modified", "Link")
+
+
+class ConnectionPool:
+    """Idle keep-alive connections, keyed by scheme and host."""
+
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS) -> None:
+        self.max_idle = max_idle
+        self._idle: dict[tuple[str, str], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str]) -> http.client.HTTPConnection | None:
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def put(self, key: tuple[str, str], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+class PooledResponse(http.client.HTTPResponse):
+    # Called with True once the body was read completely and the
+    # connection can be reused, with False otherwise.
+    release: Callable[[bool], None] | None = None
+
+    def close(self) -> None:
+        reusable = self.fp is None and not self.will_close
+        super().close()
+        if self.release is not None:
+            release, self.release = self.release, None
+            release(reusable)
+
+
+class PooledHTTPHandler(urllib.request.BaseHandler):
+    """Reuse connections for plain (non-proxied) HTTP and HTTPS requests."""
+
+    # Run before the default HTTP(S)Handler, which handles everything we
+    # leave alone by returning None.
+    handler_order = 400
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self.pool = pool
+
+    def http_open(self, req: Request) -> http.client.HTTPResponse | None:
+        return self._open(req, "http", http.client.HTTPConnection)
+
+    def https_open(self, req: Request) -> http.client.HTTPResponse | None:
+        return self._open(req, "https", http.client.HTTPSConnection)
+
+    def _open(
+        self,
+        req: Request,
+        scheme: str,
+        connection_class: type[http.client.HTTPConnection],
+    ) -> http.client.HTTPResponse | None:
+        # Requests through a proxy have their host rewritten
+        if req.host != urlsplit(req.full_url).netloc:
+            return None
+
+        key = (scheme, req.host)
+        headers = {**req.unredirected_hdrs, **req.headers}
+        headers = {name.title(): value for name, value in headers.items()}
+        headers["Connection"] = "keep-alive"
+        timeout = getattr(req, "timeout", DEFAULT_TIMEOUT)
+
+        while True:
+            conn = self.pool.get(key)
+            reused = conn is not None
+            if conn is None:
+                conn = connection_class(req.host, timeout=timeout)
+                conn.response_class = PooledResponse
+            else:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+            try:
+                conn.request(req.get_method(), req.selector, req.data, headers)
+                resp = cast("PooledResponse", conn.getresponse())
+            except (http.client.RemoteDisconnected, ConnectionError) as e:
+                conn.close()
+                # The server closed an idle connection, retry on a new one
+                if reused:
+                    continue
+                raise URLError(e) from e
+            except OSError as e:
+                conn.close()
+                raise URLError(e) from e
+            break
+
+        resp.release = lambda reusable: (
+            self.pool.put(key, conn) if reusable else conn.close()
+        )
+        resp.url = req.get_full_url()
+        resp.msg = resp.reason  # type: ignore[assignment]
+        return resp
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *_args: object) -> Request | None:
+        return None
+
+
+POOL = ConnectionPool()
+
+
+def _build_opener(
+    *handlers: urllib.request.BaseHandler,
+) -> urllib.request.OpenerDirector:
+    opener = urllib.request.build_opener(PooledHTTPHandler(POOL), *handlers)
+    opener.addheaders = [("User-Agent", f"nix-update/{VERSION}")]
+    return opener
+
+
+OPENER = _build_opener()
+# Does not follow redirects, e.g. to UI login pages
+NO_REDIRECT_OPENER = _build_opener(NoRedirect())
+
+
+@functools.cache
+def _netrc() -> netrc.netrc | None:
+    try:
+        return netrc.netrc()
+    except OSError:
+        return None
+    except netrc.NetrcParseError:
+        info(
+            "unable to parse netrc file, please verify content / owner-only permissions (chmod 600)",
+        )
+        return None
+
+
+@functools.cache
+def _netrc_auth(host: str) -> str | None:
+    parsed = _netrc()
+    credentials = None if parsed is None else parsed.authenticators(host)
+    if credentials is None:
+        return None
+    info("using netrc file")
+    encoded = f"{credentials[0]}:{credentials[2]}".encode()
+    return f"Basic {base64.b64encode(encoded).decode()}"
+
+
+def auth_headers(url: str, *, netrc_host: str | None = None) -> dict[str, str]:
+    """Return the Authorization header to use for *url*, if any.
+
+    GitHub and GitLab API requests use ``GITHUB_TOKEN`` and ``GITLAB_TOKEN``.
+    Credentials from ``~/.netrc`` are only sent if *netrc_host* is given,
+    which GitHub requests do for the host of the source.
+    """
+    parsed = urlsplit(url)
+    token = None
+    if parsed.netloc == "api.github.com" or parsed.path.startswith("/api/v3/"):
+        token = os.environ.get("GITHUB_TOKEN")
+    elif parsed.path.startswith("/api/v4/"):
+        token = os.environ.get("GITLAB_TOKEN")
+    if token:
+        return {"Authorization": f"Bearer {token}"}
+    authorization = None if netrc_host is None else _netrc_auth(netrc_host)
+    return {} if authorization is None else {"Authorization": authorization}
+
+
+def add_auth_headers(request: Request) -> None:
+    if request.has_header("Authorization"):
+        return
+    for name, value in auth_headers(request.full_url).items():
+        request.add_header(name, value)
+
+
+def urlopen(
+    request: Request | str,
+    timeout: int = DEFAULT_TIMEOUT,
+    *,
+    follow_redirects: bool = True,
+) -> Any:  # noqa: ANN401
+    """Open a URL through the shared keep-alive connection pool."""
+    if isinstance(request, str):
+        request = Request(request)
+    add_auth_headers(request)
+    opener = OPENER if follow_redirects else NO_REDIRECT_OPENER
+    return opener.open(request, timeout=timeout)
+
+
+@dataclass
+class Response:
+    body: bytes
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class RequestStats:
+    # Responses served from the cache after revalidation
+    cached: int = 0
+    # Responses downloaded from the server
+    fetched: int = 0
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock,
+        repr=False,
+        compare=False,
+    )
+
+    def count(self, *, cached: bool) -> None:
+        with self._lock:
+            if cached:
+                self.cached += 1
+            else:
+                self.fetched += 1
+
+
+_request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "request_stats",
+    default=None,
+)
+
+
+@contextmanager
+def record_requests() -> Iterator[RequestStats]:
+    """Count the responses ``fetch`` returns within the block.
+
+    Worker threads count towards the block if they run their tasks in a
+    copy of its context, see ``contextvars.copy_context``.
+    """
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def _count_request(*, cached: bool) -> None:
+    if (stats := _request_stats.get()) is not None:
+        stats.count(cached=cached)
+
+
+def fetch(request: Request, timeout: int = DEFAULT_TIMEOUT) -> Response:
+    """Perform a request, using a conditional request if a previous response is cached.
+
+    The cache key includes the Authorization header, so responses fetched
+    with one token are never served for another.  Only GET requests are
+    cached.
+    """
+    add_auth_headers(request)
+    cacheable = request.get_method() == "GET"
+    key = json.dumps([request.get_full_url(), request.get_header("Authorization")])
+    cached = HTTP_CACHE.get(key) if cacheable else None
+    if cached is not None:
+        if etag := cached["headers"].get("ETag"):
+            request.add_header("If-None-Match", etag)
+        if last_modified := cached["headers"].get("Last-Modified"):
+            request.add_header("If-Modified-Since", last_modified)
+
+    try:
+        with urlopen(request, timeout=timeout) as resp:
+            body = resp.read()
+            # Responses from urlopen always have headers, but test doubles may not
+            response_headers = getattr(resp, "headers", None) or {}
+    except HTTPError as e:
+        if cached is None or e.code != HTTPStatus.NOT_MODIFIED:
+            raise
+        # Consume the empty body so the connection goes back to the pool
+        if e.fp is not None:
+            e.read()
+            e.close()
+        # Refresh the entry so it is not evicted while still in use
+        HTTP_CACHE.set(key, cached)
+        _count_request(cached=True)
+        return Response(base64.b64decode(cached["body"]), cached["headers"])
+
+    _count_request(cached=False)
+    headers = {
+        name: value
+        for name in CACHED_HEADERS
+        if (value := response_headers.get(name)) is not None
+    }
+    if cacheable and ("ETag" in headers or "Last-Modified" in headers):
+        HTTP_CACHE.set(
+            key,
+            {"headers": headers, "body": base64.b64encode(body).decode()},
+        )
+    return Response(body, headers)
+
 
 def fetch_json(
     url: str,
@@ -20,5 +332,4 @@ def fetch_json(
 ) -> Any:  # noqa: ANN401
     """Fetch JSON data from a URL with proper timeout and error handling."""
     request = Request(url, headers=headers or {})
-    with urlopen(request, timeout=timeout) as resp:
-        return json.load(resp)
+    return json.loads(fetch(request, timeout=timeout).body)
@@ -1,13 +1,12 @@
 from __future__ import annotations
 
 import json
-import urllib.request
 from typing import TYPE_CHECKING
 
 from nix_update.errors import VersionError
 from nix_update.utils import info
 
-from .http import DEFAULT_TIMEOUT
+from .http import urlopen
 from .version import Version
 
 if TYPE_CHECKING:
@@ -22,7 +21,7 @@ def fetch_rubygem_versions(url: ParseResult) -> list[Version]:
     gem_name, _ = gem.rsplit("-", 1)
     versions_url = f"https://rubygems.org/api/v1/versions/{gem_name}.json"
     info(f"fetch {versions_url}")
-    with urllib.request.urlopen(versions_url, timeout=DEFAULT_TIMEOUT) as resp:
+    with urlopen(versions_url) as resp:
         json_versions = json.load(resp)
     if len(json_versions) == 0:
         msg = "No versions found"
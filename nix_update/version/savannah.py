@@ -1,14 +1,13 @@
 from __future__ import annotations
 
 import re
-import urllib.request
 import xml.etree.ElementTree as ET
 from typing import TYPE_CHECKING
 from urllib.parse import ParseResult, urljoin, urlparse
 
 from nix_update.utils import info
 
-from .http import DEFAULT_TIMEOUT
+from .http import urlopen
 from .version import Version
 
 if TYPE_CHECKING:
@@ -35,7 +34,7 @@ def fetch_savannah_versions(url: ParseResult) -> list[Version]:
     pname = url.path.split("/", 2)[1]
     dir_url = f"https://download.savannah.nongnu.org/releases/{pname}/?C=M&O=D"
     info(f"fetch {dir_url}")
-    with urllib.request.urlopen(dir_url, timeout=DEFAULT_TIMEOUT) as resp:
+    with urlopen(dir_url) as resp:
         html = resp.read()
 
     # only parse tbody
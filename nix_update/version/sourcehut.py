@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import urllib.request
 import xml.etree.ElementTree as ET
 from email.utils import parsedate_to_datetime
 from typing import TYPE_CHECKING
@@ -9,7 +8,7 @@ from urllib.parse import ParseResult, urlparse
 from nix_update.errors import VersionError
 from nix_update.utils import info
 
-from .http import DEFAULT_TIMEOUT
+from .http import urlopen
 from .version import Version
 
 if TYPE_CHECKING:
@@ -57,7 +56,7 @@ def fetch_sourcehut_versions(url: ParseResult) -> list[Version]:
     # repo = re.sub(r"\.git$", "", repo)
     feed_url = f"https://git.sr.ht/{owner}/{repo}/refs/rss.xml"
     info(f"fetch {feed_url}")
-    with urllib.request.urlopen(feed_url, timeout=DEFAULT_TIMEOUT) as resp:
+    with urlopen(feed_url) as resp:
         tree = ET.fromstring(resp.read())
     releases = tree.findall(".//item")
     return [version_from_entry(x) for x in releases]
@@ -70,7 +69,7 @@ def fetch_sourcehut_snapshots(url: ParseResult, branch: str) -> list[Version]:
     owner, repo = parts[1], parts[2]
     feed_url = f"https://git.sr.ht/{owner}/{repo}/log/{branch}/rss.xml"
     info(f"fetch {feed_url}")
-    with urllib.request.urlopen(feed_url, timeout=DEFAULT_TIMEOUT) as resp:
+    with urlopen(feed_url) as resp:
         tree = ET.fromstring(resp.read())
     latest_commit = tree.find(".//item")
     if latest_commit is None:
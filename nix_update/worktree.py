@@ -0,0 +1,142 @@
+"""Track changes to the working tree, to tell when cached evaluations are stale."""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+_changed: set[Path] = set()
+# Output of ``git status`` and the paths it lists, keyed by repository
+_statuses: dict[Path, tuple[bytes, list[Path]] | None] = {}
+_changed_lock = threading.Lock()
+
+Stamp = tuple[str | None, frozenset[tuple[str, int, int]]]
+
+
+def record_change(path: Path | str) -> None:
+    """Record that nix-update wrote *path*.
+
+    Only needed outside of git repositories, where changes cannot be found
+    with ``git status``.  A directory, e.g. the package directory after
+    running an update script, stands for a tool that may have written
+    anywhere: all files directly in it are watched, and the uncommitted
+    files of git repositories are looked up again.
+    """
+    path = Path(path).absolute()
+    with _changed_lock:
+        _changed.add(path)
+        if path.is_dir():
+            _statuses.clear()
+
+
+def _file_stamp(path: Path) -> tuple[str, int, int]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return (str(path), -1, -1)
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.cache
+def _toplevel(import_path: str) -> Path | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--show-toplevel"],
+            cwd=import_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return Path(result.stdout.strip())
+
+
+def _git_status(toplevel: Path) -> tuple[bytes, list[Path]] | None:
+    """Return the output of ``git status`` in *toplevel* and the paths it lists.
+
+    Scanning a large working tree is slow, so the status is only looked up
+    again after ``record_change`` was called for a directory.
+    """
+    with _changed_lock:
+        if toplevel in _statuses:
+            return _statuses[toplevel]
+    try:
+        result = subprocess.run(
+            # Without refreshing the index, whose changes are tracked as well
+            [
+                "git",
+                "--no-optional-locks",
+                "status",
+                "--porcelain",
+                "-z",
+                "--untracked-files=all",
+            ],
+            cwd=toplevel,
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        status = None
+    else:
+        paths = []
+        entries = iter(result.stdout.decode(errors="surrogateescape").split("\0"))
+        for entry in entries:
+            if len(entry) < 4:  # noqa: PLR2004
+                continue
+            code, path = entry[:2], entry[3:]
+            if "R" in code or "C" in code:
+                # The source of a rename or copy follows as its own entry
+                next(entries, None)
+            paths.append(toplevel / path)
+        status = (result.stdout, paths)
+    with _changed_lock:
+        _statuses[toplevel] = status
+    return status
+
+
+def _status_stamp(import_path: str) -> str | None:
+    """Return a digest of the uncommitted changes of the git repository at *import_path*.
+
+    Covers the status of every modified or untracked file and its modification
+    time, so files written by update scripts anywhere in the working tree
+    are noticed, including files that were already modified before.
+    """
+    toplevel = _toplevel(import_path)
+    if toplevel is None:
+        return None
+    status = _git_status(toplevel)
+    if status is None:
+        return None
+    output, paths = status
+    digest = hashlib.sha256(output)
+    for path in paths:
+        digest.update(repr(_file_stamp(path)).encode())
+    return digest.hexdigest()
+
+
+def stamp(import_path: str) -> Stamp:
+    """Return the state of the working tree of *import_path*.
+
+    The stamp differs from an earlier one once any file nix-update recorded,
+    or any uncommitted file of the git repository, was written.  New
+    uncommitted files are only found after a directory was recorded.
+    """
+    with _changed_lock:
+        paths = list(_changed)
+    stamps = set()
+    for path in paths:
+        if not path.is_dir():
+            stamps.add(_file_stamp(path))
+            continue
+        stamps.add((str(path), 0, 0))
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+        stamps.update(_file_stamp(Path(entry.path)) for entry in entries)
+    return (_status_stamp(import_path), frozenset(stamps))
@@ -22,6 +22,14 @@ TEST_ROOT = Path(__file__).parent.resolve()
 sys.path.append(str(TEST_ROOT.parent))
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keep the persistent caches of nix-update out of the user's cache directory."""
+    path = tmp_path / "cache"
+    monkeypatch.setattr("nix_update.cache.cache_dir", lambda: path)
+    return path
+
+
 @pytest.fixture(scope="session")
 def nixpkgs_path() -> str:
     """Session-scoped fixture that provides the nixpkgs store path."""
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import unittest.mock
+from typing import TYPE_CHECKING, Any
+
+from nix_update import attribute_index
+from nix_update.eval import package_from_eval
+from nix_update.options import Options
+from nix_update.update import load_package, update
+from nix_update.version.version import Version
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from nix_update.eval import Package
+
+
+def evaluated_package(opts: Options, filename: Path, version: str = "1.2") -> Package:
+    out: dict[str, Any] = {
+        "name": f"hello-{version}",
+        "pname": "hello",
+        "old_version": version,
+        "raw_version_position": {"file": str(filename), "line": 3, "column": 5},
+        "filename": str(filename),
+        "line": 2,
+        "urls": None,
+        "url": f"https://github.com/owner/hello/archive/v{version}.tar.gz",
+        "rev": None,
+        "tag": f"v{version}",
+        "hash": "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=",
+    }
+    return package_from_eval(opts, opts.attribute, out)
+
+
+def test_index_is_invalidated_by_file_changes(tmp_path: Path) -> None:
+    nix_file = tmp_path / "hello.nix"
+    nix_file.write_text('{ version = "1.2"; }')
+    opts = Options(attribute="hello", import_path=str(tmp_path), attribute_index=True)
+    attribute_index.store(opts, evaluated_package(opts, nix_file))
+
+    package = attribute_index.lookup(opts)
+    assert package is not None
+    assert package.old_version == "1.2"
+    assert package.tag == "v1.2"
+    assert package.parsed_url is not None
+    assert package.version_position is not None
+    assert package.version_position.line == 3  # noqa: PLR2004
+    assert attribute_index.lookup(Options(attribute="other")) is None
+
+    nix_file.write_text('{ version = "1.3"; }')
+    assert attribute_index.lookup(opts) is None
+
+
+def test_load_package_skips_evaluation_when_up_to_date(tmp_path: Path) -> None:
+    nix_file = tmp_path / "hello.nix"
+    nix_file.write_text('{ version = "1.2"; }')
+    opts = Options(attribute="hello", import_path=str(tmp_path), attribute_index=True)
+    attribute_index.store(opts, evaluated_package(opts, nix_file))
+
+    with (
+        unittest.mock.patch(
+            "nix_update.update.fetch_latest_version",
+            return_value=Version("1.2"),
+        ) as fetch,
+        unittest.mock.patch("nix_update.update.eval_attr") as eval_attr,
+    ):
+        package = update(opts)
+    assert package.old_version == "1.2"
+    fetch.assert_called_once()
+    eval_attr.assert_not_called()
+
+
+def test_load_package_evaluates_new_versions(tmp_path: Path) -> None:
+    nix_file = tmp_path / "hello.nix"
+    nix_file.write_text('{ version = "1.2"; }')
+    opts = Options(attribute="hello", import_path=str(tmp_path), attribute_index=True)
+    evaluated = evaluated_package(opts, nix_file)
+    attribute_index.store(opts, evaluated)
+
+    with (
+        unittest.mock.patch(
+            "nix_update.update.fetch_latest_version",
+            return_value=Version("1.3"),
+        ) as fetch,
+        unittest.mock.patch(
+            "nix_update.update.eval_attr",
+            return_value=evaluated,
+        ) as eval_attr,
+    ):
+        package = load_package(opts)
+    assert package is evaluated
+    # The version found before evaluating is not looked up again
+    assert package.new_version == Version("1.3")
+    fetch.assert_called_once()
+    eval_attr.assert_called_once()
+
+
+def test_load_package_evaluates_for_build_test_and_review(tmp_path: Path) -> None:
+    nix_file = tmp_path / "hello.nix"
+    nix_file.write_text('{ version = "1.2"; }')
+    for flag in ("build", "test", "review"):
+        opts = Options(
+            attribute="hello",
+            import_path=str(tmp_path),
+            attribute_index=True,
+            **{flag: True},
+        )
+        evaluated = evaluated_package(opts, nix_file)
+        attribute_index.store(opts, evaluated)
+
+        with (
+            unittest.mock.patch("nix_update.update.fetch_latest_version") as fetch,
+            unittest.mock.patch(
+                "nix_update.update.eval_attr",
+                return_value=evaluated,
+            ) as eval_attr,
+        ):
+            package = load_package(opts)
+        assert package is evaluated
+        fetch.assert_not_called()
+        eval_attr.assert_called_once()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import unittest.mock
+from typing import TYPE_CHECKING, Any
+from urllib.error import URLError
+
+import pytest
+
+from nix_update import main, parse_args, update_batch
+from nix_update.eval import eval_attrs, package_from_eval
+from nix_update.options import Options
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from nix_update.eval import Package
+
+# Minimum expected gitea version for testing
+MIN_GITEA_VERSION = 30
+
+
+def test_parse_args_batch(tmp_path: Path) -> None:
+    attributes_file = tmp_path / "attributes"
+    attributes_file.write_text("# nightly sweep\nfoo\n\n  bar.baz\n")
+
+    opts = parse_args(["qux", "--attributes-file", str(attributes_file)])
+    assert opts.attribute == "qux"
+    assert opts.attributes == ["qux", "foo", "bar.baz"]
+    assert opts.for_attribute("bar.baz").attribute_path == ["bar", "baz"]
+
+    single = parse_args(["qux"])
+    assert single.attributes == []
+
+    with pytest.raises(SystemExit):
+        parse_args(["--review", "foo", "bar"])
+
+
+def evaluated(name: str, version: str) -> dict[str, Any]:
+    return {
+        "name": f"{name}-{version}" if version else name,
+        "pname": name,
+        "old_version": version,
+        "raw_version_position": None,
+        "filename": f"/src/{name}/default.nix",
+        "line": 1,
+        "urls": None,
+        "url": f"https://example.com/{name}.tar.gz",
+        "rev": None,
+        "tag": None,
+        "hash": None,
+    }
+
+
+def test_eval_attrs_skips_attributes_without_version() -> None:
+    out = [evaluated("foo", "1.0"), evaluated("bar", ""), None]
+    with unittest.mock.patch(
+        "nix_update.eval.run",
+        return_value=subprocess.CompletedProcess([], 0, json.dumps(out), ""),
+    ):
+        packages = eval_attrs(Options(attribute="foo"), ["foo", "bar", "baz"])
+
+    # The attribute without a version is evaluated again on its own later
+    assert [p and p.attribute for p in packages] == ["foo", None, None]
+
+
+def test_update_batch_continues_after_unexpected_errors(
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    options = Options(attribute="foo", attributes=["foo", "bar"], fetch_jobs=1)
+    packages = [
+        package_from_eval(options, name, evaluated(name, "1.0"))
+        for name in options.attributes
+    ]
+    updated = []
+
+    def update(opts: Options, package: Package) -> Package:
+        if opts.attribute == "foo":
+            msg = "connection refused"
+            raise URLError(msg)
+        updated.append(opts.attribute)
+        return package
+
+    with (
+        unittest.mock.patch(
+            "nix_update.attribute_index.eval_unindexed",
+            return_value=(packages, {}),
+        ),
+        unittest.mock.patch("nix_update.prefetch_github_versions"),
+        unittest.mock.patch("nix_update.update", update),
+        unittest.mock.patch("nix_update.process_package"),
+        pytest.raises(SystemExit),
+    ):
+        update_batch(options, None)
+
+    assert updated == ["bar"]
+    err = capsys.readouterr().err
+    assert "foo: URLError" in err
+    assert "Failed to update: foo" in err
+
+
+def test_main(testpkgs_git: Path) -> None:
+    # A broken attribute must not prevent the other packages from being updated
+    with pytest.raises(SystemExit):
+        main(["--file", str(testpkgs_git), "--commit", "pypi", "missing", "gitea"])
+
+    def get_version(attr: str) -> str:
+        return subprocess.run(
+            [
+                "nix",
+                "eval",
+                "--raw",
+                "--extra-experimental-features",
+                "nix-command",
+                "-f",
+                testpkgs_git,
+                f"{attr}.version",
+            ],
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+        ).stdout.strip()
+
+    pypi_version = get_version("pypi")
+    gitea_version = get_version("gitea")
+    assert tuple(map(int, pypi_version.split("."))) >= (3, 0, 1)
+    assert int(gitea_version) >= MIN_GITEA_VERSION
+
+    log = subprocess.run(
+        ["git", "-C", str(testpkgs_git), "log", "-3", "--format=%s"],
+        text=True,
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout.strip()
+    print(log)
+    assert f"pypi: 2.0.0 -> {pypi_version}" in log
+    assert f"gitea: 29 -> {gitea_version}" in log
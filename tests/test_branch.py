@@ -28,7 +28,7 @@ def fake_urlopen(req: Request, timeout: float | None = None) -> BinaryIO:
 
 def test_branch(helpers: conftest.Helpers) -> None:
     del helpers
-    with unittest.mock.patch("urllib.request.urlopen", fake_urlopen):
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_urlopen):
         assert (
             fetch_latest_version(
                 urlparse("https://github.com/Mic92/nix-update"),
@@ -44,7 +44,7 @@ def test_branch(helpers: conftest.Helpers) -> None:
 
 def test_branch_releases(helpers: conftest.Helpers) -> None:
     del helpers
-    with unittest.mock.patch("urllib.request.urlopen", fake_urlopen):
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_urlopen):
         assert (
             fetch_latest_version(
                 urlparse("https://github.com/Mic92/nix-update"),
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import io
+import os
+import time
+import unittest.mock
+from email.message import Message
+from typing import TYPE_CHECKING
+from urllib.error import HTTPError
+from urllib.request import Request
+
+from nix_update.cache import DiskCache
+from nix_update.version.http import fetch
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_disk_cache(cache_dir: Path) -> None:
+    cache = DiskCache("test", ttl=60)
+    assert cache.get("key") is None
+    cache.set("key", {"value": 1})
+    assert cache.get("key") == {"value": 1}
+    assert cache.path.parent == cache_dir
+
+    # Expired entries are dropped
+    (entry,) = cache.path.glob("*.json")
+    old = time.time() - 120
+    os.utime(entry, (old, old))
+    assert cache.get("key") is None
+    assert not entry.exists()
+
+
+def test_disk_cache_eviction() -> None:
+    cache = DiskCache("test", ttl=60, max_size=100)
+    for i in range(10):
+        cache.set(f"key{i}", "x" * 20)
+        entry = cache._entry(f"key{i}")  # noqa: SLF001
+        os.utime(entry, (i, time.time() - 10 + i))
+    cache.evict()
+    assert cache.get("key0") is None
+    assert cache.get("key9") == "x" * 20
+    assert sum(p.stat().st_size for p in cache.path.glob("*.json")) <= cache.max_size
+
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, body: bytes, headers: dict[str, str]) -> None:
+        super().__init__(body)
+        self.headers = Message()
+        for name, value in headers.items():
+            self.headers[name] = value
+
+
+def test_fetch_revalidates() -> None:
+    requests: list[Request] = []
+
+    def fake_urlopen(request: Request, timeout: float | None = None) -> FakeResponse:
+        del timeout
+        requests.append(request)
+        if request.get_header("If-none-match") == '"v1"':
+            raise HTTPError(request.full_url, 304, "Not Modified", Message(), None)
+        return FakeResponse(b"payload", {"ETag": '"v1"'})
+
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_urlopen):
+        first = fetch(Request("https://example.com/releases.atom"))
+        second = fetch(Request("https://example.com/releases.atom"))
+        other_token = fetch(
+            Request(
+                "https://example.com/releases.atom",
+                headers={"Authorization": "Bearer other"},
+            ),
+        )
+
+    assert first.body == second.body == other_token.body == b"payload"
+    assert second.headers == {"ETag": '"v1"'}
+    assert requests[0].get_header("If-none-match") is None
+    assert requests[1].get_header("If-none-match") == '"v1"'
+    # Responses are cached per credential
+    assert requests[2].get_header("If-none-match") is None
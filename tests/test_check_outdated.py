@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import unittest.mock
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+from nix_update import outdated
+from nix_update.errors import EvalError
+from nix_update.eval import ScanRecord, package_from_eval
+from nix_update.options import Options
+from nix_update.outdated import check_outdated, scan_attributes, scan_outdated
+from nix_update.version import fetcher_name
+from nix_update.version.github import fetch_github_versions
+from nix_update.version.version import Version
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from urllib.parse import ParseResult
+
+    import pytest
+
+    from nix_update.eval import Package
+
+
+def evaluated_package(opts: Options, attribute: str, version: str) -> Package:
+    out: dict[str, Any] = {
+        "name": f"{attribute}-{version}",
+        "pname": attribute,
+        "old_version": version,
+        "raw_version_position": None,
+        "filename": f"/src/{attribute}.nix",
+        "line": 2,
+        "urls": None,
+        "url": f"https://github.com/owner/{attribute}/archive/v{version}.tar.gz",
+        "rev": None,
+        "tag": f"v{version}",
+        "hash": "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=",
+    }
+    return package_from_eval(opts, attribute, out)
+
+
+def test_fetcher_name() -> None:
+    assert fetcher_name(fetch_github_versions) == "github"
+    assert fetcher_name(partial(fetch_github_versions, extra_args={})) == "github"
+
+
+def test_check_outdated(capsys: pytest.CaptureFixture[str]) -> None:
+    opts = Options(
+        attribute="hello",
+        attributes=["hello", "jq", "broken"],
+        check_outdated=True,
+    )
+
+    def eval_attrs(options: Options, attributes: list[str]) -> list[Package | None]:
+        assert attributes == ["hello", "jq", "broken"]
+        return [
+            evaluated_package(options, "hello", "1.2"),
+            evaluated_package(options, "jq", "1.7"),
+            None,
+        ]
+
+    def find_latest_version(url: ParseResult, _config: Any) -> tuple[Version, str]:  # noqa: ANN401
+        return (Version("1.3") if "/hello/" in url.path else Version("1.7")), "github"
+
+    with (
+        unittest.mock.patch("nix_update.attribute_index.eval_attrs", eval_attrs),
+        unittest.mock.patch(
+            "nix_update.outdated.find_latest_version",
+            find_latest_version,
+        ),
+        unittest.mock.patch(
+            "nix_update.outdated.eval_attr",
+            side_effect=EvalError("evaluation failed"),
+        ),
+        unittest.mock.patch("nix_update.update.replace_version") as replace_version,
+    ):
+        assert not check_outdated(opts)
+
+    replace_version.assert_not_called()
+    reports = {
+        report["attribute"]: report
+        for report in map(json.loads, capsys.readouterr().out.splitlines())
+    }
+    assert set(reports) == {"hello", "jq", "broken"}
+    assert reports["hello"]["old_version"] == "1.2"
+    assert reports["hello"]["new_version"] == "1.3"
+    assert reports["hello"]["outdated"] is True
+    assert reports["hello"]["fetcher"] == "github"
+    assert reports["hello"]["index"] is None
+    assert reports["jq"]["outdated"] is False
+    assert reports["jq"]["error"] is None
+    assert reports["broken"]["error"] == "evaluation failed"
+    assert reports["broken"]["outdated"] is None
+
+
+def scan_record(attribute: str, version: str) -> ScanRecord:
+    return ScanRecord(
+        attribute,
+        pname=attribute,
+        old_version=version,
+        url=f"https://github.com/owner/{attribute}/archive/v{version}.tar.gz",
+        rev=None,
+        tag=f"v{version}",
+    )
+
+
+def test_scan_outdated(capsys: pytest.CaptureFixture[str]) -> None:
+    opts = Options(attribute="", scan=True)
+    versions = {"hello": "1.2", "jq": "1.7", "bad": "0.1"}
+    chunks = []
+
+    def eval_scan(_opts: Options, attributes: list[str]) -> list[ScanRecord | None]:
+        chunks.append(attributes)
+        if "aborts" in attributes:
+            raise subprocess.CalledProcessError(
+                1,
+                "nix-instantiate",
+                stderr="error:\n       … while evaluating\n\n       error: evaluation aborted\n",
+            )
+        return [
+            scan_record(a, versions[a]) if a in versions else None for a in attributes
+        ]
+
+    def find_latest_version(url: ParseResult, _config: Any) -> tuple[Version, str]:  # noqa: ANN401
+        if "/bad/" in url.path:
+            # e.g. a forge answering with unexpected JSON
+            key = "tag_name"
+            raise KeyError(key)
+        return (Version("1.3") if "/hello/" in url.path else Version("1.7")), "github"
+
+    with (
+        unittest.mock.patch.object(outdated, "SCAN_CHUNK_SIZE", 4),
+        unittest.mock.patch(
+            "nix_update.outdated.eval_attribute_names",
+            return_value=["aborts", "hello", "jq", "lib", "bad"],
+        ),
+        unittest.mock.patch("nix_update.outdated.eval_scan", eval_scan),
+        unittest.mock.patch(
+            "nix_update.outdated.find_latest_version",
+            find_latest_version,
+        ),
+    ):
+        assert not scan_outdated(opts)
+
+    # The chunk is split up until the attribute that aborts is found
+    assert chunks[0] == ["aborts", "hello", "jq", "lib"]
+    assert ["aborts"] in chunks
+    reports = {
+        report["attribute"]: report
+        for report in map(json.loads, capsys.readouterr().out.splitlines())
+    }
+    # Attributes without a source are not reported
+    assert set(reports) == {"aborts", "hello", "jq", "bad"}
+    assert reports["aborts"]["error"] == "error: evaluation aborted"
+    assert reports["hello"]["outdated"] is True
+    assert reports["hello"]["new_version"] == "1.3"
+    assert reports["jq"]["outdated"] is False
+    assert reports["bad"]["error"] == "KeyError: 'tag_name'"
+
+
+def test_scan_attributes(tmp_path: Path) -> None:
+    with unittest.mock.patch(
+        "nix_update.outdated.eval_attribute_names",
+        return_value=["requests", "zope.interface"],
+    ) as eval_attribute_names:
+        attributes = scan_attributes(
+            Options(attribute="python3Packages", scan=True),
+        )
+    assert attributes == [
+        "python3Packages.requests",
+        'python3Packages."zope.interface"',
+    ]
+    assert eval_attribute_names.call_args.args[1] == ["python3Packages"]
+
+    for name in ["hello", "hexyl"]:
+        (tmp_path / "pkgs" / "by-name" / "he" / name).mkdir(parents=True)
+    opts = Options(attribute="", import_path=str(tmp_path), scan=True, scan_shard="he")
+    assert scan_attributes(opts) == ["hello", "hexyl"]
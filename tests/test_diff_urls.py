@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import unittest.mock
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+from nix_update.diff_urls import create_github_diff_url, derive_new_rev_tag
+from nix_update.eval import Revision
+from nix_update.options import Options
+from nix_update.version.version import Version
+
+
+def github_package(**kwargs: str | None) -> SimpleNamespace:
+    attrs = {
+        "old_version": "1.2",
+        "tag": None,
+        "rev": None,
+        "parsed_url": urlparse("https://github.com/owner/repo/archive/v1.2.tar.gz"),
+    }
+    attrs.update(kwargs)
+    return SimpleNamespace(**attrs)
+
+
+def test_derive_new_rev_tag() -> None:
+    new_version = Version("1.3")
+    assert derive_new_rev_tag(github_package(tag="v1.2"), new_version) == "v1.3"  # type: ignore[arg-type]
+    assert derive_new_rev_tag(github_package(rev="release-1.2"), new_version) == (  # type: ignore[arg-type]
+        "release-1.3"
+    )
+    # 1.2 in 1.23 is not the version
+    assert derive_new_rev_tag(github_package(tag="v1.23"), new_version) is None  # type: ignore[arg-type]
+    assert derive_new_rev_tag(github_package(rev="0123abcd"), new_version) is None  # type: ignore[arg-type]
+    assert derive_new_rev_tag(github_package(), new_version) is None  # type: ignore[arg-type]
+
+
+def test_github_diff_url_without_evaluation() -> None:
+    opts = Options(attribute="hello", commit=True)
+    with unittest.mock.patch("nix_update.diff_urls.eval_revision") as eval_revision:
+        url = create_github_diff_url(opts, github_package(tag="v1.2"), Version("1.3"))  # type: ignore[arg-type]
+    assert url == "https://github.com/owner/repo/compare/v1.2...v1.3"
+    eval_revision.assert_not_called()
+
+
+def test_github_diff_url_evaluates_revision() -> None:
+    package = github_package(rev="0123abcd")
+    revision = Revision(version="1.3", rev="4567cdef", tag=None, url=None)
+    with unittest.mock.patch(
+        "nix_update.diff_urls.eval_revision",
+        return_value=revision,
+    ) as eval_revision:
+        url = create_github_diff_url(
+            Options(attribute="hello", commit=True),
+            package,  # type: ignore[arg-type]
+            Version("1.3"),
+        )
+        assert url == "https://github.com/owner/repo/compare/0123abcd...4567cdef"
+
+        # Without a commit message the diff URL is not needed
+        assert (
+            create_github_diff_url(
+                Options(attribute="hello"),
+                package,  # type: ignore[arg-type]
+                Version("1.3"),
+            )
+            is None
+        )
+    assert eval_revision.call_count == 1
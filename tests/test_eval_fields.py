@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import unittest.mock
+from typing import Any
+
+from nix_update.eval import (
+    CORE_FIELDS,
+    DEPENDENCY_FIELDS,
+    eval_attr,
+    eval_fields,
+)
+from nix_update.options import Options
+from nix_update.version.version import VersionPreference
+
+
+def test_eval_fields_src_only() -> None:
+    fields = eval_fields(Options(attribute="hello", src_only=True))
+    assert fields == list(CORE_FIELDS)
+
+
+def test_eval_fields_for_options() -> None:
+    fields = eval_fields(Options(attribute="hello"))
+    assert set(DEPENDENCY_FIELDS) <= set(fields)
+    assert "tests" not in fields
+    assert "maintainers" not in fields
+    # Only needed to compare the lockfiles of the old and the new source
+    assert "src_drv_path" not in fields
+    assert "src_drv_path" in eval_fields(
+        Options(attribute="hello", skip_unchanged_lockfiles=True),
+    )
+
+    fields = eval_fields(
+        Options(
+            attribute="hello",
+            commit=True,
+            test=True,
+            use_update_script=True,
+            custom_deps=["fooHash"],
+        ),
+    )
+    for field in (
+        "changelog",
+        "maintainers",
+        "tests",
+        "has_update_script",
+        "custom_deps",
+    ):
+        assert field in fields
+
+
+def test_eval_attr_only_requests_needed_fields() -> None:
+    out = {
+        "name": "hello-1.0",
+        "pname": "hello",
+        "old_version": "1.0",
+        "raw_version_position": None,
+        "filename": "/src/hello.nix",
+        "line": 1,
+        "urls": None,
+        "url": "https://example.com/hello-1.0.tar.gz",
+        "rev": None,
+        "tag": None,
+        "hash": "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=",
+    }
+    calls: list[list[str]] = []
+
+    def run(cmd: list[str], **_kwargs: Any) -> subprocess.CompletedProcess[str]:  # noqa: ANN401
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, json.dumps(out), "")
+
+    opts = Options(
+        attribute="hello",
+        src_only=True,
+        version_preference=VersionPreference.SKIP,
+    )
+    with unittest.mock.patch("nix_update.eval.run", run):
+        package = eval_attr(opts)
+
+    cmd = calls[0]
+    fields = json.loads(cmd[cmd.index("fields") + 1])
+    assert fields == list(CORE_FIELDS)
+    assert package.url == out["url"]
+    assert package.cargo_deps is None
+    assert package.cargo_lock is None
+    assert package.has_nuget_deps is False
+    assert package.tests == []
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+import re
+import sys
+import textwrap
+from typing import TYPE_CHECKING
+
+import pytest
+
+from nix_update import evaluator, worktree
+from nix_update.errors import EvalError
+from nix_update.eval import eval_attribute_names, get_eval_nix_path
+from nix_update.evaluator import parse_repl_output
+from nix_update.options import Options
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+# Answers queries with the query file's content, which is enough to check
+# what was sent to the repl.
+FAKE_REPL = textwrap.dedent(
+    """
+    import json, re, sys
+    from pathlib import Path
+
+    log = open(sys.argv[1], "a")
+    print("Welcome to Nix. Type :? for help.", flush=True)
+    for line in sys.stdin:
+        line = line.strip()
+        log.write(line + "\\n")
+        log.flush()
+        if m := re.fullmatch(r'"nix-update-done-" \\+ "(\\d+)"', line):
+            print(f'nix-repl> "nix-update-done-{m[1]}"', flush=True)
+        elif m := re.fullmatch(r"builtins.toJSON \\[ \\(\\(import (\\S+)\\) \\w+\\) \\]", line):
+            query = Path(m[1]).read_text().strip()
+            if "throw" in query:
+                print("error: query failed", flush=True)
+            else:
+                print(json.dumps(json.dumps([query])), flush=True)
+    """,
+)
+
+
+@pytest.fixture
+def fake_nix(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    log = tmp_path / "repl.log"
+    (tmp_path / "repl.py").write_text(FAKE_REPL)
+    nix = bin_dir / "nix"
+    nix.write_text(
+        f"#!/bin/sh\nexec {sys.executable} {tmp_path / 'repl.py'} {log}\n",
+    )
+    nix.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:/usr/bin:/bin")
+    return log
+
+
+def test_parse_repl_output() -> None:
+    assert parse_repl_output(['"[\\"a\\\\nb\\",1]"']) == "a\nb"
+    assert parse_repl_output(['"[{\\"a\\":\\"\\${x}\\"}]"']) == {"a": "${x}"}
+    assert parse_repl_output(['["raw"]']) == "raw"
+    with pytest.raises(EvalError, match="attribute missing"):
+        parse_repl_output(["error: attribute missing"])
+
+
+def test_session(tmp_path: Path, fake_nix: Path) -> None:
+    pkg_dir = tmp_path / "pkg"
+    pkg_dir.mkdir()
+    (pkg_dir / "default.nix").write_text("{ }")
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+
+    with evaluator.session(opts):
+        first = evaluator.eval_json(opts, lambda package: f"{package}.src")
+        assert re.fullmatch(r"(\w+): \1\.\"foo\"\.src", first)
+        evaluator.eval_json(opts, lambda package: package)
+        with pytest.raises(EvalError, match="query failed"):
+            evaluator.eval_json(opts, lambda package: f"throw {package}")
+        (pkg_dir / "default.nix").write_text("{ version = 2; }")
+        worktree.record_change(pkg_dir / "default.nix")
+        evaluator.eval_json(opts, lambda package: package)
+
+    sent = fake_nix.read_text().splitlines()
+    bindings = [line for line in sent if " = (import " in line]
+    # The package set is bound once, and again after the package changed
+    assert len(bindings) == 2  # noqa: PLR2004
+    assert sent.index(":reload") > sent.index(bindings[0])
+    assert json.dumps(str(tmp_path)) in bindings[0]
+
+
+@pytest.mark.usefixtures("fake_nix")
+def test_eval_nix_through_session(tmp_path: Path) -> None:
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+
+    with evaluator.session(opts):
+        query = eval_attribute_names(opts, [])
+
+    # eval.nix gets the package set loaded by the repl instead of importing it
+    root = re.fullmatch(r"(\w+): .*", str(query))
+    assert root is not None
+    assert json.dumps(str(get_eval_nix_path())) in str(query)
+    assert str(query).endswith(f"// {{ packageSet = {root[1]}; }})")
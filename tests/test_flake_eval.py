@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import unittest.mock
+from typing import TYPE_CHECKING, Any
+
+from nix_update.eval import eval_attr, eval_fields, get_eval_nix_path
+from nix_update.flake_eval import wrapper_flake
+from nix_update.options import Options
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+EVAL_OUTPUT = {
+    "name": "hello-1.0",
+    "pname": "hello",
+    "old_version": "1.0",
+    "filename": "/src/hello.nix",
+    "line": 1,
+    "urls": None,
+    "url": None,
+    "src_homepage": None,
+    "changelog": None,
+    "maintainers": None,
+    "rev": None,
+    "tag": None,
+    "hash": None,
+    "src_drv_path": None,
+    "src_name": None,
+    "src_hash_mode": None,
+    "src_post_fetch": None,
+    "fod_subpackage": None,
+    "go_modules": None,
+    "go_modules_old": None,
+    "cargo_deps": None,
+    "cargo_vendor_deps": None,
+    "npm_deps": None,
+    "pnpm_deps": None,
+    "yarn_deps": None,
+    "yarn_deps_old": None,
+    "yarn_berry_missing_hashes_path": None,
+    "composer_deps": None,
+    "composer_deps_old": None,
+    "custom_deps": None,
+    "maven_deps": None,
+    "mix_deps": None,
+    "zig_deps": None,
+    "has_nuget_deps": False,
+    "has_gradle_mitm_cache": False,
+    "tests": [],
+    "has_update_script": False,
+    "raw_version_position": None,
+    "raw_cargo_lock": None,
+}
+
+
+def _fake_run(calls: list[list[str]]) -> Any:  # noqa: ANN401
+    def run(cmd: list[str], **_kwargs: Any) -> subprocess.CompletedProcess[str]:  # noqa: ANN401
+        calls.append(cmd)
+        assert cmd[:2] == ["nix", "eval"]
+        return subprocess.CompletedProcess(cmd, 0, json.dumps(EVAL_OUTPUT), "")
+
+    return run
+
+
+def test_eval_attr_through_wrapper_flake() -> None:
+    opts = Options(
+        attribute="hello",
+        flake=True,
+        flake_eval_cache=True,
+        import_path="github:example/flake",
+        system="x86_64-linux",
+    )
+    calls: list[list[str]] = []
+    with unittest.mock.patch("nix_update.flake_eval.run", _fake_run(calls)):
+        package = eval_attr(opts)
+        eval_attr(opts)
+
+    assert package.name == "hello-1.0"
+    assert package.old_version == "1.0"
+    # The same wrapper flake, and thereby the same cached evaluation, is reused
+    assert calls[0] == calls[1]
+    installable = calls[0][4]
+    assert installable.endswith('#nixUpdate."hello".__nixUpdate')
+
+    flake_dir = wrapper_flake(opts, get_eval_nix_path(), eval_fields(opts))
+    assert installable == f'path:{flake_dir}#nixUpdate."hello".__nixUpdate'
+    flake_nix = (flake_dir / "flake.nix").read_text()
+    assert 'inputs.target.url = "github:example/flake";' in flake_nix
+    assert 'system = "x86_64-linux";' in flake_nix
+    assert (flake_dir / "eval.nix").read_text() == get_eval_nix_path().read_text()
+
+
+def test_wrapper_flake_depends_on_options(tmp_path: Path) -> None:
+    def flake_dir(system: str = "x86_64-linux", **kwargs: Any) -> Path:  # noqa: ANN401
+        opts = Options(
+            attribute="hello",
+            flake=True,
+            import_path=str(tmp_path / "missing"),
+            system=system,
+            **kwargs,
+        )
+        return wrapper_flake(opts, get_eval_nix_path(), eval_fields(opts))
+
+    assert flake_dir() == flake_dir()
+    assert flake_dir() != flake_dir(system="aarch64-linux")
+    assert flake_dir() != flake_dir(custom_deps=["fooHash"])
+    assert (
+        "customDeps = " + json.dumps(json.dumps(["fooHash"]))
+        in (flake_dir(custom_deps=["fooHash"]) / "flake.nix").read_text()
+    )
+
+
+def test_wrapper_flakes_are_pruned(tmp_path: Path) -> None:
+    def flake_dir(system: str) -> Path:
+        opts = Options(
+            attribute="hello",
+            flake=True,
+            import_path=str(tmp_path / "missing"),
+            system=system,
+        )
+        return wrapper_flake(opts, get_eval_nix_path(), eval_fields(opts))
+
+    with unittest.mock.patch("nix_update.flake_eval.MAX_WRAPPERS", 2):
+        oldest = flake_dir("x86_64-linux")
+        used = flake_dir("aarch64-linux")
+        os.utime(oldest, (0, 0))
+        os.utime(used, (1, 1))
+        # Using a wrapper again keeps it
+        assert flake_dir("aarch64-linux") == used
+        flake_dir("x86_64-darwin")
+
+    assert not oldest.exists()
+    assert used.exists()
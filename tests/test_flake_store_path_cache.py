@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import unittest.mock
+from typing import TYPE_CHECKING
+
+from nix_update import worktree
+from nix_update.options import cached_flake_store_path
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def git(repo: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_cached_flake_store_path(tmp_path: Path) -> None:
+    package = tmp_path / "package.nix"
+    package.write_text("{ version = 1; }")
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "init")
+
+    copies = iter(f"/nix/store/{i}-source" for i in range(10))
+    with unittest.mock.patch(
+        "nix_update.options.get_flake_store_path",
+        side_effect=lambda _: next(copies),
+    ) as copy:
+        first = cached_flake_store_path(str(tmp_path))
+        assert cached_flake_store_path(str(tmp_path)) == first
+        assert copy.call_count == 1
+
+        # nix-update changed a file
+        package.write_text("{ version = 2; }")
+        worktree.record_change(package)
+        second = cached_flake_store_path(str(tmp_path))
+        assert second != first
+        assert cached_flake_store_path(str(tmp_path)) == second
+
+        # A commit moves HEAD
+        git(tmp_path, "commit", "-q", "-am", "update")
+        third = cached_flake_store_path(str(tmp_path))
+        assert third != second
+        assert copy.call_count == 3  # noqa: PLR2004
+
+        # An update script wrote a file outside of the package directory
+        (tmp_path / "sources").mkdir()
+        (tmp_path / "sources" / "sources.json").write_text("{}")
+        with unittest.mock.patch(
+            "nix_update.worktree.subprocess.run",
+            wraps=subprocess.run,
+        ) as run:
+            # The working tree is not scanned again before the script ran
+            assert cached_flake_store_path(str(tmp_path)) == third
+            assert cached_flake_store_path(str(tmp_path)) == third
+            assert run.call_count == 0
+        worktree.record_change(tmp_path)
+        fourth = cached_flake_store_path(str(tmp_path))
+        assert fourth != third
+        assert cached_flake_store_path(str(tmp_path)) == fourth
+
+        # ... and then again, with the file already modified
+        os.utime(tmp_path / "sources" / "sources.json", ns=(0, 0))
+        assert cached_flake_store_path(str(tmp_path)) != fourth
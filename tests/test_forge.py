@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import time
+import unittest.mock
+from email.message import Message
+from typing import TYPE_CHECKING
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+
+import pytest
+
+from nix_update.version import (
+    VersionFetchConfig,
+    fetch_gitea_versions,
+    prepare_fetchers,
+    route_fetchers,
+)
+from nix_update.version.forge import (
+    FORGE_CACHE,
+    NEGATIVE_TTL,
+    ForgeType,
+    get_forge_type,
+    set_forge_type,
+)
+from nix_update.version.gitea import _probe_gitea, is_gitea_host
+from nix_update.version.version import VersionPreference
+
+if TYPE_CHECKING:
+    from contextlib import AbstractContextManager
+
+
+@pytest.fixture(autouse=True)
+def forges(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("nix_update.version.forge._forges", {})
+
+
+def test_probe_result_is_persisted(monkeypatch: pytest.MonkeyPatch) -> None:
+    probe = unittest.mock.Mock(return_value=True)
+    monkeypatch.setattr("nix_update.version.gitea._probe_gitea", probe)
+
+    assert is_gitea_host("git.example.com")
+    # A new run only finds the classification on disk
+    monkeypatch.setattr("nix_update.version.forge._forges", {})
+    assert is_gitea_host("git.example.com")
+    probe.assert_called_once_with("git.example.com")
+
+
+def test_timeout_is_not_persisted(monkeypatch: pytest.MonkeyPatch) -> None:
+    probe = unittest.mock.Mock(return_value=None)
+    monkeypatch.setattr("nix_update.version.gitea._probe_gitea", probe)
+
+    assert not is_gitea_host("slow.example.com")
+    # Not probed again within the run ...
+    assert not is_gitea_host("slow.example.com")
+    probe.assert_called_once()
+    # ... but in the next one
+    assert FORGE_CACHE.get("slow.example.com") is None
+
+
+def test_probe_only_decides_on_definitive_answers() -> None:
+    def fails_with(error: OSError) -> AbstractContextManager[object]:
+        return unittest.mock.patch(
+            "nix_update.version.gitea.urlopen",
+            side_effect=error,
+        )
+
+    with fails_with(TimeoutError("timed out")):
+        assert _probe_gitea("slow.example.com") is None
+    with fails_with(HTTPError("https://x", 503, "unavailable", Message(), None)):
+        assert _probe_gitea("down.example.com") is None
+    with fails_with(HTTPError("https://x", 404, "not found", Message(), None)):
+        assert _probe_gitea("www.example.com") is False
+
+
+def test_negative_result_expires() -> None:
+    FORGE_CACHE.set(
+        "down.example.com",
+        {"forge": ForgeType.UNKNOWN, "time": time.time() - NEGATIVE_TTL - 1},
+    )
+    assert get_forge_type("down.example.com") is None
+
+    set_forge_type("down.example.com", ForgeType.UNKNOWN)
+    assert get_forge_type("down.example.com") == ForgeType.UNKNOWN
+
+
+def test_gitlab_host_is_not_probed(monkeypatch: pytest.MonkeyPatch) -> None:
+    probe = unittest.mock.Mock(return_value=True)
+    monkeypatch.setattr("nix_update.version.gitea._probe_gitea", probe)
+
+    set_forge_type("gitlab.example.com", ForgeType.GITLAB)
+    assert not is_gitea_host("gitlab.example.com")
+    probe.assert_not_called()
+
+
+def test_routing_uses_classification() -> None:
+    config = VersionFetchConfig(preference=VersionPreference.STABLE, version_regex="")
+    url = urlparse("https://git.example.com/foo/bar/archive/v1.0.tar.gz")
+
+    set_forge_type("git.example.com", ForgeType.UNKNOWN)
+    fetchers, probing = route_fetchers(url, prepare_fetchers(config))
+    assert fetch_gitea_versions not in fetchers
+    assert not probing
+
+    set_forge_type("git.example.com", ForgeType.GITEA)
+    fetchers, probing = route_fetchers(url, prepare_fetchers(config))
+    assert fetch_gitea_versions in fetchers
+    assert not probing
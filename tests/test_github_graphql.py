@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+import unittest.mock
+from email.message import Message
+from io import BytesIO
+from typing import TYPE_CHECKING
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+
+import pytest
+
+from nix_update.version import VersionFetchConfig, fetch_latest_version
+from nix_update.version.github import prefetch_github_versions
+from nix_update.version.version import VersionPreference
+
+if TYPE_CHECKING:
+    from urllib.request import Request
+
+
+def repository(releases: list[tuple[str, bool]], tags: list[str]) -> dict:
+    return {
+        "releases": {
+            "nodes": [
+                {"tagName": tag, "isPrerelease": prerelease, "isDraft": False}
+                for tag, prerelease in releases
+            ],
+        },
+        "refs": {"nodes": [{"name": tag} for tag in tags]},
+    }
+
+
+REPOSITORIES = {
+    "owner/foo": repository([("v2.0.0", True), ("v1.1.0", False)], ["v1.0.0"]),
+    "owner/bar": repository([], ["v0.3.0"]),
+}
+
+
+@pytest.fixture(autouse=True)
+def graphql_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("GITHUB_TOKEN", "token")
+    monkeypatch.setattr("nix_update.version.github._graphql_versions", {})
+
+
+def fake_graphql(queries: list[str]) -> object:
+    def fake_urlopen(req: Request, timeout: float | None = None) -> BytesIO:
+        del timeout  # Unused in test
+        assert req.get_full_url() == "https://api.github.com/graphql"
+        assert req.get_header("Authorization") == "Bearer token"
+        assert isinstance(req.data, bytes)
+        query = json.loads(req.data)["query"]
+        queries.append(query)
+        data = {}
+        for alias, repo in REPOSITORIES.items():
+            owner, name = alias.split("/")
+            for i in range(len(REPOSITORIES)):
+                if f'r{i}: repository(owner: "{owner}", name: "{name}")' in query:
+                    data[f"r{i}"] = repo
+        return BytesIO(json.dumps({"data": data}).encode())
+
+    return fake_urlopen
+
+
+def latest(url: str, preference: VersionPreference) -> str:
+    return fetch_latest_version(
+        urlparse(url),
+        VersionFetchConfig(preference=preference, version_regex="v(.*)"),
+    ).number
+
+
+def test_prerelease_from_graphql() -> None:
+    queries: list[str] = []
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_graphql(queries)):
+        url = "https://github.com/owner/foo/archive/v1.0.0.tar.gz"
+        assert latest(url, VersionPreference.STABLE) == "1.1.0"
+        assert latest(url, VersionPreference.UNSTABLE) == "2.0.0"
+    # The second lookup is served from the first query
+    assert len(queries) == 1
+
+
+def test_batched_query() -> None:
+    queries: list[str] = []
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_graphql(queries)):
+        prefetch_github_versions(
+            [
+                urlparse("https://github.com/owner/foo/archive/v1.0.0.tar.gz"),
+                urlparse("https://github.com/owner/bar/archive/v0.1.0.tar.gz"),
+            ],
+        )
+        assert (
+            latest("https://github.com/owner/bar", VersionPreference.STABLE) == "0.3.0"
+        )
+    assert len(queries) == 1
+
+
+def test_fallback_to_feed() -> None:
+    requests: list[str] = []
+
+    def fake_urlopen(req: Request, timeout: float | None = None) -> BytesIO:
+        del timeout  # Unused in test
+        requests.append(req.get_full_url())
+        if req.get_full_url().endswith("/graphql"):
+            raise HTTPError(req.get_full_url(), 401, "Unauthorized", Message(), None)
+        feed = (
+            '<feed xmlns="http://www.w3.org/2005/Atom"><entry>'
+            '<link href="https://github.com/owner/foo/releases/tag/v1.2.0"/>'
+            "</entry></feed>"
+        )
+        return BytesIO(feed.encode())
+
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_urlopen):
+        assert (
+            latest("https://github.com/owner/foo", VersionPreference.STABLE) == "1.2.0"
+        )
+    assert requests == [
+        "https://api.github.com/graphql",
+        "https://github.com/owner/foo/releases.atom",
+    ]
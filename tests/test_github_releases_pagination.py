@@ -7,6 +7,7 @@ from typing import TYPE_CHECKING, BinaryIO
 from urllib.parse import parse_qs, urlparse
 
 from nix_update.version import VersionFetchConfig, fetch_latest_version
+from nix_update.version.http import record_requests
 from nix_update.version.version import VersionPreference
 
 if TYPE_CHECKING:
@@ -31,7 +32,7 @@ def test_paginates_past_prerelease_only_page(helpers: conftest.Helpers) -> None:
         page = int(parse_qs(urlparse(req.get_full_url()).query)["page"][0])
         return BytesIO(json.dumps(PAGES.get(page, [])).encode())
 
-    with unittest.mock.patch("urllib.request.urlopen", fake_urlopen):
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_urlopen):
         version = fetch_latest_version(
             urlparse("https://github.com/abhigyanpatwari/GitNexus"),
             VersionFetchConfig(
@@ -55,7 +56,7 @@ def test_releases_limit(helpers: conftest.Helpers) -> None:
         page = int(parse_qs(urlparse(req.get_full_url()).query)["page"][0])
         return BytesIO(json.dumps(PAGES.get(page, [])).encode())
 
-    with unittest.mock.patch("urllib.request.urlopen", fake_urlopen):
+    with unittest.mock.patch("nix_update.version.http.urlopen", fake_urlopen):
         version = fetch_latest_version(
             urlparse("https://github.com/abhigyanpatwari/GitNexus"),
             VersionFetchConfig(
@@ -69,3 +70,48 @@ def test_releases_limit(helpers: conftest.Helpers) -> None:
         )
     assert version.number == "1.6.6-rc.154"
     assert len(requests) == 1
+
+
+class LinkedPage(BytesIO):
+    def __init__(self, body: bytes, last_page: int) -> None:
+        super().__init__(body)
+        base = "https://api.github.com/repositories/1/releases?per_page=100"
+        self.headers = {
+            "Link": f'<{base}&page=2>; rel="next", <{base}&page={last_page}>; rel="last"',
+        }
+
+
+def test_concurrent_pages_from_link_header(helpers: conftest.Helpers) -> None:
+    del helpers
+    pages = {
+        page: [{"tag_name": f"v1.{page}.{n}", "prerelease": False} for n in range(100)]
+        for page in range(1, 6)
+    }
+    requests: list[int] = []
+
+    def fake_urlopen(req: Request, timeout: float | None = None) -> BinaryIO:
+        del timeout  # Unused in test
+        page = int(parse_qs(urlparse(req.get_full_url()).query)["page"][0])
+        requests.append(page)
+        return LinkedPage(json.dumps(pages[page]).encode(), last_page=len(pages))
+
+    with (
+        unittest.mock.patch("nix_update.version.http.urlopen", fake_urlopen),
+        record_requests() as stats,
+    ):
+        version = fetch_latest_version(
+            urlparse("https://github.com/abhigyanpatwari/GitNexus"),
+            VersionFetchConfig(
+                preference=VersionPreference.STABLE,
+                version_regex="v(.*)",
+                fetcher_args={
+                    "use_github_releases": True,
+                    "github_releases_limit": 400,
+                },
+            ),
+        )
+    assert version.number == "1.4.99"
+    # Pages beyond the limit are not requested
+    assert sorted(requests) == [1, 2, 3, 4]
+    # Including the pages fetched by the worker threads
+    assert stats.fetched == 4  # noqa: PLR2004
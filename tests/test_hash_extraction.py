@@ -1,8 +1,16 @@
 """Test hash extraction from Nix error messages."""
 
+import json
+import subprocess
+import unittest.mock
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
 import pytest
 
-from nix_update.dependency_hashes import extract_hash_from_nix_error
+from nix_update.dependency_hashes import extract_hash_from_nix_error, nix_prefetch_many
+from nix_update.options import Options
 
 
 @pytest.mark.parametrize(
@@ -136,3 +144,62 @@ def test_extract_hash_from_nix_error(stderr: str, expected: str | None) -> None:
     """Test hash extraction from various Nix error formats."""
     result = extract_hash_from_nix_error(stderr)
     assert result == expected
+
+
+def test_nix_prefetch_many_attributes_hashes(tmp_path: Path) -> None:
+    """Test mapping the hashes of a combined prefetch back to their attributes."""
+    vendor = "/nix/store/aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa-foo-vendor.drv"
+    npm = "/nix/store/cccccccccccccccccccccccccccccccc-foo-npm-deps.drv"
+    yarn = "/nix/store/eeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee-foo-yarn.drv"
+    stderrs = {
+        vendor: (
+            f"error: hash mismatch in fixed-output derivation '{vendor}':\n"
+            "  wanted: sha256:0000000000000000000000000000000000000000000000000000\n"
+            "  got:    sha256:00qz12iwzbh5bv3szvnqnq2a1c866v038z53i69jba74pwclhppg\n"
+        ),
+        npm: (
+            f"error: hash mismatch in fixed-output derivation '{npm}':\n"
+            "         specified: sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=\n"
+            "            got:    sha256-kRMUuBeA8m/a+H4XF0IQvb1AyGusF5UhLyV83CNqHng=\n"
+        ),
+        yarn: "error: hash mismatch\n  got:    sha256-YYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYY=\n",
+    }
+    realised: list[str] = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        if command[0] == "nix-instantiate" and "--eval" in command:
+            # cargoDeps and its vendor staging are the same derivation, the
+            # yarn cache fails to evaluate
+            drvs = [vendor, vendor, npm, None]
+            return subprocess.CompletedProcess(command, 0, json.dumps(drvs), "")
+        if command[0] == "nix-instantiate":
+            return subprocess.CompletedProcess(command, 0, f"{yarn}\n", "")
+        realised.append(command[2])
+        return subprocess.CompletedProcess(command, 1, "", stderrs[command[2]])
+
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    attrs: list[str | None] = [
+        "cargoDeps",
+        "cargoDeps.vendorStaging",
+        "npmDeps",
+        "offlineCache",
+    ]
+    with (
+        unittest.mock.patch("nix_update.dependency_hashes.run", fake_run),
+        unittest.mock.patch("nix_update.evaluator.run", fake_run),
+    ):
+        hashes = nix_prefetch_many(opts, attrs)
+    assert hashes == {
+        "cargoDeps": "sha256:00qz12iwzbh5bv3szvnqnq2a1c866v038z53i69jba74pwclhppg",
+        "cargoDeps.vendorStaging": (
+            "sha256:00qz12iwzbh5bv3szvnqnq2a1c866v038z53i69jba74pwclhppg"
+        ),
+        "npmDeps": "sha256-kRMUuBeA8m/a+H4XF0IQvb1AyGusF5UhLyV83CNqHng=",
+        # Evaluated on its own
+        "offlineCache": "sha256-YYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYYY=",
+    }
+    # Shared derivations are only built once
+    assert sorted(realised) == [vendor, npm, yarn]
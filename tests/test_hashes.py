@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import random
+
+import pytest
+
+from nix_update.hashes import HASH_SIZES, NIX32_CHARS, nix32_length, to_sri
+
+
+def nix32_encode(digest: bytes) -> str:
+    """Reference encoder, transcribed from Nix's printHash32."""
+    chars = []
+    for n in reversed(range(nix32_length(len(digest)))):
+        b = n * 5
+        i, j = divmod(b, 8)
+        c = digest[i] >> j
+        if i + 1 < len(digest):
+            c |= digest[i + 1] << (8 - j)
+        chars.append(NIX32_CHARS[c & 0x1F])
+    return "".join(chars)
+
+
+@pytest.mark.parametrize(
+    ("hashstr", "expected"),
+    [
+        # Hashes of the empty string, as printed by `nix hash file /dev/null`
+        pytest.param(
+            "0mdqa9w1p6cmli6976v4wi0sw9r4p5prkj7lzfd1877wk11c9c73",
+            "sha256-47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=",
+            id="sha256_nix32",
+        ),
+        pytest.param(
+            "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
+            "sha256-47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=",
+            id="sha256_base16",
+        ),
+        pytest.param(
+            "47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=",
+            "sha256-47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=",
+            id="sha256_base64",
+        ),
+        pytest.param(
+            "d41d8cd98f00b204e9800998ecf8427e",
+            "md5-1B2M2Y8AsgTpgAmY7PhCfg==",
+            id="md5_base16",
+        ),
+        pytest.param(
+            "da39a3ee5e6b4b0d3255bfef95601890afd80709",
+            "sha1-2jmj7l5rSw0yVb/vlWAYkK/YBwk=",
+            id="sha1_base16",
+        ),
+        # Already SRI or prefixed hashes are left alone
+        pytest.param(
+            "sha256-47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=",
+            "sha256-47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=",
+            id="sri",
+        ),
+        pytest.param(
+            "sha256:0mdqa9w1p6cmli6976v4wi0sw9r4p5prkj7lzfd1877wk11c9c73",
+            "sha256:0mdqa9w1p6cmli6976v4wi0sw9r4p5prkj7lzfd1877wk11c9c73",
+            id="prefixed",
+        ),
+    ],
+)
+def test_to_sri(hashstr: str, expected: str) -> None:
+    assert to_sri(hashstr) == expected
+
+
+@pytest.mark.parametrize("algo", ["md5", "sha1", "sha256", "sha512"])
+def test_to_sri_roundtrip(algo: str) -> None:
+    rng = random.Random(algo)  # noqa: S311
+    for _ in range(200):
+        digest = hashlib.new(algo, rng.randbytes(rng.randrange(64))).digest()
+        assert len(digest) == HASH_SIZES[algo]
+        sri = f"{algo}-{base64.b64encode(digest).decode()}"
+        assert to_sri(digest.hex()) == sri
+        assert to_sri(base64.b64encode(digest).decode()) == sri
+        # A 32 character base-32 hash would be taken for md5 in base-16
+        if algo != "sha1":
+            assert to_sri(nix32_encode(digest)) == sri
+
+
+@pytest.mark.parametrize(
+    "hashstr",
+    [
+        "",
+        "not a hash",
+        # "e" is not part of the base-32 alphabet
+        "emdqa9w1p6cmli6976v4wi0sw9r4p5prkj7lzfd1877wk11c9c73",
+        # Does not fit into 32 bytes
+        "zzdqa9w1p6cmli6976v4wi0sw9r4p5prkj7lzfd1877wk11c9c73",
+    ],
+)
+def test_to_sri_invalid(hashstr: str) -> None:
+    with pytest.raises(ValueError, match="hash"):
+        to_sri(hashstr)
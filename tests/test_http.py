@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import threading
+import unittest.mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, ClassVar
+
+import pytest
+
+from nix_update.version.http import _netrc, _netrc_auth, auth_headers, urlopen
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    clients: ClassVar[list[tuple[str, int]]] = []
+
+    def do_GET(self) -> None:
+        self.clients.append(self.client_address)
+        body = self.headers["User-Agent"].encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    Handler.clients = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_connection_reuse(server: str) -> None:
+    with unittest.mock.patch.dict("os.environ", {"no_proxy": "*"}):
+        for _ in range(3):
+            with urlopen(f"{server}/releases.atom") as resp:
+                assert resp.read().startswith(b"nix-update/")
+
+    # All requests went over the same keep-alive connection
+    assert len(Handler.clients) == 3  # noqa: PLR2004
+    assert len(set(Handler.clients)) == 1
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        ("https://api.github.com/repos/a/b/releases", "Bearer gh"),
+        ("https://github.example.com/api/v3/repos/a/b/releases", "Bearer gh"),
+        ("https://gitlab.com/api/v4/projects/1/repository/tags", "Bearer gl"),
+        ("https://github.com/a/b/releases.atom", None),
+    ],
+)
+def test_auth_headers(url: str, expected: str | None) -> None:
+    env = {"GITHUB_TOKEN": "gh", "GITLAB_TOKEN": "gl"}
+    with (
+        unittest.mock.patch.dict("os.environ", env),
+        unittest.mock.patch("nix_update.version.http._netrc_auth", return_value=None),
+    ):
+        assert auth_headers(url).get("Authorization") == expected
+
+
+def test_netrc_only_for_github(tmp_path: Path) -> None:
+    netrc_file = tmp_path / ".netrc"
+    netrc_file.write_text("default login user password secret\n")
+    netrc_file.chmod(0o600)
+    _netrc.cache_clear()
+    _netrc_auth.cache_clear()
+    try:
+        with (
+            unittest.mock.patch.dict("os.environ", {"HOME": str(tmp_path)}),
+            unittest.mock.patch("nix_update.version.http.info") as info,
+        ):
+            # Other hosts never get the credentials, not even the default entry
+            assert auth_headers("https://pypi.org/pypi/foo/json") == {}
+            for _ in range(2):
+                headers = auth_headers(
+                    "https://github.com/a/b/releases.atom",
+                    netrc_host="github.com",
+                )
+                assert headers["Authorization"].startswith("Basic ")
+            netrc_file.unlink()
+            # The file is only parsed once per run
+            assert auth_headers(
+                "https://github.example.com/a/b/releases.atom",
+                netrc_host="github.example.com",
+            )
+    finally:
+        _netrc.cache_clear()
+        _netrc_auth.cache_clear()
+    # Logged once per host
+    assert info.call_args_list == [unittest.mock.call("using netrc file")] * 2
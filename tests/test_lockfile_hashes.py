@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import subprocess
+import unittest.mock
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+
+from nix_update.dependency_hashes import (
+    LockfileCheck,
+    check_lockfiles,
+    instantiate_old_src,
+    lookup_lockfile_hash,
+)
+from nix_update.lockfile import lockfile_digest
+from nix_update.options import Options
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+
+def make_src(path: Path, files: dict[str, str]) -> Path:
+    for name, content in files.items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_text(content)
+    return path
+
+
+def test_lockfile_digest(tmp_path: Path) -> None:
+    old = make_src(tmp_path / "old", {"sub/Cargo.lock": "a", "src/main.rs": "1"})
+    new = make_src(tmp_path / "new", {"sub/Cargo.lock": "a", "src/main.rs": "2"})
+    moved = make_src(tmp_path / "moved", {"Cargo.lock": "a"})
+    changed = make_src(tmp_path / "changed", {"sub/Cargo.lock": "b"})
+
+    digest = lockfile_digest(old, ["Cargo.lock"])
+    assert digest is not None
+    assert lockfile_digest(new, ["Cargo.lock"]) == digest
+    assert lockfile_digest(moved, ["Cargo.lock"]) != digest
+    assert lockfile_digest(changed, ["Cargo.lock"]) != digest
+    assert lockfile_digest(old, ["yarn.lock"]) is None
+    assert lockfile_digest(old / "src" / "main.rs", ["Cargo.lock"]) is None
+
+
+def test_check_lockfiles(tmp_path: Path) -> None:
+    old = make_src(tmp_path / "old", {"Cargo.lock": "a", "yarn.lock": "a"})
+    new = make_src(tmp_path / "new", {"Cargo.lock": "a", "yarn.lock": "b"})
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        assert command[:3] == ["nix-store", "--realise", "/nix/store/old-src.drv"]
+        return subprocess.CompletedProcess(command, 0, f"{old}\n", "")
+
+    package = SimpleNamespace(
+        src_drv_path="/nix/store/old-src.drv",
+        cargo_deps="sha256-cargo",
+        yarn_deps="sha256-yarn",
+    )
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with (
+        unittest.mock.patch("nix_update.dependency_hashes.run", fake_run),
+        unittest.mock.patch(
+            "nix_update.source.src",
+            return_value=new,
+        ),
+    ):
+        check = check_lockfiles(opts, package)  # type: ignore[arg-type]
+    assert check.digests.keys() == {"cargo_deps", "yarn_deps"}
+    assert check.unchanged == {"cargo_deps"}
+
+
+def test_instantiate_old_src(tmp_path: Path) -> None:
+    commands: list[Sequence[str]] = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, "/nix/store/old-src.drv\n", "")
+
+    package = SimpleNamespace(src_drv_path="/nix/store/old-src.drv")
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with unittest.mock.patch("nix_update.evaluator.run", fake_run):
+        instantiate_old_src(opts, package)  # type: ignore[arg-type]
+    assert package.src_drv_path == "/nix/store/old-src.drv"
+    # A real instantiation, which writes the derivation to the store
+    assert commands[0][0] == "nix-instantiate"
+    assert "--eval" not in commands[0]
+
+
+def test_lookup_lockfile_hash(tmp_path: Path) -> None:
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    lockfiles = LockfileCheck({"cargo_deps": "digest"}, {"cargo_deps"})
+    old = SimpleNamespace(cargo_deps="sha256-old")
+    other = SimpleNamespace(cargo_deps="sha256-other")
+
+    with unittest.mock.patch(
+        "nix_update.dependency_hashes.fetcher_fingerprint",
+        return_value="fetcher",
+    ) as fingerprint:
+        # A lockfile that was never seen does not need the fetcher
+        lockfiles.digests["cargo_deps"] = "new-digest"
+        lockfiles.unchanged.clear()
+        key, known = lookup_lockfile_hash(opts, other, lockfiles, "cargo_deps")  # type: ignore[arg-type]
+        assert key == ("cargoDeps", "new-digest")
+        assert known is None
+        fingerprint.assert_not_called()
+
+        # The unchanged hash is remembered for the lockfile ...
+        lockfiles.digests["cargo_deps"] = "digest"
+        lockfiles.unchanged.add("cargo_deps")
+        _, known = lookup_lockfile_hash(opts, old, lockfiles, "cargo_deps")  # type: ignore[arg-type]
+        assert known == "sha256-old"
+
+        # ... and reused by another package with the same lockfile
+        lockfiles.unchanged.clear()
+        assert lookup_lockfile_hash(opts, other, lockfiles, "cargo_deps") == (  # type: ignore[arg-type]
+            ("cargoDeps", "digest"),
+            "sha256-old",
+        )
+
+    with unittest.mock.patch(
+        "nix_update.dependency_hashes.fetcher_fingerprint",
+        return_value="new-fetcher",
+    ):
+        # Not so the same lockfile with a different fetcher
+        _, known = lookup_lockfile_hash(opts, other, lockfiles, "cargo_deps")  # type: ignore[arg-type]
+        assert known is None
+
+
+def test_check_lockfiles_ignores_composer(tmp_path: Path) -> None:
+    # The Composer autoloader depends on the source, not just on the lockfile
+    package = SimpleNamespace(
+        src_drv_path="/nix/store/old-src.drv",
+        composer_deps="sha256-composer",
+    )
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with (
+        unittest.mock.patch("nix_update.dependency_hashes.run") as run,
+        unittest.mock.patch("nix_update.source.src") as src,
+    ):
+        check = check_lockfiles(opts, package)  # type: ignore[arg-type]
+    assert check == LockfileCheck()
+    run.assert_not_called()
+    src.assert_not_called()
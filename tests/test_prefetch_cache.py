@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import unittest.mock
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+
+from nix_update.dependency_hashes import (
+    _update_dependency_hashes,
+    nix_prefetch,
+    nix_prefetch_many,
+)
+from nix_update.options import Options
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+DRV = "/nix/store/aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa-source.drv"
+GOT = "sha256-kRMUuBeA8m/a+H4XF0IQvb1AyGusF5UhLyV83CNqHng="
+
+
+def test_nix_prefetch_cache(tmp_path: Path) -> None:
+    commands: list[str] = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        commands.append(command[0])
+        if command[0] == "nix-instantiate":
+            return subprocess.CompletedProcess(command, 0, f"{DRV}\n", "")
+        assert command[:3] == ["nix-store", "--realise", DRV]
+        stderr = (
+            f"error: hash mismatch in fixed-output derivation '{DRV}':\n"
+            "         specified: sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=\n"
+            f"            got:    {GOT}\n"
+        )
+        return subprocess.CompletedProcess(command, 1, "", stderr)
+
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with (
+        unittest.mock.patch("nix_update.dependency_hashes.run", fake_run),
+        unittest.mock.patch("nix_update.evaluator.run", fake_run),
+    ):
+        assert nix_prefetch(opts, "src") == GOT
+        # The second prefetch of the same derivation does not build anything
+        assert nix_prefetch(opts, "src") == GOT
+
+    assert commands == ["nix-instantiate", "nix-store", "nix-instantiate"]
+
+
+def test_nix_prefetch_many_instantiates_once(tmp_path: Path) -> None:
+    drvs = {
+        "cargoDeps": "/nix/store/bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb-vendor.drv",
+        "npmDeps": "/nix/store/cccccccccccccccccccccccccccccccc-npm-deps.drv",
+    }
+    hashes = {
+        drvs["cargoDeps"]: GOT,
+        drvs["npmDeps"]: "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=",
+    }
+    commands: list[Sequence[str]] = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        commands.append(command)
+        if command[0] == "nix-instantiate":
+            # The derivations must be written to the store to be realised
+            assert "--eval" in command
+            assert "--read-write-mode" in command
+            return subprocess.CompletedProcess(
+                command,
+                0,
+                json.dumps([drvs["cargoDeps"], drvs["npmDeps"]]),
+                "",
+            )
+        assert command[:2] == ["nix-store", "--realise"]
+        stderr = (
+            f"error: hash mismatch in fixed-output derivation '{command[2]}':\n"
+            f"            got:    {hashes[command[2]]}\n"
+        )
+        return subprocess.CompletedProcess(command, 1, "", stderr)
+
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with (
+        unittest.mock.patch("nix_update.dependency_hashes.run", fake_run),
+        unittest.mock.patch("nix_update.evaluator.run", fake_run),
+    ):
+        assert nix_prefetch_many(opts, ["cargoDeps", "npmDeps"]) == {
+            "cargoDeps": GOT,
+            "npmDeps": hashes[drvs["npmDeps"]],
+        }
+
+    assert [c[0] for c in commands].count("nix-instantiate") == 1
+    assert sorted(c[2] for c in commands if c[0] == "nix-store") == sorted(
+        drvs.values(),
+    )
+
+
+def test_dependency_hashes_evaluate_once(tmp_path: Path) -> None:
+    hashes = {
+        "cargoDeps": "sha256-BBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBB=",
+        "npmDeps": "sha256-CCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCC=",
+        "goModules": "sha256-DDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDD=",
+    }
+    drvs = {
+        attr: f"/nix/store/{letter * 32}-{attr}.drv"
+        for attr, letter in zip(hashes, "bcd", strict=True)
+    }
+    nix_file = tmp_path / "default.nix"
+    nix_file.write_text(
+        '{ cargoHash = "sha256-cargo"; npmDepsHash = "sha256-npm";'
+        ' vendorHash = "sha256-go"; }',
+    )
+    commands: list[Sequence[str]] = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        commands.append(command)
+        if command[0] == "nix-instantiate" and "--eval" in command:
+            drv_paths = [drvs["cargoDeps"], drvs["npmDeps"]]
+            return subprocess.CompletedProcess(command, 0, json.dumps(drv_paths), "")
+        if command[0] == "nix-instantiate":
+            assert "goModules" in command[command.index("--expr") + 1]
+            return subprocess.CompletedProcess(command, 0, f"{drvs['goModules']}\n", "")
+        assert command[:2] == ["nix-store", "--realise"]
+        (attr,) = (attr for attr, drv in drvs.items() if drv == command[2])
+        stderr = f"            got:    {hashes[attr]}\n"
+        return subprocess.CompletedProcess(command, 1, "", stderr)
+
+    package = SimpleNamespace(
+        filename=str(nix_file),
+        yarn_berry_missing_hashes_path=None,
+        cargo_deps="sha256-cargo",
+        npm_deps="sha256-npm",
+        go_modules="sha256-go",
+        custom_deps=None,
+        cargo_lock=None,
+        has_nuget_deps=False,
+        has_gradle_mitm_cache=False,
+    )
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with (
+        unittest.mock.patch("nix_update.dependency_hashes.run", fake_run),
+        unittest.mock.patch("nix_update.evaluator.run", fake_run),
+    ):
+        _update_dependency_hashes(opts, package)  # type: ignore[arg-type]
+
+    # The independent hashes share one evaluation, Go modules come afterwards
+    instantiations = [c for c in commands if c[0] == "nix-instantiate"]
+    assert len(instantiations) == 2  # noqa: PLR2004
+    assert "--eval" in instantiations[0]
+    assert nix_file.read_text() == (
+        f'{{ cargoHash = "{hashes["cargoDeps"]}"; npmDepsHash = "{hashes["npmDeps"]}";'
+        f' vendorHash = "{hashes["goModules"]}"; }}'
+    )
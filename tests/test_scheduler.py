@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from nix_update.scheduler import Scheduler, Stage
+
+PREFETCH_JOBS = 2
+
+
+def test_stage_limit() -> None:
+    scheduler = Scheduler({Stage.PREFETCH: PREFETCH_JOBS})
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def job() -> None:
+        nonlocal running, max_running
+        with scheduler.stage(Stage.PREFETCH):
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            threading.Event().wait(0.01)
+            with lock:
+                running -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(16):
+            executor.submit(job)
+
+    assert max_running <= PREFETCH_JOBS
+
+
+def test_unconfigured_stage_is_unbounded() -> None:
+    scheduler = Scheduler()
+    with scheduler.stage(Stage.FETCH), scheduler.stage(Stage.FETCH):
+        pass
+
+
+def test_lock_paths_overlapping() -> None:
+    scheduler = Scheduler()
+    order: list[str] = []
+
+    def job(name: str, paths: list[str]) -> None:
+        with scheduler.lock_paths(paths):
+            order.append(f"{name}-start")
+            threading.Event().wait(0.01)
+            order.append(f"{name}-end")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        executor.submit(job, "a", ["pkgs/foo", "pkgs/bar"])
+        executor.submit(job, "b", ["pkgs/bar", "pkgs/foo"])
+
+    # Overlapping paths never run at the same time, and reversed lock order
+    # does not deadlock
+    assert order in (
+        ["a-start", "a-end", "b-start", "b-end"],
+        ["b-start", "b-end", "a-start", "a-end"],
+    )
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import unittest.mock
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from nix_update import source
+from nix_update.errors import UpdateError
+from nix_update.options import Options
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+
+def test_scope_realises_once(tmp_path: Path) -> None:
+    src = tmp_path / "src"
+    (src / "nix-support").mkdir(parents=True)
+    (src / "nix-support" / "npm-bin").write_text("/nix/store/npm/bin/npm\n")
+    (src / "nix-support" / "cargo-bin").write_text("")
+    commands: list[str] = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        commands.append(command[0])
+        if command[:2] == ["nix-instantiate", "--eval"]:
+            return subprocess.CompletedProcess(command, 0, json.dumps(str(src)), "")
+        if command[0] == "nix-instantiate":
+            drv = "/nix/store/aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa-unpacked.drv"
+            return subprocess.CompletedProcess(command, 0, f"{drv}\n", "")
+        return subprocess.CompletedProcess(command, 0, f"{src}\n", "")
+
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with unittest.mock.patch("nix_update.evaluator.run", fake_run):
+        with source.scope(opts):
+            assert source.src(opts) == src
+            assert source.unpacked(opts) == src
+            with source.scope(opts):
+                assert source.src(opts) == src
+            assert source.tool(opts, "npm") == "/nix/store/npm/bin/npm"
+            with pytest.raises(UpdateError, match="no cargo executable"):
+                source.tool(opts, "cargo")
+        assert commands == ["nix-instantiate", "nix-instantiate", "nix-store"]
+
+        # Outside of a scope nothing is shared
+        source.src(opts)
+        source.src(opts)
+        assert commands[3:] == ["nix-instantiate", "nix-instantiate"]
+
+
+def test_scope_survives_new_flake_copies(tmp_path: Path) -> None:
+    src = tmp_path / "src"
+    src.mkdir()
+    commands: list[str] = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        commands.append(command[0])
+        return subprocess.CompletedProcess(command, 0, json.dumps(str(src)), "")
+
+    # Every file written within the scope leads to a new copy of the flake
+    copies = iter(f"/nix/store/{i}-source" for i in range(10))
+    opts = Options(attribute="foo", import_path=str(tmp_path), flake=True)
+    with (
+        unittest.mock.patch("nix_update.evaluator.run", fake_run),
+        unittest.mock.patch(
+            "nix_update.options.cached_flake_store_path",
+            side_effect=lambda _: next(copies),
+        ),
+        source.scope(opts),
+    ):
+        assert source.src(opts) == src
+        assert source.src(opts) == src
+    assert commands == ["nix-instantiate"]
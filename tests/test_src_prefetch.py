@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import unittest.mock
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, cast
+
+from nix_update.errors import UpdateError
+from nix_update.options import Options
+from nix_update.src_prefetch import (
+    fast_update_src_hash,
+    new_src_url,
+    src_unpack,
+    update_system_src_hashes,
+)
+from nix_update.version.version import Version
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+    import pytest
+
+FETCHZIP_POST_FETCH = """unpackDir="$TMPDIR/unpack"
+mkdir "$unpackDir"
+cd "$unpackDir"
+
+renamed="$TMPDIR/v1.2.tar.gz"
+mv "$downloadedFile" "$renamed"
+unpackFile "$renamed"
+chmod -R +w "$unpackDir"
+if [ $(ls -A "$unpackDir" | wc -l) != 1 ]; then
+  echo "error: zip file must contain a single file or directory."
+  exit 1
+fi
+fn=$(cd "$unpackDir" && ls -A)
+if [ -f "$unpackDir/$fn" ]; then
+  mkdir $out
+fi
+mv "$unpackDir/$fn" "$out"
+
+
+chmod 755 "$out"
+"""
+
+
+def make_package(**kwargs: Any) -> Any:  # noqa: ANN401
+    defaults: dict[str, Any] = {
+        "url": "https://github.com/foo/bar/archive/v1.2.tar.gz",
+        "urls": None,
+        "rev": "v1.2",
+        "tag": None,
+        "old_version": "1.2",
+        "new_version": Version("1.3"),
+        "hash": "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=",
+        "src_name": "source",
+        "src_hash_mode": "recursive",
+        "src_post_fetch": FETCHZIP_POST_FETCH,
+    }
+    return SimpleNamespace(**{**defaults, **kwargs})
+
+
+def test_src_unpack() -> None:
+    assert src_unpack(make_package()) is True
+    assert src_unpack(make_package(src_hash_mode="flat", src_post_fetch="")) is False
+    extra = FETCHZIP_POST_FETCH.replace('"$out"\n\n', '"$out"\nrm -r "$out/docs"\n')
+    assert src_unpack(make_package(src_post_fetch=extra)) is None
+    assert src_unpack(make_package(src_hash_mode="flat", src_post_fetch="x")) is None
+    assert src_unpack(make_package(src_hash_mode=None)) is None
+
+
+def test_new_src_url() -> None:
+    assert (
+        new_src_url(make_package(url="https://example.com/foo-1.2.tar.gz", rev=None))
+        == "https://example.com/foo-1.3.tar.gz"
+    )
+    assert (
+        new_src_url(make_package()) == "https://github.com/foo/bar/archive/v1.3.tar.gz"
+    )
+    commit = "0" * 40
+    assert (
+        new_src_url(
+            make_package(
+                url=f"https://github.com/foo/bar/archive/{commit}.tar.gz",
+                rev=commit,
+                new_version=Version("1.3", rev="1" * 40),
+            ),
+        )
+        == f"https://github.com/foo/bar/archive/{'1' * 40}.tar.gz"
+    )
+    # 1.2 is not part of 1.23
+    assert (
+        new_src_url(make_package(url="https://example.com/1.23/foo-1.2.tar.gz"))
+        == "https://example.com/1.23/foo-1.3.tar.gz"
+    )
+    # The version is nowhere in the URL, so the new URL is unknown
+    assert new_src_url(make_package(url="https://example.com/latest.tar.gz")) is None
+    assert new_src_url(make_package(url="mirror://gnu/foo-1.2.tar.gz")) is None
+
+
+def test_fast_update_src_hash(tmp_path: Path) -> None:
+    nix_file = tmp_path / "default.nix"
+    old_hash = "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA="
+    new_hash = "sha256-kRMUuBeA8m/a+H4XF0IQvb1AyGusF5UhLyV83CNqHng="
+    nix_file.write_text(f'{{ hash = "{old_hash}"; }}\n')
+    commands = []
+
+    def fake_run(
+        command: Sequence[str],
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> subprocess.CompletedProcess[str]:
+        commands.append(list(command))
+        return subprocess.CompletedProcess(
+            command,
+            0,
+            json.dumps({"hash": new_hash, "storePath": "/nix/store/x-source"}),
+            "",
+        )
+
+    package = make_package(
+        filename=str(nix_file),
+        url="https://example.com/foo-1.2.tar.gz",
+        rev=None,
+        src_name="foo-1.2.tar.gz",
+        src_hash_mode="flat",
+        src_post_fetch="",
+    )
+    opts = Options(attribute="foo", import_path=str(tmp_path))
+    with unittest.mock.patch("nix_update.src_prefetch.run", fake_run):
+        assert fast_update_src_hash(opts, package)
+
+    assert nix_file.read_text() == f'{{ hash = "{new_hash}"; }}\n'
+    (command,) = commands
+    assert command[:3] == ["nix", "store", "prefetch-file"]
+    assert "--unpack" not in command
+    assert command[command.index("--name") + 1] == "foo-1.3.tar.gz"
+    assert "https://example.com/foo-1.3.tar.gz" in command
+
+
+def test_update_system_src_hashes(tmp_path: Path) -> None:
+    linux_hash = "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA="
+    darwin_hash = "sha256-BBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBB="
+    new_darwin_hash = "sha256-kRMUuBeA8m/a+H4XF0IQvb1AyGusF5UhLyV83CNqHng="
+    nix_file = tmp_path / "default.nix"
+    nix_file.write_text(
+        f'{{ x86_64-linux = "{linux_hash}"; aarch64-darwin = "{darwin_hash}"; }}',
+    )
+    packages = {
+        "x86_64-linux": make_package(hash=linux_hash),
+        "aarch64-darwin": make_package(
+            url="https://example.com/bar-1.3-darwin.zip",
+            hash=darwin_hash,
+            src_name="bar-1.3-darwin.zip",
+            src_hash_mode="flat",
+            src_post_fetch="",
+        ),
+    }
+    evaluated = []
+
+    def eval_attr(opts: Options, _fields: list[str]) -> Any:  # noqa: ANN401
+        evaluated.append(opts.system)
+        assert opts.extra_flags[-2:] == ["--eval-system", opts.system]
+        return packages[cast("str", opts.system)]
+
+    opts = Options(
+        attribute="bar",
+        system="x86_64-linux",
+        extra_flags=["--eval-system", "x86_64-linux"],
+        src_systems=["x86_64-linux", "aarch64-darwin"],
+    )
+    with (
+        unittest.mock.patch("nix_update.src_prefetch.eval_attr", eval_attr),
+        unittest.mock.patch(
+            "nix_update.src_prefetch.prefetch_file",
+            return_value=new_darwin_hash,
+        ) as prefetch_file,
+    ):
+        update_system_src_hashes(
+            opts,
+            make_package(filename=str(nix_file), hash=linux_hash),
+        )
+
+    assert sorted(evaluated) == ["aarch64-darwin", "x86_64-linux"]
+    # The source of the local system is updated as usual
+    prefetch_file.assert_called_once()
+    assert prefetch_file.call_args.args[1:] == (
+        "https://example.com/bar-1.3-darwin.zip",
+        "bar-1.3-darwin.zip",
+    )
+    assert prefetch_file.call_args.kwargs == {"unpack": False}
+    assert nix_file.read_text() == (
+        f'{{ x86_64-linux = "{linux_hash}"; aarch64-darwin = "{new_darwin_hash}"; }}'
+    )
+
+
+def test_update_system_src_hashes_with_host_fetcher(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    linux_hash = "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA="
+    darwin_hash = "sha256-BBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBB="
+    aarch64_hash = "sha256-CCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCC="
+    new_darwin_hash = "sha256-kRMUuBeA8m/a+H4XF0IQvb1AyGusF5UhLyV83CNqHng="
+    nix_file = tmp_path / "default.nix"
+    nix_file.write_text(
+        f'{{ aarch64-darwin = "{darwin_hash}"; aarch64-linux = "{aarch64_hash}"; }}',
+    )
+    packages = {
+        "aarch64-darwin": make_package(
+            url="mirror://sourceforge/bar/bar-1.3-darwin.zip",
+            hash=darwin_hash,
+            src_name="bar-1.3-darwin.zip",
+            src_hash_mode="flat",
+            src_post_fetch="",
+        ),
+        # Not a plain download, so it has to be built on aarch64-linux
+        "aarch64-linux": make_package(
+            hash=aarch64_hash,
+            src_post_fetch=FETCHZIP_POST_FETCH + 'rm -r "$out/docs"\n',
+        ),
+    }
+
+    def eval_attr(opts: Options, _fields: list[str]) -> Any:  # noqa: ANN401
+        return packages[cast("str", opts.system)]
+
+    def nix_prefetch(opts: Options, _attr: str) -> str:
+        msg = f"cannot build on {opts.system}"
+        raise UpdateError(msg)
+
+    opts = Options(
+        attribute="bar",
+        system="x86_64-linux",
+        src_systems=["aarch64-darwin", "aarch64-linux"],
+    )
+    with (
+        unittest.mock.patch("nix_update.src_prefetch.eval_attr", eval_attr),
+        unittest.mock.patch("nix_update.src_prefetch.nix_prefetch", nix_prefetch),
+        unittest.mock.patch(
+            "nix_update.src_prefetch.nix_prefetch_with",
+            return_value=new_darwin_hash,
+        ) as nix_prefetch_with,
+    ):
+        update_system_src_hashes(
+            opts,
+            make_package(filename=str(nix_file), hash=linux_hash),
+        )
+
+    # The mirror:// source is fetched with the fetcher of the local system
+    nix_prefetch_with.assert_called_once_with(
+        opts,
+        "src",
+        {
+            "urls": ["mirror://sourceforge/bar/bar-1.3-darwin.zip"],
+            "postFetch": "",
+            "outputHashMode": "flat",
+            "downloadToTemp": False,
+        },
+    )
+    # The failing system is reported without aborting the others
+    assert "aarch64-linux: cannot build on aarch64-linux" in capsys.readouterr().err
+    assert nix_file.read_text() == (
+        f'{{ aarch64-darwin = "{new_darwin_hash}"; aarch64-linux = "{aarch64_hash}"; }}'
+    )
+
+
+def test_update_system_src_hashes_skips_failing_evaluation(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    linux_hash = "sha256-AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA="
+    darwin_hash = "sha256-BBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBB="
+    new_darwin_hash = "sha256-kRMUuBeA8m/a+H4XF0IQvb1AyGusF5UhLyV83CNqHng="
+    nix_file = tmp_path / "default.nix"
+    nix_file.write_text(f'{{ aarch64-darwin = "{darwin_hash}"; }}')
+
+    def eval_attr(opts: Options, _fields: list[str]) -> Any:  # noqa: ANN401
+        if opts.system == "riscv64-linux":
+            raise subprocess.CalledProcessError(1, "nix-instantiate")
+        return make_package(
+            url="https://example.com/bar-1.3-darwin.zip",
+            hash=darwin_hash,
+            src_hash_mode="flat",
+            src_post_fetch="",
+        )
+
+    opts = Options(
+        attribute="bar",
+        system="x86_64-linux",
+        src_systems=["riscv64-linux", "aarch64-darwin"],
+    )
+    with (
+        unittest.mock.patch("nix_update.src_prefetch.eval_attr", eval_attr),
+        unittest.mock.patch(
+            "nix_update.src_prefetch.prefetch_file",
+            return_value=new_darwin_hash,
+        ),
+    ):
+        update_system_src_hashes(
+            opts,
+            make_package(filename=str(nix_file), hash=linux_hash),
+        )
+
+    assert "could not update the source hash for riscv64-linux" in (
+        capsys.readouterr().err
+    )
+    assert nix_file.read_text() == f'{{ aarch64-darwin = "{new_darwin_hash}"; }}'
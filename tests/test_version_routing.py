@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import threading
+import unittest.mock
+from io import BytesIO
+from urllib.parse import ParseResult, urlparse
+from urllib.request import Request
+
+from nix_update.version import (
+    VersionFetchConfig,
+    fetch_crate_versions,
+    fetch_gitea_versions,
+    fetch_github_versions,
+    fetch_gitlab_versions,
+    prepare_fetchers,
+    route_fetchers,
+    run_fetchers,
+)
+from nix_update.version.http import fetch, record_requests
+from nix_update.version.version import Version, VersionPreference
+
+
+def routed(url: str) -> tuple[list, bool]:
+    config = VersionFetchConfig(preference=VersionPreference.STABLE, version_regex="")
+    fetchers, probing = route_fetchers(urlparse(url), prepare_fetchers(config))
+    return [getattr(f, "func", f) for f in fetchers], probing
+
+
+def test_route_known_host() -> None:
+    fetchers, probing = routed("https://crates.io/api/v1/crates/foo/1.0.0/download")
+    assert fetchers == [
+        fetch_crate_versions,
+        fetch_github_versions,
+        fetch_gitlab_versions,
+    ]
+    assert not probing
+
+
+def test_route_known_gitea_host() -> None:
+    fetchers, probing = routed("https://codeberg.org/foo/bar/archive/v1.0.tar.gz")
+    assert fetch_gitea_versions in fetchers
+    assert not probing
+
+
+def test_route_github_and_gitlab_hosts() -> None:
+    for url in [
+        "https://github.com/foo/bar/archive/v1.0.tar.gz",
+        "https://api.github.com/repos/foo/bar/tarball/v1.0",
+        "https://gitlab.com/api/v4/projects/foo%2Fbar/repository/archive.tar.gz?sha=v1.0",
+        # Paths that only GitHub Enterprise and GitLab serve
+        "https://github.example.com/api/v3/repos/foo/bar/tarball/v1.0",
+        "https://gitlab.example.com/api/v4/projects/1/repository/archive.tar.gz?sha=v1.0",
+    ]:
+        fetchers, probing = routed(url)
+        assert fetchers == [fetch_github_versions, fetch_gitlab_versions], url
+        assert not probing, url
+
+
+def test_route_unknown_host() -> None:
+    fetchers, probing = routed("https://git.example.com/foo/bar/archive/v1.0.tar.gz")
+    assert fetchers == [
+        fetch_github_versions,
+        fetch_gitlab_versions,
+        fetch_gitea_versions,
+    ]
+    assert probing
+
+
+def test_run_fetchers_concurrently() -> None:
+    probed = threading.Event()
+
+    def slow(url: ParseResult) -> list[Version]:
+        del url
+        # Only returns if the probe runs at the same time
+        assert probed.wait(timeout=10)
+        return []
+
+    def probe(url: ParseResult) -> list[Version]:
+        del url
+        probed.set()
+        return [Version("1.0")]
+
+    url = urlparse("https://git.example.com/foo/bar")
+    results = list(run_fetchers(url, [slow, probe], concurrent=True))
+    assert results == [[], [Version("1.0")]]
+
+
+def test_run_fetchers_records_requests() -> None:
+    def fetcher(url: ParseResult) -> list[Version]:
+        fetch(Request(url.geturl(), method="POST"))
+        return []
+
+    url = urlparse("https://git.example.com/foo/bar")
+    with (
+        unittest.mock.patch(
+            "nix_update.version.http.urlopen",
+            side_effect=lambda *_args, **_kwargs: BytesIO(b"[]"),
+        ),
+        record_requests() as stats,
+    ):
+        list(run_fetchers(url, [fetcher, fetcher], concurrent=True))
+    # The requests of the probe threads count towards the caller
+    assert stats.fetched == 2  # noqa: PLR2004
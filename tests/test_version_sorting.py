@@ -60,7 +60,7 @@ def test_highest_semver_wins_over_recent_release() -> None:
         ["v0.39.5", "v0.37.6", "v0.41.1", "v0.39.4", "v0.37.5", "v0.41.0"],
     )
     with unittest.mock.patch(
-        "nix_update.version.github.urllib.request.urlopen",
+        "nix_update.version.http.urlopen",
         _FakeUrlopen(feed),
     ):
         version = fetch_latest_version(
@@ -81,7 +81,7 @@ def test_highest_semver_without_version_regex() -> None:
         ["v0.39.5", "v0.41.1", "v0.37.6"],
     )
     with unittest.mock.patch(
-        "nix_update.version.github.urllib.request.urlopen",
+        "nix_update.version.http.urlopen",
         _FakeUrlopen(feed),
     ):
         version = fetch_latest_version(
@@ -102,7 +102,7 @@ def test_sorting_with_major_version_differences() -> None:
         ["v1.2.10", "v2.0.0", "v1.3.0", "v1.2.9"],
     )
     with unittest.mock.patch(
-        "nix_update.version.github.urllib.request.urlopen",
+        "nix_update.version.http.urlopen",
         _FakeUrlopen(feed),
     ):
         version = fetch_latest_version(
@@ -123,7 +123,7 @@ def test_postgis_scenario() -> None:
         ["3.5.4", "3.6.0", "3.5.3", "3.4.5"],
     )
     with unittest.mock.patch(
-        "nix_update.version.github.urllib.request.urlopen",
+        "nix_update.version.http.urlopen",
         _FakeUrlopen(feed),
     ):
         version = fetch_latest_version(